@@ -0,0 +1,186 @@
+"""
+Benchmark the cold start cost of each of Switchback's entry points - the context menu and the plugin's modes.
+
+Kodi starts a new Python interpreter for every context menu click and plugin run, so everything they import is paid for every time.
+Each mode is run in a fresh interpreter, under the fake Kodi runtime, with python -X importtime - and the import time of everything
+the entry point pulls in (the addon, its module dependencies, and any standard library modules not already loaded) is reported,
+along with whether the expensive, and often unnecessary, modules (infotagger, sqlite3...) were imported at all.
+
+Run from the addon root with, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.bench_imports --iterations 10 --output imports.json
+
+(The results have the same layout as benchmarks/run.py, with p50_ms etc. being the import time, so can be compared with benchmarks/compare.py)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks import runtime as benchmark_runtime
+
+# Mode -> (entry point script, its arguments)
+MODES = {
+        'context menu switchback':('context_menu.py', ['context_menu.py', 'switchback']),
+        'plugin switchback mode':('plugin.py', ['plugin://plugin.switchback/', '1', '?mode=switchback,resume']),
+        'plugin delete mode':('plugin.py', ['plugin://plugin.switchback/', '1', '?mode=delete&index=1']),
+        'plugin listing':('plugin.py', ['plugin://plugin.switchback/', '1', '']),
+}
+# Modules worth knowing about if a mode imports them
+WATCHED_MODULES = ['infotagger', 'sqlite3', 'resources.lib.store', 'resources.lib.playback']
+# Written to stderr just before the entry point is run, so only the imports it triggers are counted
+MARKER = '--- switchback entry point ---'
+
+
+def prepare_state(list_length: int, service_running: bool) -> str:
+    """
+    Set up a Switchback list, and the Home Window properties the service would have published, in the parent process -
+    and save that state to a file, for a child process to pick up
+
+    :return: the state file path
+    """
+    from kodi_runtime import RUNTIME
+    # (Imported here, not at the top, as bench_storage imports the addon's storage module - which would then already be loaded,
+    # and so not counted, in the child processes)
+    from benchmarks.bench_storage import make_playbacks
+    from resources.lib.store import Store
+
+    benchmark_runtime.reset(RUNTIME)
+    RUNTIME.addon_settings['maximum_list_length'] = list_length
+    benchmark_runtime.write_switchback_list(make_playbacks(list_length))
+    # As the service would, publish the snapshot etc.
+    Store()
+    RUNTIME.window_properties.pop('Switchback_Service_Heartbeat', None)
+    if service_running:
+        from resources.lib.service_state import beat
+        beat()
+    state_file = os.path.join(RUNTIME.profile, 'bench_imports_state.json')
+    with open(state_file, 'w', encoding='utf-8') as state:
+        json.dump({'profile':RUNTIME.profile, 'settings':RUNTIME.addon_settings, 'window_properties':RUNTIME.window_properties}, state)
+    return state_file
+
+
+def child(addons_path: str, state_file: str, mode: str) -> None:
+    """
+    (In the child process) Restore the state prepared by the parent, then run the mode's entry point, just as Kodi would
+    """
+    import runpy
+    kodi = benchmark_runtime.install(addons_path)
+    with open(state_file, encoding='utf-8') as state_file_handle:
+        state = json.load(state_file_handle)
+    kodi.profile = state['profile']
+    kodi.addon_settings.update(state['settings'])
+    kodi.window_properties.update(state['window_properties'])
+
+    script, argv = MODES[mode]
+    sys.argv = argv
+    sys.stderr.write(MARKER + '\n')
+    sys.stderr.flush()
+    start = time.perf_counter()
+    runpy.run_path(os.path.join(benchmark_runtime.ADDON_ROOT, script), run_name='__main__')
+    print(json.dumps({'run_ms':(time.perf_counter() - start) * 1000}))
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parse python -X importtime output, for the imports after the marker
+
+    :return: dict of module name -> (self time, cumulative time) in milliseconds, in import order
+    """
+    modules = {}
+    counting = False
+    for line in stderr.splitlines():
+        if line == MARKER:
+            counting = True
+            continue
+        if not counting or not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_time, cumulative_time = int(fields[0]), int(fields[1])
+        except ValueError:
+            # The header line
+            continue
+        # (Nested imports are indented by two spaces per level)
+        modules[fields[2][1:].rstrip()] = (self_time / 1000, cumulative_time / 1000)
+    return modules
+
+
+def run_mode(addons_path: str, state_file: str, mode: str) -> tuple:
+    """
+    Run a mode in a fresh interpreter
+
+    :return: tuple of (modules imported - see parse_importtime, time taken by the entry point in milliseconds)
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'benchmarks.bench_imports', '--child', mode, '--state', state_file,
+                              '--addons', addons_path], cwd=benchmark_runtime.ADDON_ROOT, capture_output=True, text=True)
+    if process.returncode:
+        raise RuntimeError(f"{mode} failed:\n{process.stderr[-2000:]}")
+    return parse_importtime(process.stderr), json.loads(process.stdout.strip().splitlines()[-1])['run_ms']
+
+
+def benchmark_mode(addons_path: str, mode: str, list_length: int, iterations: int, service_running: bool) -> dict:
+    import_times = []
+    run_times = []
+    modules = {}
+    for _ in range(iterations):
+        # (Re-prepared every time, as e.g. delete mode changes the list)
+        state_file = prepare_state(list_length, service_running)
+        modules, run_ms = run_mode(addons_path, state_file, mode)
+        import_times.append(sum(self_time for self_time, _ in modules.values()))
+        run_times.append(run_ms)
+
+    import_times.sort()
+    top_level = [(name, cumulative_time) for name, (_, cumulative_time) in modules.items() if not name.startswith(' ')]
+    return {
+            'benchmark':'cold start imports',
+            'mode':mode,
+            'list_length':list_length,
+            'service_running':service_running,
+            'iterations':iterations,
+            'mean_ms':statistics.mean(import_times),
+            'p50_ms':statistics.median(import_times),
+            'p95_ms':import_times[min(len(import_times) - 1, int(len(import_times) * 0.95))],
+            'min_ms':import_times[0],
+            'run_p50_ms':statistics.median(run_times),
+            'modules_imported':len(modules),
+            **{f'imports_{module.replace(".", "_")}':any(name.strip() == module for name in modules) for module in WATCHED_MODULES},
+            'heaviest_imports':[name.strip() for name, _ in sorted(top_level, key=lambda item:item[1], reverse=True)[:5]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cold start (import) cost of Switchback's context menu and plugin modes")
+    parser.add_argument('--addons', help="Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)")
+    parser.add_argument('--list-length', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--output', help="write the results to this JSON file (default: print them)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--state', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    addons_path = arguments.addons or os.environ.get('KODI_ADDONS_PATH')
+
+    if arguments.child:
+        child(addons_path, arguments.state, arguments.child)
+        return
+
+    kodi = benchmark_runtime.install(addons_path)
+    kodi.profile = tempfile.mkdtemp(prefix='switchback_bench_imports_')
+    results = []
+    for mode in MODES:
+        for service_running in [True, False]:
+            results.append(benchmark_mode(addons_path, mode, arguments.list_length, arguments.iterations, service_running))
+
+    output = json.dumps({'python':sys.version.split()[0], 'results':results}, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark the Switchback list storage backends (JSON and SQLite): time per load and save, and bytes/rows written per save, for lists of various lengths.
+
+Run from the addon root with:
+    python -m benchmarks.bench_storage [--output results.json]
+"""
+import os
+import ast
+import json
+import time
+import argparse
+import tempfile
+import statistics
+
+from resources.lib.storage import JsonStorage, SqliteStorage
+
+LIST_LENGTHS = [5, 20, 1000, 50000]
+SAVES_PER_LENGTH = 50
+# (The default page size of the plugin listing)
+PAGE_SIZE = 20
+
+
+def playback_fields() -> list:
+    """
+    The Playback fields, in Playback.__slots__ order - read from playback.py's source, as playback.py needs Kodi, so can't be imported here
+    """
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources', 'lib', 'playback.py'),
+              encoding='utf-8') as source:
+        tree = ast.parse(source.read())
+    playback = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'Playback')
+    slots = next(node.value for node in playback.body
+                 if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == '__slots__' for target in node.targets))
+    return list(ast.literal_eval(slots))
+
+
+FIELDS = playback_fields()
+
+
+def make_playbacks(count: int) -> list:
+    """
+    Make a list of realistic-looking Playback dicts (a mix of library episodes, movies, and addon videos), most recent first
+    """
+    playbacks = []
+    for index in range(count):
+        kind = index % 3
+        playback = dict.fromkeys(FIELDS)
+        if kind == 0:
+            playback.update(file=f"smb://nas/tv/Show {index}/Season 1/S01E{index % 20:02d}.mkv", type="episode", source="kodi_library",
+                            dbid=1000 + index, tvshowdbid=index, totalseasons=3, title=f"Episode {index}", showtitle=f"Show {index}",
+                            season=1, episode=index % 20, poster=f"smb://nas/tv/Show {index}/poster.jpg",
+                            fanart=f"smb://nas/tv/Show {index}/fanart.jpg", year=2020)
+        elif kind == 1:
+            playback.update(file=f"smb://nas/movies/Movie {index} (2019).mkv", type="movie", source="kodi_library", dbid=5000 + index,
+                            title=f"Movie {index}", poster=f"smb://nas/movies/Movie {index} (2019)-poster.jpg", year=2019)
+        else:
+            playback.update(file=f"https://cdn.example.com/stream/{index}.m3u8?token=abcdef0123456789", type="video", source="addon",
+                            title=f"Addon video {index}", thumbnail=f"https://img.example.com/{index}.jpg")
+        playback['path'] = playback['file']
+        playback['label'] = playback['title']
+        playback['resumetime'] = 600 + index
+        playback['totaltime'] = playback['duration'] = 2700
+        playbacks.append(playback)
+    return playbacks
+
+
+def pretty_printed_size(playbacks: list) -> int:
+    """
+    Size of the original (version 1) format - a pretty-printed array including all None fields - for comparison
+    """
+    return len(json.dumps(playbacks, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+def run(list_lengths=None) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for length in list_lengths or LIST_LENGTHS:
+            playbacks = make_playbacks(length)
+            for backend, extension in [(JsonStorage, 'json'), (SqliteStorage, 'db')]:
+                rows = [[playback[field] for field in FIELDS] for playback in playbacks]
+                resumetime = FIELDS.index('resumetime')
+                file = os.path.join(directory, f"switchback_{length}.{extension}")
+                storage = backend(file, FIELDS)
+                storage.save(rows, force=True)
+
+                start = time.perf_counter()
+                rows, _ = backend(file, FIELDS).load()
+                load_time = time.perf_counter() - start
+                # Just the first page of the list (as the plugin listing reads it)
+                start = time.perf_counter()
+                backend(file, FIELDS).load_page(0, PAGE_SIZE)
+                page_load_time = time.perf_counter() - start
+                storage.load()
+                writes_before = storage.writes
+                rows_written_before = getattr(storage, 'rows_written', 0)
+
+                timings = []
+                for save in range(SAVES_PER_LENGTH):
+                    # Simulate a playback finishing - an item from further down the list is played again, so it moves to the front
+                    # with a new resume point - so every save has changed content
+                    row = list(rows.pop(min(5, len(rows) - 1)))
+                    row[resumetime] += 1
+                    rows.insert(0, row)
+                    start = time.perf_counter()
+                    # (As PlaybackList.save_to_file does - only the row that has changed (and moved) is given as changed)
+                    storage.save(rows, changed=[0])
+                    timings.append(time.perf_counter() - start)
+
+                # ...and an unchanged list, which dirty tracking should skip
+                start = time.perf_counter()
+                written = storage.save(rows)
+                unchanged_time = time.perf_counter() - start
+
+                result = {
+                        'benchmark':'storage.save',
+                        'backend':backend.__name__,
+                        'list_length':length,
+                        'saves':SAVES_PER_LENGTH,
+                        'load_ms':load_time * 1000,
+                        'page_load_ms':page_load_time * 1000,
+                        'mean_ms':statistics.mean(timings) * 1000,
+                        'median_ms':statistics.median(timings) * 1000,
+                        'unchanged_save_written':written,
+                        'unchanged_save_ms':unchanged_time * 1000,
+                        'file_bytes':os.path.getsize(file),
+                }
+                if backend is JsonStorage:
+                    result['bytes_per_save'] = storage.bytes_written // storage.writes
+                    result['v1_bytes_per_save'] = pretty_printed_size(playbacks)
+                else:
+                    result['rows_written_per_save'] = (storage.rows_written - rows_written_before) / max(storage.writes - writes_before, 1)
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Switchback list storage")
+    parser.add_argument('--sizes', help=f"comma separated list lengths to benchmark (default: {','.join(str(length) for length in LIST_LENGTHS)})")
+    parser.add_argument('--output', help="write the results to this JSON file (default: print them)")
+    arguments = parser.parse_args()
+    results = run([int(size) for size in arguments.sizes.split(',')] if arguments.sizes else None)
+    output = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,731 @@
+"""
+Check the behaviour of the Switchback hot paths under the fake Kodi runtime - not how long they take (see run.py), but the Kodi calls
+they make, and what they do with the answers:
+- library: bringing the list up to date with the Kodi library takes one JSON-RPC round trip, however many library items there are,
+  and watched, out of date, and removed library items are all handled correctly
+- switchback_mode: a Switchback (the plugin's switchback mode, and the context menu item) decodes only the two Playbacks it needs,
+  however long the list is
+- listing: the plugin listing reads just the page it displays from the list file, however long the list is - unless checking
+  the page against the Kodi library changes it, when the whole list is loaded, and saved
+- library_stamps: with the service running, the plugin listing asks Kodi about no library items at all - the service checks them
+  at startup and after each library scan, and saves when it did
+- transaction: a bulk edit that fails part way through leaves the list just as it was - its entries, their order, and their fields
+- properties: the context menu and skin widget properties are published by writing only those that have changed
+- edit_routing: with the service running, edits of items given only by path are sent to it without loading the list, and items
+  given by path and index are found (by index) in the loaded list
+- reachability: files missing from a share that answers, and entries of uninstalled addons, are pruned from the list (if the
+  user wants), but the entries on a share that is offline are only marked as unavailable
+- shutdown: the service stops within its shutdown deadline, however slow its workers are to stop - having first written the resume
+  point of the current playback to the checkpoint journal
+- artwork: remote artwork is fetched into Kodi's texture cache once (via a local HTTP stand-in for Kodi's webserver), and removed
+  from it again when it falls off the list - but only if it was fetched there by Switchback (this session or a previous one), so
+  textures that were already cached, and Kodi library artwork, are left alone
+
+Run from the addon root with, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.checks
+
+(The exit code is non-zero if any check fails.)
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlencode
+
+from benchmarks import runtime as benchmark_runtime
+from benchmarks.bench_storage import make_playbacks
+
+# name -> check function, run in this order (see check)
+CHECKS = {}
+
+
+def check(function):
+    """
+    Register a check - a function of the fake Kodi runtime, returning a dict of named results (all True if the check passed)
+    """
+    CHECKS[function.__name__[len('check_'):]] = function
+    return function
+
+
+def playback(file: str, **details) -> dict:
+    """
+    A Playback dict, as stored in the Switchback list
+    """
+    return {'file':file, 'path':file, 'label':file.rsplit('/', 1)[-1], 'totaltime':2700.0, **details}
+
+
+def start_service() -> threading.Thread:
+    """
+    Run the service (switchback_service.run) on a thread, as Kodi does, and wait for it to start up
+
+    :return: the service's thread - to stop the service, request an abort, and join it
+    """
+    from resources.lib import switchback_service
+    from resources.lib.store import Store
+
+    Store.kodi_player = Store.kodi_event_monitor = Store.current_playback = None
+    service = threading.Thread(target=switchback_service.run, name="Switchback service (check)", daemon=True)
+    service.start()
+    deadline = time.monotonic() + 10
+    while not (Store.kodi_player and Store.kodi_event_monitor):
+        if time.monotonic() > deadline:
+            raise RuntimeError("The service did not start")
+        time.sleep(0.001)
+    return service
+
+
+@check
+def check_library(kodi) -> dict:
+    """
+    The Switchback list is checked against the Kodi library in a single JSON-RPC batch (see get_library_details)
+    """
+    from resources.lib.playback import PlaybackList
+
+    # dbid -> (playcount, resume position) in the Kodi library - 13 has since been removed from the library, so is not here
+    library = {11:(0, 250.0), 12:(1, 0.0), 14:(0, 300.0)}
+
+    def library_details(method):
+        result_key, id_key = benchmark_runtime.LIBRARY_TYPES[method]
+
+        def details(params):
+            # (A KeyError is a JSON-RPC error, as Kodi gives for an item not in the library)
+            playcount, position = library[params[id_key]]
+            return {result_key:{id_key:params[id_key], 'playcount':playcount, 'resume':{'position':position, 'total':2700.0}}}
+
+        return details
+
+    for method in benchmark_runtime.LIBRARY_TYPES:
+        kodi.jsonrpc_handlers[method] = library_details(method)
+
+    file = benchmark_runtime.write_switchback_list([
+            playback("smb://nas/movies/Out of date.mkv", type="movie", source="kodi_library", dbid=11, resumetime=100.0),
+            playback("smb://nas/tv/Watched.mkv", type="episode", source="kodi_library", dbid=12, resumetime=100.0),
+            playback("smb://nas/tv/Removed.mkv", type="episode", source="kodi_library", dbid=13, resumetime=100.0),
+            playback("smb://nas/movies/Up to date.mkv", type="movie", source="kodi_library", dbid=14, resumetime=300.0),
+            playback("https://cdn.example.com/watched.m3u8", type="video", source="addon", resumetime=2600.0),
+            playback("https://cdn.example.com/started.m3u8", type="video", source="addon", resumetime=100.0),
+    ])
+
+    before = time.time()
+    kodi.reset_counters()
+    switchback = PlaybackList([], file, remove_watched_playbacks=True)
+    switchback.load_or_init()
+    load_calls, load_requests = kodi.jsonrpc_calls, kodi.jsonrpc_requests
+    resume_points = {playback.file.rsplit('/', 1)[-1]:playback.resumetime for playback in switchback}
+
+    # Loaded again (as the plugin does) - the changes were saved
+    saved = PlaybackList([], file, remove_watched_playbacks=True)
+    saved.load_or_init(library_changed=before)
+    saved_resume_points = {playback.file.rsplit('/', 1)[-1]:playback.resumetime for playback in saved}
+
+    # The library hasn't changed since the list was last checked - only the item that couldn't be checked is checked again
+    kodi.reset_counters()
+    switchback.check_library(library_changed=before)
+    recheck_calls, recheck_requests = kodi.jsonrpc_calls, kodi.jsonrpc_requests
+
+    checks = {
+            # One round trip, with a request for each of the four library items
+            'one_round_trip':load_calls == 1,
+            'one_request_per_library_item':load_requests == 4,
+            'watched_removed':'Watched.mkv' not in resume_points and 'watched.m3u8' not in resume_points,
+            'resume_point_updated':resume_points.get('Out of date.mkv') == 250.0,
+            'removed_from_library_kept':resume_points.get('Removed.mkv') == 100.0,
+            'others_kept':resume_points.get('Up to date.mkv') == 300.0 and resume_points.get('started.m3u8') == 100.0,
+            'changes_saved':saved_resume_points == resume_points,
+            'only_unchecked_rechecked':recheck_calls == 1 and recheck_requests == 1,
+    }
+    checks['ok'] = all(checks.values())
+    checks['jsonrpc'] = {'load_calls':load_calls, 'load_requests':load_requests, 'recheck_calls':recheck_calls,
+                         'recheck_requests':recheck_requests}
+    checks['resume_points'] = resume_points
+    return checks
+
+
+@check
+def check_switchback_mode(kodi) -> dict:
+    """
+    Switchback mode only decodes list[0] and list[1], whatever the length of the list (see PlaybackList.head)
+    """
+    from bossanova808.constants import HOME_WINDOW
+    from resources.lib import switchback_plugin
+    from resources.lib.playback import PlaybackList
+    from resources.lib.service_state import beat, HEARTBEAT_PROPERTY
+    from resources.lib.store import Store, SNAPSHOT_PROPERTY
+
+    playbacks = make_playbacks(200)
+    # The library agrees with the list, so checking the list against it changes (and so decodes) nothing
+    resume_points = {playback['dbid']:playback['resumetime'] for playback in playbacks if playback['dbid']}
+
+    def library_details(method):
+        result_key, id_key = benchmark_runtime.LIBRARY_TYPES[method]
+        return lambda params:{result_key:{id_key:params[id_key], 'playcount':0,
+                                          'resume':{'position':resume_points[params[id_key]], 'total':2700.0}}}
+
+    for method in benchmark_runtime.LIBRARY_TYPES:
+        kodi.jsonrpc_handlers[method] = library_details(method)
+    file = benchmark_runtime.write_switchback_list(playbacks)
+
+    def switchback() -> bool:
+        # :return: True if the Switchback was to the second playback in the list
+        kodi.reset_counters()
+        sys.argv = ['plugin://plugin.switchback/', '1', '?mode=switchback,resume']
+        switchback_plugin.run()
+        return [listitem.getPath() for _, listitem in kodi.resolved] == [playbacks[1]['path']]
+
+    # With the service running, but no snapshot - the plugin loads the list from the file (and only decodes what it plays)
+    HOME_WINDOW.clearProperty(SNAPSHOT_PROPERTY)
+    beat()
+    loaded_switchback = switchback()
+    loaded_decoded = Store.switchback.decoded
+    HOME_WINDOW.clearProperty(HEARTBEAT_PROPERTY)
+
+    # With a current snapshot - the two Playbacks come from the snapshot, so nothing is decoded
+    Store()
+    snapshot_switchback = switchback()
+    snapshot_decoded = Store.switchback.decoded
+
+    # The context menu item (with no skin widgets to publish as well)
+    Store.widget_length = 0
+    Store.switchback = PlaybackList([], file, Store.remove_watched_playbacks)
+    Store.switchback.load_or_init(window=(0, 0))
+    Store.update_switchback_context_menu()
+    context_menu_decoded = Store.switchback.decoded
+    context_menu_item = HOME_WINDOW.getProperty('Switchback_Item') == Store.switchback[1].pluginlabel
+
+    checks = {
+            'loaded_switchback_to_second':loaded_switchback,
+            'loaded_decodes_at_most_two':loaded_decoded <= 2,
+            'snapshot_switchback_to_second':snapshot_switchback,
+            'snapshot_decodes_none':snapshot_decoded == 0,
+            'context_menu_item_is_second':context_menu_item,
+            'context_menu_decodes_two':context_menu_decoded == 2,
+    }
+    checks['ok'] = all(checks.values())
+    checks['decoded'] = {'loaded':loaded_decoded, 'snapshot':snapshot_decoded, 'context_menu':context_menu_decoded,
+                         'list_length':len(playbacks)}
+    return checks
+
+
+@check
+def check_listing(kodi) -> dict:
+    """
+    The plugin listing loads just the page being displayed (see PlaybackList.load_page)
+    """
+    from resources.lib import switchback_plugin
+    from resources.lib.playback import PlaybackList
+    from resources.lib.store import Store
+
+    kodi.addon_settings['maximum_list_length'] = 200
+    playbacks = make_playbacks(200)
+    # The library agrees with the list - apart from the last library item on page 4, which has since been watched
+    resume_points = {playback['dbid']:playback['resumetime'] for playback in playbacks if playback['dbid']}
+    watched = max(playback['dbid'] for playback in playbacks[60:80] if playback['dbid'])
+
+    def library_details(method):
+        result_key, id_key = benchmark_runtime.LIBRARY_TYPES[method]
+        return lambda params:{result_key:{id_key:params[id_key], 'playcount':1 if params[id_key] == watched else 0,
+                                          'resume':{'position':resume_points[params[id_key]], 'total':2700.0}}}
+
+    for method in benchmark_runtime.LIBRARY_TYPES:
+        kodi.jsonrpc_handlers[method] = library_details(method)
+    file = benchmark_runtime.write_switchback_list(playbacks)
+
+    def listing(page: int) -> list:
+        # :return: the paths of the playbacks listed
+        kodi.reset_counters()
+        sys.argv = ['plugin://plugin.switchback/', '1', f'?page={page}']
+        switchback_plugin.run()
+        return [listitem.getProperty('Switchback') for _, listitem, is_folder in kodi.directory_items if not is_folder]
+
+    page_2 = listing(1)
+    page_2_loaded = len(Store.switchback)
+    page_2_total = Store.switchback.total
+    # The watched item is removed - so the whole list is loaded, to save it
+    page_4 = listing(3)
+    page_4_loaded = len(Store.switchback)
+    saved = PlaybackList([], file)
+    saved.load_or_init(window=(0, 0))
+
+    checks = {
+            'page_listed':page_2 == [playback['path'] for playback in playbacks[20:40]],
+            'page_only_loaded':page_2_loaded == 20,
+            'whole_list_length_known':page_2_total == 200,
+            'watched_not_listed':page_4 == [playback['path'] for playback in playbacks[60:81] if playback['dbid'] != watched],
+            'watched_whole_list_loaded':page_4_loaded == 199,
+            'watched_removed_and_saved':len(saved) == 199 and all(playback.dbid != watched for playback in saved),
+    }
+    checks['ok'] = all(checks.values())
+    return checks
+
+
+@check
+def check_library_stamps(kodi) -> dict:
+    """
+    With the service running, the plugin listing doesn't check the list against the Kodi library at all - the service has already
+    checked it, and saved when it did (see Store.check_library), when it started up, and again after a library scan
+    """
+    from resources.lib import switchback_plugin
+    from resources.lib.store import Store
+
+    kodi.addon_settings['maximum_list_length'] = 40
+    playbacks = make_playbacks(40)
+    # The library agrees with the list - so checking it changes nothing, and nothing but the entries' check stamps needs saving
+    resume_points = {playback['dbid']:playback['resumetime'] for playback in playbacks if playback['dbid']}
+    # The names of the threads that asked Kodi about each library item - the plugin runs on this one, the service's startup on its own
+    # thread, and its event handling on the event worker.  (The reachability scan asks about library items too, on yet another thread)
+    library_calls = []
+
+    def library_details(method):
+        result_key, id_key = benchmark_runtime.LIBRARY_TYPES[method]
+
+        def details(params):
+            library_calls.append(threading.current_thread().name)
+            return {result_key:{id_key:params[id_key], 'playcount':0, 'resume':{'position':resume_points[params[id_key]], 'total':2700.0}}}
+
+        return details
+
+    for method in benchmark_runtime.LIBRARY_TYPES:
+        kodi.jsonrpc_handlers[method] = library_details(method)
+    benchmark_runtime.write_switchback_list(playbacks)
+
+    def library_items_checked(thread_name: str) -> int:
+        checked = library_calls.count(thread_name)
+        library_calls.clear()
+        return checked
+
+    def listing() -> int:
+        # :return: the number of library items the listing asked Kodi about
+        # (The plugin and the service share the Store here, unlike in Kodi - so the service gets its own list back afterwards)
+        service_list = Store.switchback
+        library_calls.clear()
+        sys.argv = ['plugin://plugin.switchback/', '1', '?page=0']
+        try:
+            switchback_plugin.run()
+        finally:
+            Store.switchback = service_list
+        return library_items_checked(threading.current_thread().name)
+
+    try:
+        service = start_service()
+        started_up_checked = library_items_checked(service.name)
+        first_listing = listing()
+        second_listing = listing()
+        library_calls.clear()
+        Store.kodi_event_monitor.onNotification('xbmc', 'VideoLibrary.OnScanFinished', '{}')
+        Store.events.wait_idle(5)
+        scan_checked = library_items_checked("Switchback service events")
+        after_scan_listing = listing()
+    finally:
+        kodi.abort_requested = True
+        service.join(10)
+
+    checks = {
+            'service_checks_at_startup':started_up_checked > 0,
+            'first_listing_checks_nothing':first_listing == 0,
+            'second_listing_checks_nothing':second_listing == 0,
+            'service_checks_after_scan':scan_checked == started_up_checked,
+            'listing_after_scan_checks_nothing':after_scan_listing == 0,
+    }
+    checks['ok'] = all(checks.values())
+    checks['library_items_checked'] = {'startup':started_up_checked, 'listings':[first_listing, second_listing, after_scan_listing],
+                                       'scan':scan_checked}
+    return checks
+
+
+@check
+def check_transaction(kodi) -> dict:
+    """
+    A failed PlaybackList.transaction rolls back everything changed in it - including fields changed in place (see _set_field),
+    of both undecoded and decoded entries - and saves nothing, not even the changes of a transaction within it that succeeded
+    """
+    from resources.lib.playback import PlaybackList
+
+    def load() -> PlaybackList:
+        loaded = PlaybackList([], file)
+        loaded.load_or_init(window=(0, 0))
+        return loaded
+
+    file = benchmark_runtime.write_switchback_list(make_playbacks(6))
+    before = [playback.to_row() for playback in load()]
+    switchback = load()
+    # (One entry decoded, the rest still rows)
+    decoded = switchback[2]
+    writes = switchback.storage.writes
+    tokens = list(switchback._entries)
+
+    try:
+        with switchback.transaction():
+            with switchback.transaction():
+                switchback._set_field(tokens[0], 'resumetime', 1.0)
+            nested_saved = switchback.storage.writes != writes
+            switchback._set_field(tokens[2], 'resumetime', 2.0)
+            switchback._set_field(tokens[4], 'checked', 3.0)
+            switchback.apply_edit({'command':'move', 'path':switchback[5].path})
+            switchback.apply_edit({'command':'remove', 'paths':[switchback[1].path]})
+            switchback.apply_edit({'command':'unknown'})
+    except ValueError:
+        pass
+    after = [playback.to_row() for playback in switchback.list]
+    # ...and saved just as it was, too
+    switchback.save_to_file()
+    reloaded = [playback.to_row() for playback in load()]
+
+    checks = {
+            'rolled_back':after == before,
+            'decoded_entry_rolled_back':decoded.to_row() == before[2] and switchback[2] is decoded,
+            'nested_not_saved':not nested_saved,
+            'nothing_saved':switchback.storage.writes == writes,
+            'saved_unchanged':reloaded == before,
+    }
+    checks['ok'] = all(checks.values())
+    return checks
+
+
+@check
+def check_properties(kodi) -> dict:
+    """
+    Store.update_switchback_context_menu writes only the Home Window properties whose values have changed (see publish_properties)
+    """
+    from bossanova808.constants import HOME_WINDOW
+    from resources.lib.store import Store
+
+    kodi.addon_settings['widget_length'] = 3
+    benchmark_runtime.write_switchback_list(make_playbacks(6))
+    Store()
+
+    def home_window_properties() -> dict:
+        # (The Home Window is window 10000 - the fake Kodi keeps property names in lower case, as Kodi does)
+        return dict(kodi.window_properties.get(10000, {}))
+
+    def update() -> dict:
+        # :return: the properties written (by the number returned, by the window writes counted, and as actually changed)
+        before = home_window_properties()
+        kodi.reset_counters()
+        writes = Store.update_switchback_context_menu()
+        after = home_window_properties()
+        changed = {name for name in before.keys() | after.keys() if before.get(name) != after.get(name)}
+        return {'writes':writes, 'window_writes':kodi.property_writes, 'changed':len(changed), 'changed_names':sorted(changed)}
+
+    # From scratch - only the properties with values are written (the empty widget slots are not cleared again)
+    for name in list(home_window_properties()):
+        if name.startswith('switchback'):
+            HOME_WINDOW.clearProperty(name)
+    first = update()
+    unchanged = update()
+    # The top playback's resume point moves on - just its progress changes
+    Store.switchback[0].resumetime += 60
+    progress = update()
+    # A playback from further down the list is played again, so moves to the top - the published slots all shift down one
+    Store.switchback.move_to_front(Store.switchback[3])
+    moved = update()
+    # Fewer widget slots - the slots no longer published are cleared
+    Store.widget_length = 1
+    shorter = update()
+
+    updates = {'first':first, 'unchanged':unchanged, 'progress':progress, 'moved':moved, 'shorter':shorter}
+    checks = {f'{name}_writes_only_changed':result['writes'] == result['window_writes'] == result['changed'] for name, result in updates.items()}
+    checks.update({
+            # Count, the set properties of the three published playbacks (label, path, progress, and the episode's poster & fanart,
+            # the movie's poster, the addon video's thumb), and the two context menu properties
+            'first_writes_all':first['writes'] == 1 + (5 + 4 + 4) + 2,
+            'unchanged_writes_none':unchanged['writes'] == 0,
+            'progress_writes_one':progress['changed_names'] == ['switchback.1.progress'],
+            'moved_writes_some':0 < moved['writes'] < first['writes'],
+            'shorter_clears_slots':home_window_properties().get('switchback.count') == '1'
+                                   and not any(name.startswith(('switchback.2.', 'switchback.3.')) for name in home_window_properties()),
+    })
+    checks['ok'] = all(checks.values())
+    checks['writes'] = {name:result['writes'] for name, result in updates.items()}
+    return checks
+
+
+@check
+def check_edit_routing(kodi) -> dict:
+    """
+    With the service running, the plugin sends its edits to the service (see request_edit) - loading the list only if it needs it,
+    to find the items given by index
+    """
+    from resources.lib import switchback_plugin
+    from resources.lib.service_state import beat
+    from resources.lib.store import Store
+
+    playbacks = make_playbacks(5)
+    benchmark_runtime.write_switchback_list(playbacks)
+    edits = []
+
+    def notify_all(params):
+        edits.append(params['data'])
+        return 'OK'
+
+    kodi.jsonrpc_handlers['JSONRPC.NotifyAll'] = notify_all
+    beat()
+
+    def edit(arguments: str):
+        # :return: the edit sent to the service, and whether the list was loaded to send it
+        Store.switchback = None
+        edits.clear()
+        sys.argv = ['plugin://plugin.switchback/', '1', f'?{arguments}']
+        switchback_plugin.run()
+        return (edits[0] if len(edits) == 1 else None), Store.switchback is not None
+
+    by_path, by_path_loaded = edit(urlencode({'mode':'delete', 'path':playbacks[0]['path']}))
+    by_path_and_index, by_path_and_index_loaded = edit(urlencode({'mode':'delete', 'path':playbacks[0]['path'], 'index':'2,3'}))
+    by_index, by_index_loaded = edit(urlencode({'mode':'move', 'index':'4'}))
+
+    checks = {
+            'path_sent':by_path == {'command':'remove', 'paths':[playbacks[0]['path']]},
+            'path_loads_nothing':not by_path_loaded,
+            'path_and_index_sent':by_path_and_index == {'command':'remove', 'paths':[playbacks[index]['path'] for index in (0, 2, 3)]},
+            'path_and_index_loads_list':by_path_and_index_loaded,
+            'index_sent':by_index == {'command':'move', 'path':playbacks[4]['path']},
+            'index_loads_list':by_index_loaded,
+    }
+    checks['ok'] = all(checks.values())
+    return checks
+
+
+@check
+def check_reachability(kodi) -> dict:
+    """
+    ReachabilityScanner only finds entries MISSING if their share answers - an offline share answers 'not there' for every file,
+    so its entries are TIMED_OUT (unknown), and never pruned (see Store.reachability_scanned)
+    """
+    from resources.lib.reachability import ReachabilityScanner, MISSING, REACHABLE, TIMED_OUT
+    from resources.lib.store import Store
+
+    kodi.addon_settings['prune_unreachable'] = True
+    playbacks = [
+            playback("smb://nas/tv/Deleted.mkv", source="file"),
+            playback("smb://nas/tv/Still here.mkv", source="file"),
+            # (The NAS is powered off - so every check of it answers 'not there', straight away)
+            playback("smb://offline/movies/Movie.mkv", source="file"),
+            playback("smb://offline/movies/Another movie.mkv", source="file"),
+            # (Plugin URLs with no path after the addon id - which is still their addon id)
+            playback("plugin://plugin.video.example?action=play&id=1", source="addon"),
+            playback("plugin://plugin.video.example", source="addon"),
+            playback("plugin://plugin.video.uninstalled/play/1", source="addon"),
+    ]
+    kodi.conditions['System.AddonIsEnabled(plugin.video.example)'] = True
+    benchmark_runtime.write_switchback_list(playbacks)
+    kodi.vfs_files = {"smb://nas/tv/Still here.mkv"}
+    Store()
+
+    done = threading.Event()
+    results = {}
+    Store.reachability = ReachabilityScanner(timeout=5)
+    Store.reachability.scan(Store.switchback.fields('path', 'file', 'source', 'type', 'dbid', 'channelid'),
+                            on_scanned=lambda scanned:(results.update(scanned), done.set()))
+    done.wait(10)
+    Store.reachability_scanned(results)
+    remaining = [path for path, in Store.switchback.fields('path')]
+    Store.reachability.stop()
+    Store.reachability = None
+
+    checks = {
+            'missing_file_missing':results.get("smb://nas/tv/Deleted.mkv") == MISSING,
+            'present_file_reachable':results.get("smb://nas/tv/Still here.mkv") == REACHABLE,
+            'offline_share_not_missing':all(results.get(playback['path']) == TIMED_OUT for playback in playbacks[2:4]),
+            'enabled_addons_reachable':all(results.get(playback['path']) == REACHABLE for playback in playbacks[4:6]),
+            'uninstalled_addon_missing':results.get(playbacks[6]['path']) == MISSING,
+            'only_missing_pruned':remaining == [playback['path'] for playback in playbacks[1:6]],
+    }
+    checks['ok'] = all(checks.values())
+    checks['results'] = results
+    return checks
+
+
+@check
+def check_shutdown(kodi) -> dict:
+    """
+    The service's shutdown waits share one deadline (see switchback_service.SHUTDOWN_TIMEOUT), and the list and the current playback's
+    resume point are flushed to disk before any of them
+    """
+    from resources.lib import switchback_service
+    from resources.lib.playback import Playback
+    from resources.lib.store import Store
+
+    class SlowToEnrich:
+        # (A playback whose enrichment is still going when the service stops)
+        def enrich_playback_details(self, item, gui):
+            time.sleep(3)
+
+    def start_playback():
+        Store.current_playback = Playback(**playback("smb://nas/movies/Playing.mkv", source="file", resumetime=100.0))
+        Store.journal.start(Store.current_playback)
+        # (Only just checkpointed, so this resume point is not written to the journal by the journal's own checkpoints)
+        Store.current_playback.resumetime = 1234.0
+        Store.journal.checkpoint(Store.current_playback)
+        Store.kodi_player.enricher.submit(SlowToEnrich(), None, {})
+
+    benchmark_runtime.write_switchback_list(make_playbacks(6))
+    shutdown_timeout = switchback_service.SHUTDOWN_TIMEOUT
+    switchback_service.SHUTDOWN_TIMEOUT = 1
+    try:
+        service = start_service()
+        Store.post_event('playback started', start_playback)
+        Store.events.wait_idle(5)
+        kodi.abort_requested = True
+        stopping = time.monotonic()
+        service.join(10)
+        stop_s = time.monotonic() - stopping
+    finally:
+        switchback_service.SHUTDOWN_TIMEOUT = shutdown_timeout
+    journal = Store.journal.replay()
+    Store.current_playback = None
+
+    checks = {
+            'stopped':not service.is_alive(),
+            # (The enricher alone would have held it up for 3s)
+            'stopped_within_deadline':stop_s < 2,
+            'resume_point_flushed':bool(journal) and journal[-1].get('resumetime') == 1234,
+    }
+    checks['ok'] = all(checks.values())
+    checks['stop_s'] = stop_s
+    return checks
+
+
+@check
+def check_artwork(kodi) -> dict:
+    """
+    ArtworkCache warms Kodi's texture cache by fetching each remote artwork url through the webserver once, and evicts it again
+    (via Textures.RemoveTexture) when no playback left on the list uses it - if it fetched it, and only then
+    """
+    import os
+    from resources.lib.artwork import ArtworkCache
+
+    # The stand-in for Kodi's webserver and texture cache: url -> texture id, for each image fetched through /image/ - plus
+    # two textures already cached (e.g. when Kodi scraped the library, or displayed an addon's listing)
+    textures = {"https://img.example.com/library.jpg":101, "https://img.example.com/cached.jpg":102}
+    fetched = []
+    removed = []
+    lock = threading.Lock()
+
+    class ImageHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            # /image/<quoted image://<quoted url>/>
+            url = unquote(unquote(self.path[len('/image/'):])[len('image://'):].rstrip('/'))
+            with lock:
+                fetched.append(url)
+                textures.setdefault(url, len(textures) + 1)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', '8')
+            self.end_headers()
+            self.wfile.write(b'\x89PNG\r\n\x1a\n')
+
+        def log_message(self, *args):
+            pass
+
+    def get_textures(params):
+        url = params['filter']['value']
+        with lock:
+            return {'textures':[{'textureid':textures[url], 'url':url}] if url in textures else []}
+
+    def remove_texture(params):
+        with lock:
+            removed.append(params['textureid'])
+            for url, texture_id in list(textures.items()):
+                if texture_id == params['textureid']:
+                    del textures[url]
+        return 'OK'
+
+    kodi.jsonrpc_handlers['Textures.GetTextures'] = get_textures
+    kodi.jsonrpc_handlers['Textures.RemoveTexture'] = remove_texture
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, name="Artwork stand-in", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def drain(cache):
+        # (One worker, so once this no-op has run, everything queued before it has been done)
+        cache._executor.submit(lambda:None).result(timeout=10)
+
+    # (source, thumbnail, poster, fanart, icon) - a remote thumb, a poster wrapped as Kodi image:// url, and local fanart (left to Kodi)
+    show = ("addon", "https://img.example.com/show.jpg", "image://https%3a%2f%2fimg.example.com%2fposter.jpg/", "smb://nas/tv/fanart.jpg", None)
+    # ...another playback, sharing the poster
+    movie = ("file", "https://img.example.com/movie.jpg", "https://img.example.com/poster.jpg", None, None)
+    # ...a library entry, with scraped (remote) artwork, and an addon entry whose artwork was already cached
+    library = ("kodi_library", "https://img.example.com/library.jpg", None, None, None)
+    cached = ("addon", "https://img.example.com/cached.jpg", None, None, None)
+    file = os.path.join(kodi.profile, "switchback_artwork.json")
+    if os.path.exists(file):
+        os.remove(file)
+    try:
+        cache = ArtworkCache(file, max_workers=1, base_url=base_url, timeout=5)
+        cache.warm([show, movie, library, cached])
+        drain(cache)
+        warmed = list(fetched)
+        # Warmed again (e.g. the next playback recorded) - nothing is fetched again
+        cache.warm([show, movie])
+        drain(cache)
+        rewarmed = len(fetched) - len(warmed)
+        cache.stop()
+        cache.save()
+        # A new session - the artwork is already in the texture cache, so is not fetched again either...
+        new_session = ArtworkCache(file, max_workers=1, base_url=base_url, timeout=5)
+        new_session.warm([show])
+        drain(new_session)
+        new_session_fetched = len(fetched) - len(warmed)
+        # ...and with the webserver off, nothing is evicted (nor fetched)
+        webserver_off = ArtworkCache(file, max_workers=1, base_url='', timeout=5)
+        webserver_off.evict([show, movie], [])
+        drain(webserver_off)
+        webserver_off.stop()
+        webserver_off_removed = list(removed)
+        # The show falls off the list - its thumb (fetched last session) is removed from the texture cache, but the poster is still
+        # used by the movie
+        show_texture = textures.get("https://img.example.com/show.jpg")
+        new_session.evict([show], [movie, library, cached])
+        drain(new_session)
+        show_removed = list(removed)
+        poster_kept = "https://img.example.com/poster.jpg" in textures
+        # Then the rest - only the artwork fetched by the cache is removed
+        new_session.evict([movie, library, cached], [])
+        drain(new_session)
+        new_session.stop()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    checks = {
+            'warm_fetches_each_url_once':sorted(warmed) == sorted(["https://img.example.com/show.jpg", "https://img.example.com/poster.jpg",
+                                                                  "https://img.example.com/movie.jpg"]),
+            'repeat_warm_skipped':rewarmed == 0,
+            'cached_not_fetched_again':new_session_fetched == 0,
+            'webserver_off_evicts_nothing':webserver_off_removed == [],
+            'evict_removes_unused':show_removed == [show_texture] and show_texture is not None,
+            'evict_keeps_still_used':poster_kept,
+            'evict_removes_only_fetched':sorted(textures) == ["https://img.example.com/cached.jpg", "https://img.example.com/library.jpg"],
+    }
+    checks['ok'] = all(checks.values())
+    checks['fetched'] = fetched
+    checks['removed_textures'] = removed
+    return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the Kodi calls the Switchback hot paths make, under a fake Kodi")
+    parser.add_argument('checks', nargs='*', help=f"the checks to run - {', '.join(CHECKS)} (default: all of them)")
+    parser.add_argument('--addons', help="Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)")
+    parser.add_argument('--sqlite', action='store_true', help="use the SQLite storage backend for the Switchback list")
+    arguments = parser.parse_args()
+    unknown = [name for name in arguments.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check(s): {', '.join(unknown)}")
+
+    kodi = benchmark_runtime.install(arguments.addons)
+    report = {}
+    for name in arguments.checks or CHECKS:
+        benchmark_runtime.reset(kodi)
+        kodi.addon_settings['sqlite_storage'] = arguments.sqlite
+        report[name] = CHECKS[name](kodi)
+
+    print(json.dumps({'storage':'sqlite' if arguments.sqlite else 'json', 'checks':report}, indent=2))
+    sys.exit(0 if all(checks['ok'] for checks in report.values()) else 1)
+
+
+if __name__ == '__main__':
+    main()
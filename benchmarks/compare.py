@@ -0,0 +1,50 @@
+"""
+Compare two benchmark result files (from benchmarks/run.py), e.g. from two different commits.
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+Prints the change in p50 time, and in JSON-RPC calls, for each benchmark, flagging regressions over the threshold (percent).
+Exits non-zero if there were any regressions.
+"""
+import sys
+import json
+import argparse
+
+# What distinguishes one benchmark record from another, other than its name
+PARAMETER_KEYS = ['list_length', 'remove_watched_playbacks', 'mode', 'backend']
+
+
+def key(result: dict) -> tuple:
+    return (result['benchmark'],) + tuple(result.get(parameter) for parameter in PARAMETER_KEYS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two Switchback benchmark result files")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help="percentage slowdown counted as a regression")
+    arguments = parser.parse_args()
+
+    with open(arguments.before, encoding='utf-8') as before_file, open(arguments.after, encoding='utf-8') as after_file:
+        before = {key(result):result for result in json.load(before_file)['results']}
+        after = {key(result):result for result in json.load(after_file)['results']}
+
+    regressions = 0
+    for benchmark_key, result in after.items():
+        previous = before.get(benchmark_key)
+        if not previous:
+            print(f"NEW        {benchmark_key}: p50 {result['p50_ms']:.2f}ms")
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0.0
+        jsonrpc_before = previous.get('jsonrpc_calls_per_iteration', 0)
+        jsonrpc_after = result.get('jsonrpc_calls_per_iteration', 0)
+        regression = change > arguments.threshold or jsonrpc_after > jsonrpc_before
+        regressions += regression
+        print(f"{'REGRESSION' if regression else 'ok':<10} {benchmark_key}: p50 {previous['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms ({change:+.1f}%), "
+              f"JSON-RPC calls {jsonrpc_before:g} -> {jsonrpc_after:g}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Shared state for the fake Kodi runtime used by the benchmarks.
+
+The stand-in xbmc* modules in this directory all read from/write to the single RUNTIME instance here,
+so a benchmark can configure Kodi's behaviour (infolabels, settings, JSON-RPC responses, player state) and latency,
+and then read back what the addon did (JSON-RPC round trips, infolabel reads, builtins, directory items...)
+"""
+import json
+import time
+
+
+class KodiRuntime:
+
+    def __init__(self):
+        # Simulated latency, in seconds, of each executeJSONRPC round trip, and each getInfoLabel/getCondVisibility call
+        self.jsonrpc_latency = 0.0
+        self.infolabel_latency = 0.0
+        self.profile = ''
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Reset all state (but not the latency configuration or profile path)
+        """
+        self.infolabels = {'System.BuildVersion':'21.2 (21.2.0) Git:20250112-Omega'}
+        self.conditions = {}
+        self.addon_settings = {}
+        self.kodi_settings = {}
+        self.window_properties = {}
+        # method -> callable(params) -> result (or raise KeyError for a JSON-RPC error)
+        self.jsonrpc_handlers = {}
+        self.player = {'playing':False, 'file':'', 'item':None, 'time':0.0, 'total_time':0.0}
+        # The Player.GetItem result item for what is playing
+        self.playing_item = {}
+        # Network (smb://, nfs://...) files that exist, for xbmcvfs.exists - None to use the local filesystem for those too
+        self.vfs_files = None
+        # Path prefix (e.g. a share, smb://nas) -> how long xbmcvfs.exists takes for paths under it, in seconds, e.g. for a share that is down
+        self.vfs_delays = {}
+        self.abort_requested = False
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.jsonrpc_calls = 0
+        self.jsonrpc_requests = 0
+        self.infolabel_calls = 0
+        # Window property sets/clears - each one can trigger skin updates in Kodi
+        self.property_writes = 0
+        self.builtins = []
+        self.directory_items = []
+        self.resolved = []
+        # (item, listitem) for each xbmc.Player().play()
+        self.played = []
+        self.notifications = []
+
+    def counters(self) -> dict:
+        return {
+                'jsonrpc_calls':self.jsonrpc_calls,
+                'jsonrpc_requests':self.jsonrpc_requests,
+                'infolabel_calls':self.infolabel_calls,
+                'property_writes':self.property_writes,
+                'builtins':len(self.builtins),
+                'directory_items':len(self.directory_items),
+        }
+
+    def get_infolabel(self, name: str) -> str:
+        self.infolabel_calls += 1
+        if self.infolabel_latency:
+            time.sleep(self.infolabel_latency)
+        return str(self.infolabels.get(name, ''))
+
+    def get_condition(self, condition: str) -> bool:
+        self.infolabel_calls += 1
+        if self.infolabel_latency:
+            time.sleep(self.infolabel_latency)
+        return bool(self.conditions.get(condition, False))
+
+    def _handle_request(self, request: dict) -> dict:
+        self.jsonrpc_requests += 1
+        response = {'jsonrpc':'2.0', 'id':request.get('id')}
+        handler = self.jsonrpc_handlers.get(request.get('method'))
+        if handler is None:
+            response['error'] = {'code':-32601, 'message':'Method not found.'}
+            return response
+        try:
+            response['result'] = handler(request.get('params', {}))
+        except (KeyError, ValueError) as error:
+            response['error'] = {'code':-32602, 'message':f'Invalid params: {error}'}
+        return response
+
+    def execute_jsonrpc(self, request_json: str) -> str:
+        """
+        Handle a JSON-RPC request (or batch of requests) - each call is one (simulated) round trip
+        """
+        self.jsonrpc_calls += 1
+        if self.jsonrpc_latency:
+            time.sleep(self.jsonrpc_latency)
+        request = json.loads(request_json)
+        if isinstance(request, list):
+            return json.dumps([self._handle_request(single_request) for single_request in request])
+        return json.dumps(self._handle_request(request))
+
+
+RUNTIME = KodiRuntime()
@@ -0,0 +1,127 @@
+"""
+Stand-in for Kodi's xbmc module (benchmarks only) - see kodi_runtime.py
+"""
+import time
+
+from kodi_runtime import RUNTIME
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+LOGNONE = 5
+
+PLAYLIST_MUSIC = 0
+PLAYLIST_VIDEO = 1
+
+# Set to a list to capture log output, e.g. when debugging a benchmark
+log_lines = None
+
+
+def log(msg, level=LOGDEBUG):
+    if log_lines is not None:
+        log_lines.append((level, msg))
+
+
+def getInfoLabel(name):
+    return RUNTIME.get_infolabel(name)
+
+
+def getCondVisibility(condition):
+    return RUNTIME.get_condition(condition)
+
+
+def executeJSONRPC(request):
+    return RUNTIME.execute_jsonrpc(request)
+
+
+def executebuiltin(builtin, wait=False):
+    RUNTIME.builtins.append(builtin)
+
+
+def sleep(milliseconds):
+    # Kodi's sleep - scaled right down, benchmarks are about the addon's own costs
+    time.sleep(milliseconds / 100000)
+
+
+def getLocalizedString(string_id):
+    return f"#{string_id}"
+
+
+def getSkinDir():
+    return 'skin.estuary'
+
+
+def getLanguage(format=None, region=False):
+    return 'English'
+
+
+def translatePath(path):
+    import xbmcvfs
+    return xbmcvfs.translatePath(path)
+
+
+class Monitor:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def abortRequested(self):
+        return RUNTIME.abort_requested
+
+    def waitForAbort(self, timeout=0):
+        if not RUNTIME.abort_requested and timeout:
+            time.sleep(min(timeout, 0.001))
+        return RUNTIME.abort_requested
+
+
+class Player:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def isPlaying(self):
+        return RUNTIME.player['playing']
+
+    def isPlayingVideo(self):
+        return RUNTIME.player['playing']
+
+    # (As in Kodi, these raise RuntimeError if nothing is playing)
+    def getPlayingFile(self):
+        return self._playing('file')
+
+    def getPlayingItem(self):
+        return self._playing('item')
+
+    def getTime(self):
+        return self._playing('time')
+
+    def getTotalTime(self):
+        return self._playing('total_time')
+
+    @staticmethod
+    def _playing(key):
+        player = RUNTIME.player
+        if not player['playing']:
+            raise RuntimeError('Kodi is not playing any media file')
+        return player[key]
+
+    def play(self, item='', listitem=None, windowed=False, startpos=-1):
+        RUNTIME.builtins.append(f'Player.play({item})')
+        RUNTIME.played.append((item, listitem))
+
+    def stop(self):
+        RUNTIME.player['playing'] = False
+
+
+class PlayList:
+
+    def __init__(self, playlist_id):
+        self.playlist_id = playlist_id
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return 0
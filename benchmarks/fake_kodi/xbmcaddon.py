@@ -0,0 +1,53 @@
+"""
+Stand-in for Kodi's xbmcaddon module (benchmarks only) - see kodi_runtime.py
+"""
+from kodi_runtime import RUNTIME
+
+ADDON_ID = 'plugin.switchback'
+
+
+class Addon:
+
+    def __init__(self, id=ADDON_ID):
+        self._id = id
+
+    def getAddonInfo(self, key):
+        return {
+                'id':self._id,
+                'name':'Switchback',
+                'version':'0.0.0',
+                'author':'benchmarks',
+                'path':'.',
+                'profile':f'special://profile/addon_data/{self._id}/',
+                'icon':'resources/icon.png',
+        }.get(key, '')
+
+    def getLocalizedString(self, string_id):
+        return f"#{string_id}"
+
+    def getSetting(self, key):
+        return str(RUNTIME.addon_settings.get(key, ''))
+
+    def getSettingBool(self, key):
+        return bool(RUNTIME.addon_settings.get(key, False))
+
+    def getSettingInt(self, key):
+        return int(RUNTIME.addon_settings.get(key, 0))
+
+    def getSettingNumber(self, key):
+        return float(RUNTIME.addon_settings.get(key, 0))
+
+    def getSettingString(self, key):
+        return str(RUNTIME.addon_settings.get(key, ''))
+
+    def setSetting(self, key, value):
+        RUNTIME.addon_settings[key] = value
+
+    def setSettingBool(self, key, value):
+        RUNTIME.addon_settings[key] = value
+
+    def setSettingInt(self, key, value):
+        RUNTIME.addon_settings[key] = value
+
+    def setSettingString(self, key, value):
+        RUNTIME.addon_settings[key] = value
@@ -0,0 +1,113 @@
+"""
+Stand-in for Kodi's xbmcgui module (benchmarks only) - see kodi_runtime.py
+"""
+from kodi_runtime import RUNTIME
+
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+
+class InfoTagVideo:
+    """
+    Accepts (and ignores) all the setXXX/addXXX calls infotagger makes
+    """
+
+    def __getattr__(self, name):
+        if name.startswith(('set', 'add')):
+            return lambda *args, **kwargs: None
+        raise AttributeError(name)
+
+
+class ListItem:
+
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        self._label = label
+        self._label2 = label2
+        self._path = path
+        self._art = {}
+        self._properties = {}
+        self._context_menu_items = []
+        self._info_tag = InfoTagVideo()
+
+    def getLabel(self):
+        return self._label
+
+    def getLabel2(self):
+        return self._label2
+
+    def setLabel(self, label):
+        self._label = label
+
+    def setLabel2(self, label):
+        self._label2 = label
+
+    def getPath(self):
+        return self._path
+
+    def setPath(self, path):
+        self._path = path
+
+    def setArt(self, art):
+        self._art.update(art)
+
+    def getArt(self, key):
+        return self._art.get(key, '')
+
+    def setProperty(self, key, value):
+        self._properties[key.lower()] = value
+
+    def getProperty(self, key):
+        return self._properties.get(key.lower(), '')
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        self._context_menu_items.extend(items)
+
+    def setInfo(self, type, infoLabels):
+        pass
+
+    def setIsFolder(self, is_folder):
+        pass
+
+    def getVideoInfoTag(self):
+        return self._info_tag
+
+
+class Window:
+
+    def __init__(self, window_id=10000):
+        self._window_id = window_id
+
+    @property
+    def _properties(self):
+        # (Looked up each time, as RUNTIME.reset() replaces the properties - and HOME_WINDOW is created once, at import)
+        return RUNTIME.window_properties.setdefault(self._window_id, {})
+
+    def getProperty(self, key):
+        return self._properties.get(key.lower(), '')
+
+    def setProperty(self, key, value):
+        RUNTIME.property_writes += 1
+        self._properties[key.lower()] = value
+
+    def clearProperty(self, key):
+        RUNTIME.property_writes += 1
+        self._properties.pop(key.lower(), None)
+
+
+class Dialog:
+
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        RUNTIME.notifications.append((heading, message))
+
+    def ok(self, heading, message):
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        return True
+
+    def select(self, heading, options, *args, **kwargs):
+        return -1
+
+    def multiselect(self, heading, options, *args, **kwargs):
+        return None
@@ -0,0 +1,32 @@
+"""
+Stand-in for Kodi's xbmcplugin module (benchmarks only) - see kodi_runtime.py
+"""
+from kodi_runtime import RUNTIME
+
+SORT_METHOD_NONE = 0
+
+
+def setContent(handle, content):
+    pass
+
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    RUNTIME.directory_items.append((url, listitem, isFolder))
+    return True
+
+
+def addDirectoryItems(handle, items, totalItems=0):
+    RUNTIME.directory_items.extend(items)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    pass
+
+
+def setResolvedUrl(handle, succeeded, listitem):
+    RUNTIME.resolved.append((succeeded, listitem))
+
+
+def addSortMethod(handle, sortMethod, labelMask='', label2Mask=''):
+    pass
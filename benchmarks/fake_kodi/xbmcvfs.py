@@ -0,0 +1,62 @@
+"""
+Stand-in for Kodi's xbmcvfs module (benchmarks only) - see kodi_runtime.py
+special:// paths are mapped into the runtime's (temporary) profile directory
+"""
+import os
+import time
+
+from kodi_runtime import RUNTIME
+
+
+def translatePath(path):
+    if path.startswith('special://profile/'):
+        return os.path.join(RUNTIME.profile, path[len('special://profile/'):].replace('/', os.sep))
+    if path.startswith('special://'):
+        return os.path.join(RUNTIME.profile, 'special', path[len('special://'):].replace('/', os.sep))
+    return path
+
+
+def mkdirs(path):
+    os.makedirs(path, exist_ok=True)
+    return True
+
+
+def exists(path):
+    for prefix, delay in RUNTIME.vfs_delays.items():
+        if path.startswith(prefix):
+            time.sleep(delay)
+    if RUNTIME.vfs_files is not None and '://' in path and not path.startswith('special://'):
+        # (A folder - given with a trailing slash, as Kodi needs - exists if any file is in it)
+        if path.endswith('/'):
+            return any(file.startswith(path) for file in RUNTIME.vfs_files)
+        return path in RUNTIME.vfs_files
+    return os.path.exists(translatePath(path))
+
+
+def delete(path):
+    try:
+        os.remove(translatePath(path))
+        return True
+    except OSError:
+        return False
+
+
+class File:
+
+    def __init__(self, path, mode='r'):
+        self._file = open(translatePath(path), 'w' if mode == 'w' else 'r', encoding='utf-8')
+
+    def read(self):
+        return self._file.read()
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,437 @@
+"""
+Replay recorded traces of Kodi events against the Switchback service - KodiPlayer, KodiEventMonitor and the switchback_service.run loop -
+under the fake Kodi runtime, at accelerated wall clock time.  This reproduces e.g. rapid A/B Switchback toggling, PVR channel surfing,
+and plugin runs overlapping service writes, without a real Kodi.
+
+Run from the addon root with, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.replay benchmarks/traces/ab_toggling.json --speed 200 --output replay.json
+
+Reports the latency, disk writes (list saves), JSON-RPC calls and Home Window property writes of every event, summarised per event type,
+the end-to-end latency of each Switchback (from its trigger to the playback starting) per Playback source,
+and checks the final Switchback list is correct - it matches the trace's expectations, the service's in-memory list matches the file,
+there are no duplicates, and it is no longer than the maximum list length.
+
+A trace is a JSON file:
+    {
+      "description": "...",
+      "settings": {...},                    (optional) addon settings, over the benchmark defaults
+      "media": {                            what can be played, by name (Player.GetItem details, plus the Kodi library id, if any)
+        "A": {"file": "smb://...", "type": "episode", "id": 101, "title": "...", "showtitle": "...", "season": 1, "episode": 1,
+              "tvshowid": 7, "total_time": 2700},
+        "BBC": {"file": "pvr://channels/tv/...", "type": "channel", "id": 1, "channel": "BBC One", "channelnumber": 1}
+      },
+      "events": [                           in order, 'at' is the trace time, in seconds
+        {"at": 0, "event": "play", "media": "A", "offset": 0},
+        {"at": 600, "event": "stop"},       (or "end" - played to the end)
+        {"at": 610, "event": "switchback", "route": "service"},      (or "plugin")
+        {"at": 620, "event": "plugin", "query": "?mode=delete&index=1"},
+        {"at": 630, "event": "settings", "settings": {...}},
+        {"at": 640, "event": "notification", "sender": "xbmc", "method": "VideoLibrary.OnScanFinished", "data": "{}"}
+      ],
+      "expect": {"list": ["A", "B"]}        (optional) the media expected at the top of the final list, in order
+    }
+
+Kodi's side of things is played by the harness - when the addon asks Kodi to play something (Player.play, PlayMedia, Player.Open, setResolvedUrl),
+whatever is playing is stopped, and the new item started - and notifications (NotifyAll) are delivered to the service.  The Kodi library is simulated too: stopping a library item updates its
+resume point (or playcount, if played to the end), and sends VideoLibrary.OnUpdate, as Kodi does.
+
+NB plugin runs happen in this process (Kodi would start a new interpreter) - the Store's class state is set aside while the plugin runs,
+and restored afterwards, so the plugin and service only share what they would in Kodi: the profile folder, and the Home Window.
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import statistics
+import threading
+from urllib.parse import urlparse
+
+from benchmarks import runtime as benchmark_runtime
+
+# Library media type -> Kodi library details method
+LIBRARY_METHODS = {
+        'movie':'VideoLibrary.GetMovieDetails',
+        'episode':'VideoLibrary.GetEpisodeDetails',
+        'musicvideo':'VideoLibrary.GetMusicVideoDetails',
+}
+# Routes by which Switchback can be requested
+SWITCHBACK_ROUTES = {
+        'service':'NotifyAll(plugin.switchback,switchback)',
+        'plugin':'PlayMedia(plugin://plugin.switchback/?mode=switchback,resume)',
+}
+
+
+class WriteCounter:
+    """
+    Counts the list saves made through each storage object (see storage.py) - the service and plugin each have their own
+    """
+
+    def __init__(self):
+        # id(storage) -> (storage, writes already counted)
+        self._seen = {}
+
+    def observe(self, storage) -> int:
+        """
+        :return: the number of writes made through this storage object since it was last observed
+        """
+        _, counted = self._seen.get(id(storage), (storage, 0))
+        self._seen[id(storage)] = (storage, storage.writes)
+        return storage.writes - counted
+
+
+class TraceReplay:
+
+    def __init__(self, trace: dict, kodi, speed: float):
+        self.trace = trace
+        self.kodi = kodi
+        self.speed = speed
+        self.media = trace['media']
+        self.writes = WriteCounter()
+        self.service_thread = None
+        # What is playing: (media name, trace time started, offset started at)
+        self.playing = None
+        self.now = 0.0
+        # Simulated Kodi library: (type, id) -> {'playcount', 'position', 'total'}
+        self.library = {}
+        for details in self.media.values():
+            if details.get('type') in LIBRARY_METHODS and details.get('id'):
+                self.library[(details['type'], details['id'])] = {'playcount':0, 'position':0.0, 'total':float(details.get('total_time', 0))}
+        self.results = []
+        # How many of the builtins/Player.play()s/resolved items the addon has asked for have been acted on
+        self.builtins_handled = self.played_handled = self.resolved_handled = 0
+        # List saves made by plugin runs, during the current event
+        self.plugin_writes = 0
+        # JSON-RPC NotifyAll calls made by the addon, not yet delivered
+        self.notifications = []
+        # Media the addon has asked Kodi to open with JSON-RPC Player.Open (e.g. a live PVR channel), not yet started
+        self.opened = []
+
+    # Kodi's side of things
+
+    def install_library(self) -> None:
+        # All the trace's media files exist (for the service's reachability scan)
+        self.kodi.vfs_files = {details['file'] for details in self.media.values()}
+        for media_type, method in LIBRARY_METHODS.items():
+            id_key = f'{media_type}id'
+
+            def details(params, media_type=media_type, id_key=id_key):
+                entry = self.library[(media_type, params[id_key])]
+                return {f'{media_type}details':{id_key:params[id_key], 'label':'', 'playcount':entry['playcount'],
+                                                'resume':{'position':entry['position'], 'total':entry['total']}}}
+
+            self.kodi.jsonrpc_handlers[method] = details
+
+        def notify_all(params):
+            self.notifications.append(params)
+            return 'OK'
+
+        self.kodi.jsonrpc_handlers['JSONRPC.NotifyAll'] = notify_all
+
+        def player_open(params):
+            item = params['item']
+            if 'channelid' in item:
+                self.opened.append(self.channel_name(item['channelid']))
+            else:
+                self.opened.append(self.media_name(item['file']))
+            return 'OK'
+
+        self.kodi.jsonrpc_handlers['Player.Open'] = player_open
+
+    def media_name(self, path: str) -> str:
+        for name, details in self.media.items():
+            if path in [details['file'], details.get('path')]:
+                return name
+        raise KeyError(f"Trace has no media for: {path}")
+
+    def channel_name(self, channelid: int) -> str:
+        for name, details in self.media.items():
+            if details.get('type') == 'channel' and details.get('id') == channelid:
+                return name
+        raise KeyError(f"Trace has no PVR channel with id: {channelid}")
+
+    def start(self, name: str, list_item=None, offset: float = None) -> None:
+        """
+        Start playing a media item - stopping whatever is playing first - and tell the service
+        """
+        import xbmcgui
+        from resources.lib.store import Store
+        if self.playing:
+            self.stop(ended=False)
+        details = self.media[name]
+        if list_item is None:
+            list_item = xbmcgui.ListItem(label=details.get('title') or details.get('channel', ''), path=details.get('path', details['file']))
+        if offset is None:
+            offset = float(list_item.getProperty('StartOffset') or 0)
+            # Kodi resumes library items from their library resume point
+            if not offset and (details.get('type'), details.get('id')) in self.library:
+                offset = self.library[(details['type'], details['id'])]['position']
+        self.kodi.player.update(playing=True, file=details['file'], item=list_item, time=offset, total_time=float(details.get('total_time', 0)))
+        self.kodi.conditions['Player.HasVideo'] = True
+        self.kodi.playing_item = {key:value for key, value in details.items() if key not in ['total_time', 'path']}
+        self.kodi.playing_item.setdefault('label', details.get('title') or details.get('channel', ''))
+        self.playing = (name, self.now, offset)
+        Store.kodi_player.onPlayBackStarted()
+        Store.kodi_player.onAVStarted()
+
+    def stop(self, ended: bool) -> None:
+        """
+        Stop (or finish) what is playing - updating the library, as Kodi does - and tell the service
+        """
+        from resources.lib.store import Store
+        name, started, offset = self.playing
+        details = self.media[name]
+        position = float(details.get('total_time', 0)) if ended else offset + (self.now - started)
+        self.kodi.player.update(playing=False, time=position)
+        self.playing = None
+        if ended:
+            Store.kodi_player.onPlayBackEnded()
+        else:
+            Store.kodi_player.onPlayBackStopped()
+        self.kodi.player.update(file='', item=None, time=0.0, total_time=0.0)
+        self.kodi.conditions['Player.HasVideo'] = False
+
+        library_key = (details.get('type'), details.get('id'))
+        if library_key in self.library:
+            entry = self.library[library_key]
+            if ended:
+                entry.update(playcount=entry['playcount'] + 1, position=0.0)
+            else:
+                entry['position'] = position
+            Store.kodi_event_monitor.onNotification('xbmc', 'VideoLibrary.OnUpdate',
+                                                    json.dumps({'item':{'type':library_key[0], 'id':library_key[1]}, 'playcount':entry['playcount']}))
+
+    def run_plugin(self, query: str) -> None:
+        """
+        Run the plugin, as Kodi would in a new interpreter - with the Store's class state set aside
+        """
+        from resources.lib import switchback_plugin
+        from resources.lib.store import Store
+        saved = {name:value for name, value in vars(Store).items()
+                 if not name.startswith('__') and not isinstance(value, (staticmethod, classmethod, types.FunctionType))}
+        sys.argv = ['plugin://plugin.switchback/', '1', query]
+        try:
+            switchback_plugin.run()
+            self.plugin_writes += self.writes.observe(Store.switchback.storage)
+        finally:
+            for name, value in saved.items():
+                setattr(Store, name, value)
+
+    def handle_requests(self) -> None:
+        """
+        Act on whatever the addon has asked Kodi to do (play something, run the plugin, send a notification - by builtin or JSON-RPC), until it asks for nothing more
+        """
+        from resources.lib.store import Store
+        for _ in range(20):
+            # (The service's callbacks only post events - wait for its event worker to have handled them all)
+            if Store.events and not Store.events.wait_idle(10):
+                raise RuntimeError("The service's event worker is stuck")
+            builtins = self.kodi.builtins[self.builtins_handled:]
+            self.builtins_handled = len(self.kodi.builtins)
+            played = self.kodi.played[self.played_handled:]
+            self.played_handled = len(self.kodi.played)
+            resolved = self.kodi.resolved[self.resolved_handled:]
+            self.resolved_handled = len(self.kodi.resolved)
+            notifications, self.notifications = self.notifications, []
+            opened, self.opened = self.opened, []
+            if not builtins and not played and not resolved and not notifications and not opened:
+                return
+            for notification in notifications:
+                Store.kodi_event_monitor.onNotification(notification['sender'], f"Other.{notification['message']}",
+                                                        json.dumps(notification.get('data')))
+            for builtin in builtins:
+                if builtin.startswith('NotifyAll(plugin.switchback,'):
+                    Store.kodi_event_monitor.onNotification('plugin.switchback', f"Other.{builtin[len('NotifyAll(plugin.switchback,'):-1]}", '')
+                elif builtin.startswith(('PlayMedia(plugin://plugin.switchback', 'RunPlugin(plugin://plugin.switchback')):
+                    self.run_plugin('?' + urlparse(builtin[builtin.index('(') + 1:-1]).query)
+                elif builtin.startswith('PlayMedia("'):
+                    self.start(self.media_name(builtin[len('PlayMedia("'):-2]))
+            for path, list_item in played:
+                self.start(self.media_name(path), list_item)
+            for name in opened:
+                self.start(name)
+            for succeeded, list_item in resolved:
+                if succeeded:
+                    self.start(self.media_name(list_item.getPath()), list_item)
+
+    # The replay
+
+    def start_service(self) -> None:
+        from resources.lib import switchback_service
+        from resources.lib.store import Store
+        Store.kodi_player = Store.kodi_event_monitor = None
+        self.service_thread = threading.Thread(target=switchback_service.run, name="Switchback service (replay)", daemon=True)
+        self.service_thread.start()
+        deadline = time.monotonic() + 10
+        while not (Store.kodi_player and Store.kodi_event_monitor):
+            if time.monotonic() > deadline:
+                raise RuntimeError("The service did not start")
+            time.sleep(0.001)
+
+    def stop_service(self) -> None:
+        self.kodi.abort_requested = True
+        self.service_thread.join(10)
+
+    def dispatch(self, event: dict) -> None:
+        from resources.lib.store import Store
+        kind = event['event']
+        if kind == 'play':
+            self.start(event['media'], offset=event.get('offset'))
+        elif kind in ['stop', 'end']:
+            if self.playing:
+                self.stop(ended=kind == 'end')
+        elif kind == 'switchback':
+            route = event.get('route', 'service')
+            # (As the context menu does, before asking the service - the plugin records its own trigger)
+            if route == 'service':
+                from resources.lib.service_state import record_trigger, ROUTE_CONTEXT_MENU
+                record_trigger(ROUTE_CONTEXT_MENU)
+            self.kodi.builtins.append(SWITCHBACK_ROUTES[route])
+        elif kind == 'plugin':
+            self.run_plugin(event['query'])
+        elif kind == 'settings':
+            self.kodi.addon_settings.update(event['settings'])
+            Store.kodi_event_monitor.onSettingsChanged()
+        elif kind == 'notification':
+            Store.kodi_event_monitor.onNotification(event.get('sender', 'xbmc'), event['method'], event.get('data', '{}'))
+        else:
+            raise ValueError(f"Unknown trace event: {kind}")
+        self.handle_requests()
+
+    def replay(self) -> dict:
+        from resources.lib.store import Store
+        self.install_library()
+        self.start_service()
+        # (Anything started by the service's startup is not part of any event)
+        self.writes.observe(Store.switchback.storage)
+
+        replay_start = time.monotonic()
+        for index, event in enumerate(self.trace['events']):
+            # Wait until it is time for the event (in accelerated time)
+            delay = replay_start + event['at'] / self.speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.now = event['at']
+            # Let the service record where the playback is up to (it polls the player)
+            if self.playing:
+                name, started, offset = self.playing
+                self.kodi.player['time'] = offset + (self.now - started)
+
+            jsonrpc_calls, property_writes = self.kodi.jsonrpc_calls, self.kodi.property_writes
+            self.plugin_writes = 0
+            service_storage = Store.switchback.storage
+            start = time.perf_counter()
+            self.dispatch(event)
+            latency = (time.perf_counter() - start) * 1000
+            # (The storage is replaced if the storage setting changes)
+            disk_writes = self.writes.observe(service_storage) + self.writes.observe(Store.switchback.storage) + self.plugin_writes
+            self.results.append({
+                    'index':index,
+                    'at':event['at'],
+                    'event':event['event'],
+                    'latency_ms':latency,
+                    'disk_writes':disk_writes,
+                    'jsonrpc_calls':self.kodi.jsonrpc_calls - jsonrpc_calls,
+                    'property_writes':self.kodi.property_writes - property_writes,
+            })
+
+        # Let any background work finish, before checking the results
+        if Store.current_playback:
+            Store.kodi_player.enricher.wait(Store.current_playback)
+        correctness = self.check()
+        # (End-to-end, from each Switchback's trigger to its playback starting - see LatencyHistograms)
+        switchback_latency = Store.latency.histograms()
+        self.stop_service()
+        return {
+                'description':self.trace.get('description', ''),
+                'speed':self.speed,
+                'wall_time_s':time.monotonic() - replay_start,
+                'summary':self.summarise(),
+                'switchback_latency':switchback_latency,
+                'correctness':correctness,
+                'events':self.results,
+        }
+
+    def summarise(self) -> dict:
+        summary = {}
+        for kind in sorted({result['event'] for result in self.results}):
+            results = [result for result in self.results if result['event'] == kind]
+            latencies = sorted(result['latency_ms'] for result in results)
+            summary[kind] = {
+                    'count':len(results),
+                    'p50_ms':statistics.median(latencies),
+                    'p95_ms':latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    'max_ms':latencies[-1],
+                    'disk_writes':sum(result['disk_writes'] for result in results),
+                    'jsonrpc_calls':sum(result['jsonrpc_calls'] for result in results),
+                    'property_writes':sum(result['property_writes'] for result in results),
+            }
+        return summary
+
+    def check(self) -> dict:
+        """
+        Check the final Switchback list - in memory (the service's), and on disk
+        """
+        from resources.lib.playback import Playback, FIELD_INDEX
+        from resources.lib.storage import open_storage
+        from resources.lib.store import Store
+        memory = [playback.file for playback in Store.switchback]
+        rows, _ = open_storage(Store.switchback.file, Playback.__slots__).load()
+        disk = [row[FIELD_INDEX['file']] for row in rows]
+        names = []
+        for file in disk:
+            try:
+                names.append(self.media_name(file))
+            except KeyError:
+                names.append(file)
+        checks = {
+                'list':names,
+                'memory_matches_disk':memory == disk,
+                'no_duplicates':len(set(disk)) == len(disk),
+                'within_maximum_length':len(disk) <= Store.maximum_list_length,
+        }
+        expected = self.trace.get('expect', {}).get('list')
+        if expected is not None:
+            checks['matches_expected'] = names[:len(expected)] == expected
+        checks['ok'] = all(value for key, value in checks.items() if key != 'list')
+        return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay traces of Kodi events against the Switchback service, under a fake Kodi")
+    parser.add_argument('traces', nargs='+', help="trace files (see benchmarks/traces)")
+    parser.add_argument('--addons', help="Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)")
+    parser.add_argument('--speed', type=float, default=1000.0, help="how many times faster than real time to replay the traces")
+    parser.add_argument('--jsonrpc-latency-ms', type=float, default=1.0, help="simulated latency of each JSON-RPC round trip")
+    parser.add_argument('--sqlite', action='store_true', help="use the SQLite storage backend for the Switchback list")
+    parser.add_argument('--output', help="write the results to this JSON file (default: print them)")
+    arguments = parser.parse_args()
+
+    kodi = benchmark_runtime.install(arguments.addons)
+    kodi.jsonrpc_latency = arguments.jsonrpc_latency_ms / 1000
+
+    reports = {}
+    for trace_file in arguments.traces:
+        with open(trace_file, encoding='utf-8') as trace_handle:
+            trace = json.load(trace_handle)
+        benchmark_runtime.reset(kodi)
+        kodi.addon_settings['sqlite_storage'] = arguments.sqlite
+        kodi.addon_settings.update(trace.get('settings', {}))
+        # Start each trace from an empty list (and no Switchback latency samples)
+        latency_file = os.path.join(os.path.dirname(benchmark_runtime.write_switchback_list([])), 'switchback_latency.json')
+        if os.path.exists(latency_file):
+            os.remove(latency_file)
+        reports[os.path.basename(trace_file)] = TraceReplay(trace, kodi, arguments.speed).replay()
+
+    output = json.dumps({'storage':'sqlite' if arguments.sqlite else 'json', 'traces':reports}, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+    sys.exit(0 if all(report['correctness']['ok'] for report in reports.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark the plugin, player and service hot paths, under a fake Kodi runtime with configurable JSON-RPC and infolabel latency.
+
+Run from the addon root with, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.run --jsonrpc-latency-ms 2 --output results.json
+
+Results are written as JSON (one record per benchmark, with timings and Kodi call counts per iteration),
+and can be compared between commits with benchmarks/compare.py
+"""
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+from benchmarks import runtime as benchmark_runtime
+from benchmarks.bench_storage import make_playbacks
+
+
+def measure(name: str, function, iterations: int, setup=None, **parameters) -> dict:
+    """
+    Time a function over a number of iterations, and record the Kodi calls it makes
+
+    :param name: the benchmark name
+    :param function: the function to time
+    :param iterations: how many times to run it
+    :param setup: (optional) function run, untimed, before each iteration
+    :param parameters: recorded alongside the results, e.g. the list length
+    :return: the benchmark result record
+    """
+    from kodi_runtime import RUNTIME
+    timings = []
+    counters = {}
+    for _ in range(iterations):
+        if setup:
+            setup()
+        RUNTIME.reset_counters()
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+        for counter, value in RUNTIME.counters().items():
+            counters[counter] = counters.get(counter, 0) + value
+
+    timings.sort()
+    result = {
+            'benchmark':name,
+            **parameters,
+            'iterations':iterations,
+            'mean_ms':statistics.mean(timings),
+            'p50_ms':statistics.median(timings),
+            'p95_ms':timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'min_ms':timings[0],
+    }
+    result.update({f'{counter}_per_iteration':value / iterations for counter, value in counters.items()})
+    return result
+
+
+def benchmark_plugin(list_length: int, iterations: int) -> list:
+    from bossanova808.constants import HOME_WINDOW
+    from resources.lib import switchback_plugin
+    from resources.lib.service_state import HEARTBEAT_PROPERTY
+    from resources.lib.store import Store, SNAPSHOT_PROPERTY
+
+    playbacks = make_playbacks(list_length)
+    benchmark_runtime.write_switchback_list(playbacks)
+
+    def plugin(query):
+        sys.argv = ['plugin://plugin.switchback/', '1', query]
+        switchback_plugin.run()
+
+    def decoded_per_switchback():
+        # Switchback mode should only ever decode the two Playbacks it needs, however long the list
+        plugin('?mode=switchback,resume')
+        return Store.switchback.decoded
+
+    # Without a snapshot, Switchback mode does a full Store() load
+    HOME_WINDOW.clearProperty(SNAPSHOT_PROPERTY)
+    no_snapshot = measure('plugin.run switchback mode (no snapshot)', lambda:plugin('?mode=switchback,resume'), iterations,
+                          setup=lambda:HOME_WINDOW.clearProperty(SNAPSHOT_PROPERTY), list_length=list_length)
+    HOME_WINDOW.clearProperty(SNAPSHOT_PROPERTY)
+    no_snapshot['playbacks_decoded'] = decoded_per_switchback()
+
+    # With the service running (and the library unchanged), library entries already checked are not checked again
+    from resources.lib.service_state import beat, library_changed
+    library_changed()
+    beat()
+    service_running = measure('plugin.run default listing (service running, library unchanged)', lambda:plugin(''), iterations,
+                              setup=beat, list_length=list_length)
+    HOME_WINDOW.clearProperty(HEARTBEAT_PROPERTY)
+
+    # The service publishes the snapshot Switchback mode uses - make sure it is current
+    Store()
+    return [
+            service_running,
+            measure('plugin.run default listing', lambda:plugin(''), iterations, list_length=list_length),
+            measure('plugin.run default listing (page 2)', lambda:plugin('?page=1'), iterations, list_length=list_length),
+            measure('plugin.run switchback mode', lambda:plugin('?mode=switchback,resume'), iterations, list_length=list_length),
+            no_snapshot,
+            # Several items deleted in one batch - one save, and no library checks
+            measure('plugin.run delete mode (3 items)', lambda:plugin('?mode=delete&index=1,2,3'), iterations,
+                    setup=lambda:benchmark_runtime.write_switchback_list(playbacks), list_length=list_length),
+    ]
+
+
+def benchmark_player(list_length: int, iterations: int) -> list:
+    from kodi_runtime import RUNTIME
+    from resources.lib.player import KodiPlayer
+    from resources.lib.store import Store
+
+    benchmark_runtime.write_switchback_list(make_playbacks(list_length))
+    Store()
+    player = KodiPlayer()
+    benchmark_runtime.set_playing_episode(RUNTIME)
+
+    return [
+            measure('player.onAVStarted', player.onAVStarted, iterations, list_length=list_length),
+            measure('player.onPlaybackFinished', player.onPlaybackFinished, iterations, setup=player.onAVStarted, list_length=list_length),
+    ]
+
+
+def benchmark_standby(list_length: int, iterations: int) -> list:
+    from resources.lib.standby import StandbyTarget
+    from resources.lib.store import Store
+
+    benchmark_runtime.write_switchback_list(make_playbacks(list_length))
+    Store()
+    Store.standby = StandbyTarget()
+    Store.standby.prepare()
+    # (The plugin route to the same thing is 'plugin.run switchback mode' - plus the cost of starting a new Python interpreter)
+    results = [measure('service instant switchback', Store.standby.play, iterations, list_length=list_length)]
+    Store.standby = None
+    return results
+
+
+def benchmark_properties(list_length: int, iterations: int) -> list:
+    from resources.lib.store import Store
+
+    benchmark_runtime.write_switchback_list(make_playbacks(list_length))
+    Store()
+
+    def play_again():
+        # A playback from further down the list is played again, so moves to the top
+        Store.switchback.move_to_front(Store.switchback[min(3, len(Store.switchback) - 1)])
+
+    # Only the properties that change should be written - none at all if the list is unchanged
+    return [
+            measure('Store.update_switchback_context_menu (unchanged)', Store.update_switchback_context_menu, iterations, list_length=list_length),
+            measure('Store.update_switchback_context_menu (item moved to top)', Store.update_switchback_context_menu, iterations,
+                    setup=play_again, list_length=list_length),
+    ]
+
+
+def benchmark_load(list_length: int, iterations: int) -> list:
+    from resources.lib.playback import PlaybackList
+    from resources.lib.store import Store
+
+    file = benchmark_runtime.write_switchback_list(make_playbacks(list_length))
+    Store()
+    results = []
+    for remove_watched_playbacks in [False, True]:
+        playback_list = PlaybackList([], file, remove_watched_playbacks)
+        results.append(measure('PlaybackList.load_or_init', playback_list.load_or_init, iterations,
+                               list_length=list_length, remove_watched_playbacks=remove_watched_playbacks))
+    return results
+
+
+def benchmark_list_items(list_length: int, iterations: int) -> list:
+    from resources.lib.playback import Playback
+
+    playbacks = [Playback(**playback) for playback in make_playbacks(list_length)]
+
+    def create_list_items():
+        for playback in playbacks:
+            playback.create_list_item_from_playback()
+
+    return [measure('Playback.create_list_item_from_playback (whole list)', create_list_items, iterations, list_length=list_length)]
+
+
+def benchmark_reachability(list_length: int, iterations: int) -> list:
+    import threading
+    from kodi_runtime import RUNTIME
+    from resources.lib.reachability import ReachabilityScanner, REACHABLE
+
+    playbacks = make_playbacks(list_length)
+    # The movies are on a share that is down (every check would hang for a second), and one episode has been deleted
+    for playback in playbacks:
+        if playback['type'] == 'movie':
+            playback['path'] = playback['file'] = playback['file'].replace('smb://nas/', 'smb://sleepy/')
+    RUNTIME.vfs_delays['smb://sleepy/'] = 1.0
+    RUNTIME.vfs_files = {playback['file'] for playback in playbacks if playback['file'].startswith('smb://nas/')}
+    RUNTIME.vfs_files.discard(playbacks[0]['file'])
+    entries = [(playback['path'], playback['file'], playback['source'], playback['type'], playback['dbid'], None) for playback in playbacks]
+    scanners = []
+    results = {}
+
+    def new_scanner():
+        scanners.append(ReachabilityScanner(timeout=0.1))
+
+    def scan():
+        done = threading.Event()
+        scanners[-1].scan(entries, on_scanned=lambda scanned:(results.update(scanned), done.set()))
+        done.wait(10)
+
+    def rescan():
+        # Everything is cached, so nothing is checked again
+        scanners[-1].scan(entries)
+        scanners[-1]._thread.join()
+
+    full_scan = measure('ReachabilityScanner.scan (one share down)', scan, iterations, setup=new_scanner, list_length=list_length)
+    full_scan['unreachable'] = sum(1 for result in results.values() if result != REACHABLE)
+    full_scan['share_timeouts_per_scan'] = sum(scanner.timeouts for scanner in scanners) / len(scanners)
+    cached_scan = measure('ReachabilityScanner.scan (all cached)', rescan, iterations, list_length=list_length)
+    for scanner in scanners:
+        scanner.stop()
+    return [full_scan, cached_scan]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=benchmark_runtime.ADDON_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Switchback's plugin, player and service hot paths under a fake Kodi")
+    parser.add_argument('--addons', help="Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)")
+    parser.add_argument('--jsonrpc-latency-ms', type=float, default=1.0, help="simulated latency of each JSON-RPC round trip")
+    parser.add_argument('--infolabel-latency-ms', type=float, default=0.05, help="simulated latency of each infolabel/condition call")
+    parser.add_argument('--sizes', default='5,20,100', help="comma separated list lengths to benchmark")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--sqlite', action='store_true', help="use the SQLite storage backend for the Switchback list")
+    parser.add_argument('--output', help="write the results to this JSON file (default: print them)")
+    arguments = parser.parse_args()
+
+    kodi = benchmark_runtime.install(arguments.addons)
+    kodi.jsonrpc_latency = arguments.jsonrpc_latency_ms / 1000
+    kodi.infolabel_latency = arguments.infolabel_latency_ms / 1000
+
+    results = []
+    for list_length in [int(size) for size in arguments.sizes.split(',')]:
+        for benchmark in [benchmark_plugin, benchmark_player, benchmark_standby, benchmark_properties, benchmark_load, benchmark_list_items,
+                          benchmark_reachability]:
+            benchmark_runtime.reset(kodi)
+            kodi.addon_settings['maximum_list_length'] = list_length
+            kodi.addon_settings['sqlite_storage'] = arguments.sqlite
+            results.extend(benchmark(list_length, arguments.iterations))
+
+    output = json.dumps({
+            'revision':git_revision(),
+            'jsonrpc_latency_ms':arguments.jsonrpc_latency_ms,
+            'infolabel_latency_ms':arguments.infolabel_latency_ms,
+            'storage':'sqlite' if arguments.sqlite else 'json',
+            'results':results,
+    }, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
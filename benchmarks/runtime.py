@@ -0,0 +1,140 @@
+"""
+Set up the fake Kodi runtime for the benchmarks.
+
+The stand-in xbmc, xbmcgui, xbmcplugin, xbmcvfs and xbmcaddon modules live in benchmarks/fake_kodi.
+The addon's real module dependencies (script.module.bossanova808 and script.module.infotagger) are NOT faked - they are loaded
+from a Kodi addons directory, given by --addons or the KODI_ADDONS_PATH environment variable (e.g. ~/.kodi/addons)
+"""
+import os
+import sys
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+FAKE_KODI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_kodi')
+ADDON_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_DEPENDENCIES = ['script.module.bossanova808', 'script.module.infotagger']
+
+# Library media type -> (details result key, id key)
+LIBRARY_TYPES = {
+        'VideoLibrary.GetMovieDetails':('moviedetails', 'movieid'),
+        'VideoLibrary.GetEpisodeDetails':('episodedetails', 'episodeid'),
+        'VideoLibrary.GetMusicVideoDetails':('musicvideodetails', 'musicvideoid'),
+}
+
+
+def module_library_path(addons_path: str, addon_id: str) -> str:
+    """
+    Find the library path of a Kodi python module addon, from its addon.xml
+    """
+    addon_path = os.path.join(addons_path, addon_id)
+    root = ElementTree.parse(os.path.join(addon_path, 'addon.xml')).getroot()
+    for extension in root.iter('extension'):
+        if extension.get('point') == 'xbmc.python.module':
+            return os.path.join(addon_path, extension.get('library', ''))
+    raise RuntimeError(f"{addon_id} is not a Kodi python module addon")
+
+
+def install(addons_path: str = None):
+    """
+    Put the fake Kodi modules, the addon's module dependencies, and the addon itself on sys.path, and set up a temporary profile.
+    Must be called before anything from the addon (or bossanova808) is imported.
+
+    :param addons_path: Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)
+    :return: the fake Kodi runtime (see fake_kodi/kodi_runtime.py)
+    """
+    addons_path = addons_path or os.environ.get('KODI_ADDONS_PATH')
+    if not addons_path:
+        raise SystemExit("Set KODI_ADDONS_PATH (or use --addons) to a Kodi addons directory containing: " + ", ".join(MODULE_DEPENDENCIES))
+
+    for path in [FAKE_KODI_PATH, ADDON_ROOT] + [module_library_path(addons_path, addon_id) for addon_id in MODULE_DEPENDENCIES]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    from kodi_runtime import RUNTIME
+    RUNTIME.profile = tempfile.mkdtemp(prefix='switchback_benchmarks_')
+    reset(RUNTIME)
+    return RUNTIME
+
+
+def reset(runtime) -> None:
+    """
+    Reset the runtime to a typical Kodi setup: default addon settings, and a library that answers the JSON-RPC calls Switchback makes
+    """
+    runtime.reset()
+    runtime.addon_settings.update({
+            'maximum_list_length':20,
+            'page_size':20,
+            'widget_length':5,
+            'save_across_sessions':True,
+            'enable_context_menu':True,
+            'remove_watched_playbacks':True,
+            'episode_force_browse':False,
+    })
+    runtime.kodi_settings['videolibrary.flattentvshows'] = 1
+
+    def library_details(method):
+        result_key, id_key = LIBRARY_TYPES[method]
+        return lambda params:{result_key:{id_key:params[id_key], 'label':f"Item {params[id_key]}", 'playcount':0,
+                                          'resume':{'position':600.0, 'total':2700.0}}}
+
+    for method in LIBRARY_TYPES:
+        runtime.jsonrpc_handlers[method] = library_details(method)
+    runtime.jsonrpc_handlers['VideoLibrary.GetSeasons'] = lambda params:{'limits':{'start':0, 'end':3, 'total':3},
+                                                                          'seasons':[{'seasonid':season, 'season':season} for season in range(1, 4)]}
+    runtime.jsonrpc_handlers['Settings.GetSettingValue'] = lambda params:{'value':runtime.kodi_settings[params['setting']]}
+    runtime.jsonrpc_handlers['JSONRPC.NotifyAll'] = lambda params:'OK'
+    runtime.jsonrpc_handlers['Player.GetItem'] = lambda params:{'item':dict(runtime.playing_item) or {'type':'unknown', 'label':''}}
+
+
+def write_switchback_list(playbacks: list) -> str:
+    """
+    Write a Switchback list file, in the addon's profile, holding the given Playback dicts
+
+    :return: the list file path
+    """
+    from resources.lib.playback import Playback
+    from resources.lib.store import Store
+    from resources.lib.storage import open_storage
+    # (The list file depends on the storage setting)
+    Store.load_config_from_settings()
+    file = Store.get_switchback_file()
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    open_storage(file, Playback.__slots__).save([Playback(**playback).to_row() for playback in playbacks], force=True)
+    return file
+
+
+def set_playing_episode(runtime, dbid: int = 101, tvshowdbid: int = 7) -> None:
+    """
+    Set the fake player to be playing a library episode
+    """
+    import xbmcgui
+    file = f"smb://nas/tv/Benchmark Show/Season 2/S02E{dbid % 100:02d}.mkv"
+    runtime.player.update(playing=True, file=file, item=xbmcgui.ListItem(label=f"Episode {dbid}", path=file), time=120.0, total_time=2700.0)
+    runtime.conditions['Player.HasVideo'] = True
+    runtime.infolabels.update({
+            'VideoPlayer.DBID':dbid,
+            'VideoPlayer.TvShowDBID':tvshowdbid,
+            'VideoPlayer.Title':f"Episode {dbid}",
+            'VideoPlayer.TVShowTitle':"Benchmark Show",
+            'VideoPlayer.Season':2,
+            'VideoPlayer.Episode':dbid % 100,
+            'VideoPlayer.Year':2024,
+            'Player.Art(tvshow.poster)':"image://smb%3a%2f%2fnas%2ftv%2fBenchmark%20Show%2fposter.jpg/",
+            'Player.Art(fanart)':"image://smb%3a%2f%2fnas%2ftv%2fBenchmark%20Show%2ffanart.jpg/",
+    })
+    runtime.playing_item = {
+            'id':dbid,
+            'type':'episode',
+            'label':f"Episode {dbid}",
+            'title':f"Episode {dbid}",
+            'showtitle':"Benchmark Show",
+            'season':2,
+            'episode':dbid % 100,
+            'year':2024,
+            'tvshowid':tvshowdbid,
+            'file':file,
+            'art':{
+                    'tvshow.poster':"image://smb%3a%2f%2fnas%2ftv%2fBenchmark%20Show%2fposter.jpg/",
+                    'fanart':"image://smb%3a%2f%2fnas%2ftv%2fBenchmark%20Show%2ffanart.jpg/",
+            },
+    }
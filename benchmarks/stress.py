@@ -0,0 +1,272 @@
+"""
+Stress the Switchback service's event handling, under the fake Kodi runtime: Kodi's player callbacks (playbacks starting and stopping
+in quick succession), many 'poll loop' threads sampling the resume point as fast as they can, and many threads firing monitor
+callbacks (library updates, list edits, refresh requests, settings changes) - all interleaved.
+
+Every media item plays from its own range of positions (item i from i * 1000 seconds), so a resume point recorded against the
+wrong playback is caught.  At the end, the Switchback list is checked:
+- no errors in the event worker (or in the callback threads), none logged, and no control (i.e. non-droppable) events dropped
+- every resume point belongs to its own playback
+- the list in memory matches the list on disk, with no duplicates, and within the maximum length
+
+Run from the addon root with, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.stress --threads 8 --cycles 200
+
+(--inline handles every callback on the thread that makes it, with no event worker, for comparison.
+The exit code is non-zero if any check fails.)
+
+With --memory, the service's memory watchdog (see MemoryWatchdog) runs too - checking memory every tenth of the cycles, as the
+service's loop would - and its final diagnostics (growth since the baseline, the biggest growers, live threads) are reported.
+Run it over thousands of playbacks to look for leaks, e.g.:
+    KODI_ADDONS_PATH=~/.kodi/addons python -m benchmarks.stress --threads 2 --cycles 5000 --memory
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+
+from benchmarks import runtime as benchmark_runtime
+
+# Each media item plays from positions in its own range: item i from i * POSITION_RANGE seconds
+POSITION_RANGE = 1000
+
+
+def media_file(index: int) -> str:
+    return f"smb://nas/stress/Video {index}.mkv"
+
+
+class ErrorLog(list):
+    """
+    Captures just the errors logged (see xbmc.log_lines in the fake Kodi)
+    """
+
+    def append(self, line) -> None:
+        import xbmc
+        level, message = line
+        if level >= xbmc.LOGERROR:
+            super().append(message)
+
+
+class Stress:
+
+    def __init__(self, kodi, media: int, cycles: int, threads: int, inline: bool, memory: bool = False):
+        self.kodi = kodi
+        self.memory = memory
+        self.media = media
+        self.cycles = cycles
+        self.threads = threads
+        self.inline = inline
+        self.stopping = threading.Event()
+        self.thread_errors = []
+        self.samples = 0
+        self.notifications = 0
+
+    def guarded(self, function):
+        """
+        Run a thread's function, recording (rather than losing) any exception
+        """
+
+        def run():
+            try:
+                function()
+            except Exception as error:
+                self.thread_errors.append(f"{threading.current_thread().name}: {error!r}")
+
+        return run
+
+    def play(self, index: int) -> None:
+        """
+        Start playing a media item (in one go, as the fake player state is replaced, not updated), and tell the player
+        """
+        import xbmcgui
+        from resources.lib.store import Store
+        file = media_file(index)
+        self.kodi.playing_item = {'type':'unknown', 'label':f"Video {index}", 'file':file}
+        self.kodi.player = {'playing':True, 'file':file, 'item':xbmcgui.ListItem(label=f"Video {index}", path=file),
+                            'time':float(index * POSITION_RANGE), 'total_time':float(POSITION_RANGE)}
+        Store.kodi_player.onAVStarted()
+
+    def player_thread(self) -> None:
+        """
+        Kodi's player callbacks - a playback starts, plays for a moment, and stops, over and over
+        """
+        from resources.lib.store import Store
+        random_ = random.Random(1)
+        memory_interval = max(self.cycles // 10, 1)
+        for cycle in range(self.cycles):
+            # (As the service's loop does)
+            if Store.memory_watchdog and cycle % memory_interval == 0:
+                Store.post_event('memory check', Store.check_memory)
+            index = random_.randrange(self.media)
+            self.play(index)
+            for position in range(1, random_.randint(2, 6)):
+                time.sleep(0.0005)
+                player = dict(self.kodi.player, time=float(index * POSITION_RANGE + position))
+                self.kodi.player = player
+            self.kodi.player = dict(self.kodi.player, playing=False)
+            Store.kodi_player.onPlayBackStopped()
+        self.stopping.set()
+
+    def sampler_thread(self) -> None:
+        """
+        The service's poll loop - sample the resume point (far more often than the real one does)
+        """
+        from resources.lib.store import Store
+        while not self.stopping.is_set():
+            if Store.current_playback:
+                Store.kodi_player.sample_position()
+                self.samples += 1
+            time.sleep(0.001)
+
+    def notifier_thread(self, seed: int) -> None:
+        """
+        Kodi's monitor callbacks - library updates, Switchback list edits, refresh requests, settings changes
+        (Not instant Switchback requests - this player doesn't play what it is asked to, see benchmarks/replay.py for those)
+        """
+        from resources.lib.store import Store
+        random_ = random.Random(seed)
+        while not self.stopping.is_set():
+            choice = random_.random()
+            if choice < 0.4:
+                Store.kodi_event_monitor.onNotification('xbmc', 'VideoLibrary.OnUpdate',
+                                                        json.dumps({'item':{'type':'episode', 'id':random_.randint(1, 50)}, 'playcount':0}))
+            elif choice < 0.6:
+                edit = {'command':'move', 'path':media_file(random_.randrange(self.media))}
+                Store.kodi_event_monitor.onNotification('plugin.switchback', 'Other.edit', json.dumps(edit))
+            elif choice < 0.9:
+                Store.kodi_event_monitor.onNotification('plugin.switchback', 'Other.refresh', '')
+            else:
+                Store.kodi_event_monitor.onSettingsChanged()
+            self.notifications += 1
+            time.sleep(0.0005)
+
+    def run(self) -> dict:
+        from resources.lib.events import ServiceEventQueue
+        from resources.lib.monitor import KodiEventMonitor
+        from resources.lib.player import KodiPlayer
+        from resources.lib.refresh import RefreshScheduler
+        from resources.lib.standby import StandbyTarget
+        from resources.lib.store import Store
+
+        import xbmc
+        xbmc.log_lines = ErrorLog()
+        # As the service starts up
+        self.kodi.conditions['Player.HasVideo'] = True
+        benchmark_runtime.write_switchback_list([])
+        Store()
+        Store.update_memory_watchdog()
+        Store.standby = StandbyTarget()
+        Store.standby.prepare()
+        Store.refresh_scheduler = RefreshScheduler(delay=0.001, settle_time=0.002)
+        Store.events = None if self.inline else ServiceEventQueue()
+        if Store.events:
+            Store.events.start()
+        Store.kodi_event_monitor = KodiEventMonitor()
+        Store.kodi_player = KodiPlayer()
+
+        threads = [threading.Thread(target=self.guarded(self.player_thread), name="player")]
+        threads += [threading.Thread(target=self.guarded(self.sampler_thread), name=f"sampler {index}") for index in range(self.threads)]
+        threads += [threading.Thread(target=self.guarded(lambda seed=index:self.notifier_thread(seed)), name=f"notifier {index}")
+                    for index in range(self.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # (As the service stops - the playbacks started by the events still waiting are enriched, and their results handled, too)
+        if Store.events:
+            Store.events.wait_idle(10)
+        Store.kodi_player.enricher.stop()
+        if Store.events:
+            Store.events.stop()
+        Store.refresh_scheduler.stop()
+        elapsed = time.perf_counter() - start
+
+        report = {
+                'mode':'inline' if self.inline else 'event worker',
+                'cycles':self.cycles,
+                'threads':self.threads,
+                'elapsed_s':elapsed,
+                'samples':self.samples,
+                'notifications':self.notifications,
+                'thread_errors':self.thread_errors[:10],
+                'errors_logged':xbmc.log_lines[:10],
+        }
+        if Store.events:
+            report.update({
+                    'events_posted':Store.events.posted,
+                    'events_handled':Store.events.handled,
+                    'events_per_second':Store.events.handled / elapsed,
+                    'events_dropped':Store.events.dropped,
+                    'control_events_lost':Store.events.lost,
+                    'worker_errors':Store.events.errors,
+                    'queue_high_water':Store.events.high_water,
+                    'longest_wait_ms':Store.events.longest_wait * 1000,
+            })
+        if Store.memory_watchdog:
+            diagnostics = Store.memory_watchdog.check()
+            Store.memory_watchdog.stop()
+            report['memory'] = {key:diagnostics[key] for key in ['checks', 'traced_mb', 'peak_mb', 'baseline_mb', 'growth_mb', 'threads',
+                                                                 'baseline_threads', 'thread_names', 'top_growth', 'history']}
+        report['checks'] = self.check(Store.events.errors if Store.events else 0, list(xbmc.log_lines), Store.events.lost if Store.events else 0)
+        Store.events = Store.standby = Store.refresh_scheduler = Store.memory_watchdog = None
+        xbmc.log_lines = None
+        return report
+
+    def check(self, worker_errors: int, errors_logged: list, events_lost: int) -> dict:
+        """
+        Check the final Switchback list - in memory (the service's), and on disk
+        """
+        from resources.lib.playback import Playback, FIELD_INDEX
+        from resources.lib.storage import open_storage
+        from resources.lib.store import Store
+        memory = [(playback.file, playback.resumetime) for playback in Store.switchback]
+        rows, _ = open_storage(Store.switchback.file, Playback.__slots__).load()
+        disk = [(row[FIELD_INDEX['file']], row[FIELD_INDEX['resumetime']]) for row in rows]
+        mismatched = [file for file, resumetime in disk
+                      if resumetime is not None and int(resumetime) // POSITION_RANGE != int(file.rsplit(' ', 1)[-1].split('.')[0])]
+        checks = {
+                'no_errors':not self.thread_errors and not worker_errors and not errors_logged and not events_lost,
+                'resume_points_match':not mismatched,
+                'memory_matches_disk':memory == disk,
+                'no_duplicates':len({file for file, _ in disk}) == len(disk),
+                'within_maximum_length':len(disk) <= Store.maximum_list_length,
+        }
+        checks['ok'] = all(checks.values())
+        checks['mismatched_resume_points'] = mismatched
+        return checks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress the Switchback service's event handling with interleaved callbacks from many threads")
+    parser.add_argument('--addons', help="Kodi addons directory holding the module dependencies (default: $KODI_ADDONS_PATH)")
+    parser.add_argument('--threads', type=int, default=8, help="how many sampler, and how many notifier, threads")
+    parser.add_argument('--cycles', type=int, default=200, help="how many playbacks to start and stop")
+    parser.add_argument('--media', type=int, default=8, help="how many different media items to play")
+    parser.add_argument('--jsonrpc-latency-ms', type=float, default=0.2, help="simulated latency of each JSON-RPC round trip")
+    parser.add_argument('--inline', action='store_true', help="no event worker - handle callbacks on the thread that makes them")
+    parser.add_argument('--sqlite', action='store_true', help="use the SQLite storage backend for the Switchback list")
+    parser.add_argument('--memory', action='store_true', help="run the memory watchdog too, and report its diagnostics")
+    parser.add_argument('--output', help="write the results to this JSON file (default: print them)")
+    arguments = parser.parse_args()
+
+    kodi = benchmark_runtime.install(arguments.addons)
+    kodi.jsonrpc_latency = arguments.jsonrpc_latency_ms / 1000
+    kodi.addon_settings['maximum_list_length'] = arguments.media
+    kodi.addon_settings['sqlite_storage'] = arguments.sqlite
+    kodi.addon_settings['watch_memory'] = arguments.memory
+    report = Stress(kodi, arguments.media, arguments.cycles, arguments.threads, arguments.inline, arguments.memory).run()
+
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+    sys.exit(0 if report['checks']['ok'] else 1)
+
+
+if __name__ == "__main__":
+    main()
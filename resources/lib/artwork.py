@@ -0,0 +1,213 @@
+import os
+import json
+import base64
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+from urllib.parse import quote, unquote
+
+from bossanova808.logger import Logger
+from bossanova808.utilities import get_kodi_setting, send_kodi_json
+
+# The source and artwork fields of a Playback.  The cache works on just these - read straight from the list with PlaybackList.fields,
+# so that warming or evicting doesn't decode every entry in the list
+ART_FIELDS = ('source', 'thumbnail', 'poster', 'fanart', 'icon')
+
+
+def art_of(playback) -> tuple:
+    """
+    :return: the source and artwork of a Playback, as a tuple of its ART_FIELDS
+    """
+    return tuple(getattr(playback, name) for name in ART_FIELDS)
+
+
+class ArtworkCache:
+    """
+    Warms Kodi's texture cache with the (remote/addon) artwork of recorded playbacks, in the background, so that the Switchback
+    listing and notifications don't render blank and then 'pop in' the artwork once Kodi has fetched and decoded it.
+
+    Kodi has no JSON-RPC method to add a texture to its cache, but requesting an image via Kodi's own webserver
+    (i.e. /image/<image://...>) caches it.  So this needs the Kodi webserver to be enabled (otherwise warming is skipped).
+
+    Only the textures this cache actually fetched are removed again (via Textures.RemoveTexture) when playbacks fall off the
+    Switchback list - the urls it fetched are kept in a file, so this holds across sessions.  Artwork that was already in the
+    texture cache, and the artwork of Kodi library entries (which Kodi caches itself, when it scrapes them), is never touched.
+    """
+
+    def __init__(self, file: Optional[str] = None, max_workers: int = 2, base_url: Optional[str] = None, timeout: float = 15):
+        """
+        :param file: (optional) the JSON file to keep the urls fetched into the texture cache in (they are loaded from it now, if it exists)
+        :param max_workers: the maximum number of artwork fetches in flight at once
+        :param base_url: (optional) the webserver base URL to fetch artwork via, e.g. a local stand-in for testing (default: Kodi's webserver)
+        :param timeout: timeout for each artwork fetch, in seconds
+        """
+        self.file = file
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="Switchback artwork")
+        self._base_url = base_url
+        self._authorization = None
+        self._timeout = timeout
+        # Urls requested so far this session (so they are not requested again)
+        self._requested = set()
+        # Urls this cache fetched into the texture cache (so are its to remove again) - and True if that has changed since it was saved
+        self._fetched = set()
+        self._lock = threading.Lock()
+        self.dirty = False
+        if file:
+            try:
+                with open(file, 'r', encoding='utf-8') as artwork_file:
+                    self._fetched = set(json.load(artwork_file).get('fetched', []))
+            except (OSError, ValueError, AttributeError, TypeError):
+                pass
+
+    @staticmethod
+    def _remote_art_urls(art: tuple, library: bool = False) -> List[str]:
+        """
+        :param art: the source and artwork of a Playback - see art_of
+        :param library: include the artwork of Kodi library entries (which is otherwise left to Kodi)
+        :return: the (unique, unwrapped) remote artwork urls of a Playback - local artwork is left to Kodi
+        """
+        source, *artwork = art
+        if source == "kodi_library" and not library:
+            return []
+        urls = []
+        for url in artwork:
+            if not url:
+                continue
+            if url.startswith('image://'):
+                url = unquote(url[len('image://'):].rstrip('/'))
+            if url.lower().startswith(('http://', 'https://')) and url not in urls:
+                urls.append(url)
+        return urls
+
+    def _get_base_url(self) -> Optional[str]:
+        """
+        :return: the base URL of Kodi's webserver, or None if it is not enabled
+        """
+        if self._base_url is None:
+            if not get_kodi_setting('services.webserver'):
+                Logger.info("Kodi webserver is not enabled, so Switchback cannot warm the texture cache with playback artwork")
+                self._base_url = ''
+            else:
+                self._base_url = f"http://127.0.0.1:{get_kodi_setting('services.webserverport')}"
+                username = get_kodi_setting('services.webserverusername')
+                password = get_kodi_setting('services.webserverpassword')
+                if username or password:
+                    self._authorization = 'Basic ' + base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
+        return self._base_url or None
+
+    @staticmethod
+    def _get_texture_ids(url: str) -> List[int]:
+        """
+        :return: the ids of any textures in Kodi's texture cache for this url
+        """
+        json_dict = {
+                "jsonrpc":"2.0",
+                "id":"Textures.GetTextures",
+                "method":"Textures.GetTextures",
+                "params":{
+                        "properties":["url"],
+                        "filter":{"field":"url", "operator":"is", "value":url},
+                },
+        }
+        properties_json = send_kodi_json(f'Get cached textures for {url}', json_dict)
+        if not properties_json or 'result' not in properties_json:
+            return []
+        return [texture['textureid'] for texture in properties_json['result'].get('textures', [])]
+
+    def _warm_url(self, url: str) -> None:
+        if self._get_texture_ids(url):
+            return
+        base_url = self._get_base_url()
+        if not base_url:
+            return
+        image_url = f"{base_url}/image/{quote('image://' + quote(url, safe='') + '/', safe='')}"
+        request = urllib.request.Request(image_url)
+        if self._authorization:
+            request.add_header('Authorization', self._authorization)
+        try:
+            with urllib.request.urlopen(request, timeout=self._timeout) as response:
+                response.read()
+            with self._lock:
+                self._fetched.add(url)
+                self.dirty = True
+            Logger.debug("Warmed texture cache with:", url)
+        except (urllib.error.URLError, OSError) as error:
+            Logger.warning(f"Unable to warm texture cache with [{url}]:", error)
+            # Allow a retry next time this artwork is needed
+            self._requested.discard(url)
+
+    def warm(self, artwork: Iterable[tuple]) -> None:
+        """
+        Queue the remote artwork of Playbacks to be fetched into Kodi's texture cache, in the background
+
+        :param artwork: the artwork of the Playbacks to warm - see art_of, or PlaybackList.fields(*ART_FIELDS)
+        """
+        if not self._get_base_url():
+            return
+        for art in artwork:
+            for url in self._remote_art_urls(art):
+                if url not in self._requested:
+                    self._requested.add(url)
+                    self._executor.submit(self._warm_url, url)
+
+    def _evict_url(self, url: str) -> None:
+        for texture_id in self._get_texture_ids(url):
+            json_dict = {
+                    "jsonrpc":"2.0",
+                    "id":"Textures.RemoveTexture",
+                    "method":"Textures.RemoveTexture",
+                    "params":{"textureid":texture_id},
+            }
+            send_kodi_json(f'Remove cached texture {url}', json_dict)
+        with self._lock:
+            self._fetched.discard(url)
+            self.dirty = True
+        Logger.debug("Evicted from texture cache:", url)
+
+    def evict(self, removed_artwork: Iterable[tuple], remaining_artwork: Iterable[tuple]) -> None:
+        """
+        Remove the remote artwork of Playbacks that have fallen off the Switchback list from Kodi's texture cache, in the background
+        (only artwork this cache fetched there itself - and not if it is still used by a Playback that remains on the list)
+
+        :param removed_artwork: the artwork of the Playbacks removed from the list - see art_of
+        :param remaining_artwork: the artwork of the Playbacks still on the list - see PlaybackList.fields(*ART_FIELDS)
+        """
+        removed_artwork = list(removed_artwork)
+        if not removed_artwork or not self._get_base_url():
+            return
+        # (Library entries' artwork still counts as used - it may well be the same as an addon's)
+        still_used = {url for art in remaining_artwork for url in self._remote_art_urls(art, library=True)}
+        with self._lock:
+            fetched = set(self._fetched)
+        for art in removed_artwork:
+            for url in self._remote_art_urls(art):
+                if url in fetched and url not in still_used:
+                    fetched.discard(url)
+                    self._requested.discard(url)
+                    self._executor.submit(self._evict_url, url)
+
+    def save(self) -> None:
+        """
+        Save the urls this cache has fetched into the texture cache to the file, if they have changed
+        """
+        if not self.file or not self.dirty:
+            return
+        with self._lock:
+            fetched = sorted(self._fetched)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            temporary_file = self.file + '.tmp'
+            with open(temporary_file, 'w', encoding='utf-8') as artwork_file:
+                json.dump({'fetched':fetched}, artwork_file, separators=(',', ':'))
+            os.replace(temporary_file, self.file)
+        except OSError as error:
+            Logger.error(f"Unable to save the fetched artwork urls [{self.file}]:", error)
+
+    def stop(self) -> None:
+        """
+        Stop the workers, abandoning any queued fetches
+        """
+        self._executor.shutdown(wait=False)
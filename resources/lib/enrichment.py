@@ -0,0 +1,84 @@
+import queue
+import threading
+
+from bossanova808.logger import Logger
+
+
+class PlaybackEnricher:
+    """
+    A single, long-lived, background worker that fills in the full details of newly started playbacks (see Playback.enrich_playback_details).
+    This keeps the (relatively slow) JSON-RPC/InfoLabel work off Kodi's player callback thread, so other player callbacks are not delayed.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        # id(Playback) -> Event, set once that Playback has been enriched
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, playback, item, gui: dict, on_enriched=None) -> None:
+        """
+        Queue a Playback to be enriched in the background
+
+        :param playback: the Playback (already with its minimal details captured)
+        :param item: the Kodi ListItem that is playing
+        :param gui: the GUI state when the playback started (see playback.capture_gui_state)
+        :param on_enriched: (optional) called with the Playback once it has been enriched
+        """
+        with self._lock:
+            self._pending[id(playback)] = threading.Event()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="Switchback playback enricher", daemon=True)
+                self._thread.start()
+        self._queue.put((playback, item, gui, on_enriched))
+
+    def wait(self, playback, timeout: float = 5.0) -> bool:
+        """
+        Wait for a Playback's enrichment to finish (if it is still pending)
+
+        :param playback: the Playback to wait for
+        :param timeout: maximum time to wait, in seconds
+        :return: True if the Playback is fully enriched (or was never queued), False if still pending after the timeout
+        """
+        with self._lock:
+            event = self._pending.get(id(playback))
+        if event is None:
+            return True
+        if not event.wait(timeout):
+            Logger.warning(f"Playback details still not available after {timeout}s - continuing with the details captured so far")
+            return False
+        return True
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the worker (once any queued Playbacks have been enriched)
+
+        :param timeout: maximum time to wait for the worker to finish, in seconds
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            playback, item, gui, on_enriched = job
+            try:
+                playback.enrich_playback_details(item, gui)
+            except Exception as error:
+                Logger.error("Error enriching playback details:", error)
+            finally:
+                with self._lock:
+                    event = self._pending.pop(id(playback), None)
+                if event:
+                    event.set()
+            # (Only once anyone waiting for the Playback has been released - on_enriched may e.g. post an event to the service's
+            # event worker, which may itself be waiting for this Playback)
+            if on_enriched:
+                try:
+                    on_enriched(playback)
+                except Exception as error:
+                    Logger.error("Error handling enriched playback:", error)
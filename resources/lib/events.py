@@ -0,0 +1,136 @@
+import queue
+import threading
+import time
+
+from bossanova808.logger import Logger
+
+
+class ServiceEventQueue:
+    """
+    (Service only) The service's single event worker.  Kodi's player and monitor callbacks, and the service's poll loop, only post
+    events here - the worker then handles them one at a time, in the order they were posted, and is the only thread that touches
+    the Switchback list and the current playback.  So there is nothing to lock, and e.g. a resume point sampled just as playback
+    stops is always handled before (or dropped after) the stop, never in the middle of it.
+
+    - Control events (playback stopped, list edits, settings changes...) are never dropped - losing one would lose e.g. a resume
+      point or a user's edit - so they are always queued, however many are already waiting.
+    - Events that are superseded by the next one anyway (e.g. resume point samples) can be posted as droppable, and are then simply
+      dropped once maximum_length events are waiting, so a worker that falls behind is not buried in them.
+    """
+
+    def __init__(self, maximum_length: int = 64):
+        """
+        :param maximum_length: how many events can be waiting before droppable events are dropped
+        """
+        self.maximum_length = maximum_length
+        # (Unbounded - so control events keep their order with the droppable ones, and never wait for room)
+        self._queue = queue.Queue()
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._thread = None
+        # Simple counters, e.g. for benchmarks & diagnostics
+        self.posted = 0
+        self.handled = 0
+        self.dropped = 0
+        # Non-droppable events that were dropped anyway (i.e. posted once the service was stopping)
+        self.lost = 0
+        self.errors = 0
+        # The most events ever waiting at once, and the longest any event waited to be handled (in seconds)
+        self.high_water = 0
+        self.longest_wait = 0.0
+
+    def start(self) -> None:
+        """
+        Start the worker
+        """
+        with self._lock:
+            self._stopping = False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="Switchback service events", daemon=True)
+                self._thread.start()
+
+    def on_worker(self) -> bool:
+        """
+        :return: True if called from the worker itself (i.e. from an event handler)
+        """
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def post(self, name: str, handler, *args, droppable: bool = False) -> bool:
+        """
+        Post an event, to be handled by the worker - handler(*args) is called there, after every event posted before it
+
+        :param name: the event name (for logging)
+        :param handler: the function that handles the event
+        :param args: the arguments to call it with - capture anything that may change (e.g. the player state) when posting, not when handling
+        :param droppable: drop the event if maximum_length events are already waiting
+        :return: True if the event was queued (or handled), False if it was dropped
+        """
+        # An event handler posting another event (e.g. via a callback) - just handle it now, it would only be next anyway
+        if self.on_worker():
+            handler(*args)
+            return True
+        if self._stopping:
+            Logger.debug(f"Service stopping - dropping event: {name}")
+            with self._lock:
+                self.dropped += 1
+                if not droppable:
+                    self.lost += 1
+            return False
+        if droppable and self._queue.qsize() >= self.maximum_length:
+            with self._lock:
+                self.dropped += 1
+            return False
+        self._queue.put((name, handler, args, time.perf_counter()))
+        with self._lock:
+            self.posted += 1
+            self.high_water = max(self.high_water, self._queue.qsize())
+        return True
+
+    def wait_idle(self, timeout: float = None) -> bool:
+        """
+        Wait for every event posted so far to be handled
+
+        :param timeout: (optional) maximum time to wait, in seconds
+        :return: True if they have all been handled, False if the timeout expired first
+        """
+        if self.on_worker():
+            return True
+        done = threading.Event()
+        if not self.post('idle', done.set):
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        Stop the worker, once the events already posted have been handled (anything posted after this is dropped)
+
+        :param timeout: maximum time to wait for the worker to finish, in seconds
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._stopping = True
+        self._queue.put(None)
+        thread.join(timeout)
+        if thread.is_alive():
+            Logger.warning(f"Service event worker still busy after {timeout}s - {self._queue.qsize()} events not handled")
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            name, handler, args, posted = event
+            waited = time.perf_counter() - posted
+            try:
+                handler(*args)
+            except Exception as error:
+                # Keep going - one bad event must not stop the service handling all the rest
+                Logger.error(f"Error handling service event {name}:", error)
+                with self._lock:
+                    self.errors += 1
+            finally:
+                with self._lock:
+                    self.handled += 1
+                    self.longest_wait = max(self.longest_wait, waited)
@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+import xbmc
+
+from bossanova808.logger import Logger
+
+
+class Timings:
+    """
+    Lightweight timing instrumentation - the durations of named spans are kept in in-memory ring buffers,
+    and can be summarised (count/p50/p95/max) and written to a stats file in the addon profile.
+
+    Time a block with:  with Timings.span('name'): ...
+    ...or a function with the decorator:  @timed('name')
+    """
+    # Samples kept per span
+    ring_size = 200
+    # span name -> deque of durations, in milliseconds
+    _spans = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def record(name: str, milliseconds: float) -> None:
+        with Timings._lock:
+            samples = Timings._spans.get(name)
+            if samples is None:
+                samples = Timings._spans[name] = deque(maxlen=Timings.ring_size)
+            samples.append(milliseconds)
+
+    @staticmethod
+    def span(name: str):
+        """
+        Context manager to time a block of code as the named span
+        """
+        return _Span(name)
+
+    @staticmethod
+    def summary(samples_by_span: dict = None) -> dict:
+        """
+        Summarise the recorded timings
+
+        :param samples_by_span: (optional) span name -> list of durations to summarise (default: the in-memory ring buffers)
+        :return: span name -> {count, p50_ms, p95_ms, max_ms, last_ms}
+        """
+        if samples_by_span is None:
+            with Timings._lock:
+                samples_by_span = {name:list(samples) for name, samples in Timings._spans.items()}
+        summary = {}
+        for name, samples in samples_by_span.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            summary[name] = {
+                    'count':len(ordered),
+                    'p50_ms':round(ordered[len(ordered) // 2], 3),
+                    'p95_ms':round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                    'max_ms':round(ordered[-1], 3),
+                    'last_ms':round(samples[-1], 3),
+            }
+        return summary
+
+    @staticmethod
+    def write(file: str, merge: bool = False) -> None:
+        """
+        Write the recorded timings (recent samples, and their summary) to a JSON stats file
+
+        :param file: the stats file
+        :param merge: merge with the samples already in the file (e.g. for the plugin, where each invocation is a new process)
+        """
+        with Timings._lock:
+            samples_by_span = {name:list(samples) for name, samples in Timings._spans.items()}
+        if merge:
+            try:
+                with open(file, 'r', encoding='utf-8') as stats_file:
+                    existing = json.load(stats_file).get('samples', {})
+                for name, samples in existing.items():
+                    samples_by_span[name] = (samples + samples_by_span.get(name, []))[-Timings.ring_size:]
+            except (OSError, ValueError, AttributeError):
+                pass
+
+        stats = {
+                'written':time.strftime('%Y-%m-%d %H:%M:%S'),
+                'summary':Timings.summary(samples_by_span),
+                'samples':{name:[round(sample, 3) for sample in samples] for name, samples in samples_by_span.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            temporary_file = file + '.tmp'
+            with open(temporary_file, 'w', encoding='utf-8') as stats_file:
+                json.dump(stats, stats_file, separators=(',', ':'))
+            os.replace(temporary_file, file)
+        except OSError:
+            pass
+
+
+class _Span:
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        Timings.record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def timed(name: str):
+    """
+    Decorator to time every call of a function as the named span
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class LatencyHistograms:
+    """
+    (Service only) What the user actually feels - how long each Switchback took, from the trigger (context menu, plugin, or listing click)
+    to the playback starting (KodiPlayer.onAVStarted), per Playback source (kodi_library, pvr_live, pvr_recording, addon, file).
+
+    The most recent samples per source are kept (so the histograms roll), are saved to a JSON file in the addon profile - so they survive
+    restarts, and can be compared before/after a change - and the file includes each source's histogram and summary, ready to export.
+    """
+    # Samples kept per source
+    ring_size = 500
+    # Histogram bucket upper bounds, in milliseconds (plus one for anything slower)
+    buckets = [100, 200, 300, 500, 750, 1000, 1500, 2000, 3000, 5000, 10000]
+
+    def __init__(self, file: str):
+        """
+        :param file: the JSON file to keep the samples in (they are loaded from it now, if it exists)
+        """
+        self.file = file
+        # source -> deque of [milliseconds, route, when (seconds since the epoch)]
+        self._samples = {}
+        self._lock = threading.Lock()
+        # True if there are samples not yet saved
+        self.dirty = False
+        try:
+            with open(file, 'r', encoding='utf-8') as latency_file:
+                for source, samples in json.load(latency_file).get('samples', {}).items():
+                    self._samples[source] = deque(samples, maxlen=LatencyHistograms.ring_size)
+        except (OSError, ValueError, AttributeError, TypeError):
+            pass
+
+    def record(self, source: str, milliseconds: float, route: str) -> None:
+        """
+        Record how long a Switchback took
+
+        :param source: the Playback source, e.g. kodi_library
+        :param milliseconds: from the trigger to the playback starting
+        :param route: how it was triggered, e.g. context_menu (see service_state.record_trigger)
+        """
+        with self._lock:
+            samples = self._samples.get(source)
+            if samples is None:
+                samples = self._samples[source] = deque(maxlen=LatencyHistograms.ring_size)
+            samples.append([round(milliseconds, 1), route, int(time.time())])
+            self.dirty = True
+
+    def histograms(self) -> dict:
+        """
+        :return: source -> {count, p50_ms, p95_ms, max_ms, histogram (bucket -> count), routes (route -> count)}
+        """
+        with self._lock:
+            samples_by_source = {source:list(samples) for source, samples in self._samples.items()}
+        histograms = {}
+        for source, samples in samples_by_source.items():
+            if not samples:
+                continue
+            ordered = sorted(sample[0] for sample in samples)
+            histogram = {f'<={bucket}ms':0 for bucket in LatencyHistograms.buckets}
+            histogram[f'>{LatencyHistograms.buckets[-1]}ms'] = 0
+            routes = {}
+            for milliseconds, route, _ in samples:
+                bucket = next((bucket for bucket in LatencyHistograms.buckets if milliseconds <= bucket), None)
+                histogram[f'<={bucket}ms' if bucket else f'>{LatencyHistograms.buckets[-1]}ms'] += 1
+                routes[route] = routes.get(route, 0) + 1
+            histograms[source] = {
+                    'count':len(ordered),
+                    'p50_ms':ordered[len(ordered) // 2],
+                    'p95_ms':ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    'max_ms':ordered[-1],
+                    'histogram':histogram,
+                    'routes':routes,
+            }
+        return histograms
+
+    def save(self) -> None:
+        """
+        Save the samples (and the histograms) to the file, if there are any new ones
+        """
+        if not self.dirty:
+            return
+        with self._lock:
+            samples_by_source = {source:list(samples) for source, samples in self._samples.items()}
+            self.dirty = False
+        latency = {
+                'written':time.strftime('%Y-%m-%d %H:%M:%S'),
+                'histograms':self.histograms(),
+                'samples':samples_by_source,
+        }
+        try:
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            temporary_file = self.file + '.tmp'
+            with open(temporary_file, 'w', encoding='utf-8') as latency_file:
+                json.dump(latency, latency_file, separators=(',', ':'))
+            os.replace(temporary_file, self.file)
+        except OSError:
+            pass
+
+
+class MemoryWatchdog:
+    """
+    (Service only) Watches the service's memory use for leaks - the service stays resident for the whole Kodi session (weeks, on an
+    always-on box), and replaces playbacks, the list, and threads all the time, so anything that is never let go adds up.
+
+    Uses tracemalloc: the first check takes a baseline snapshot, and each later check diffs a new snapshot against it, and writes the
+    biggest growers (by allocation site), the traced memory, and the live threads (by name), to a JSON diagnostics file in the
+    addon profile.  A warning is logged if the traced memory goes over the budget.
+
+    NB tracing slows every allocation down, and costs memory of its own - so this is for diagnosing, not for leaving on.
+    """
+    # How many allocation sites to report
+    top = 15
+    # Checks kept in the diagnostics file's history (so growth over time can be seen)
+    history_size = 200
+
+    def __init__(self, file: str, budget_mb: float = 0, frames: int = 1):
+        """
+        :param file: the JSON diagnostics file
+        :param budget_mb: warn if the traced memory goes over this, in megabytes (0 for no budget)
+        :param frames: how many stack frames to record per allocation (more frames, more detail - and more overhead)
+        """
+        self.file = file
+        self.budget_mb = budget_mb
+        self.frames = frames
+        self.checks = 0
+        self.over_budget = False
+        self._baseline = None
+        self._baseline_threads = 0
+        self._started = None
+        self._history = deque(maxlen=MemoryWatchdog.history_size)
+        # Only stop tracing if it was this that started it (e.g. not if Python was started with -X tracemalloc)
+        self._tracing = False
+
+    def start(self) -> None:
+        """
+        Start tracing allocations (as early as possible, so the traced memory covers as much of the service as possible)
+        """
+        # (Lazy import - only ever needed when the user has turned the watchdog on)
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._tracing = True
+        self._started = time.monotonic()
+
+    def stop(self) -> None:
+        """
+        Stop tracing allocations (which frees the memory tracing uses)
+        """
+        import tracemalloc
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        self._baseline = None
+
+    def check(self) -> dict:
+        """
+        Take a snapshot and compare it to the baseline (the first check just takes the baseline), write the diagnostics file,
+        and warn if over budget
+
+        :return: the diagnostics (as written to the file)
+        """
+        import tracemalloc
+        # (Not tracing - e.g. stopped since this was called for)
+        if not tracemalloc.is_tracing():
+            return {}
+        # (Leave out the allocations of tracemalloc itself, and of importing)
+        try:
+            snapshot = tracemalloc.take_snapshot()
+        except RuntimeError:
+            return {}
+        snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+                tracemalloc.Filter(False, '<unknown>'),
+        ])
+        threads = threading.enumerate()
+        baseline = self._baseline
+        if baseline is None:
+            baseline = self._baseline = snapshot
+            self._baseline_threads = len(threads)
+        self.checks += 1
+
+        megabyte = 1024 * 1024
+        traced, peak = tracemalloc.get_traced_memory()
+        baseline_size = sum(statistic.size for statistic in baseline.statistics('filename'))
+        growers = [statistic for statistic in snapshot.compare_to(baseline, 'lineno') if statistic.size_diff > 0]
+        thread_names = {}
+        for thread in threads:
+            # (Group numbered threads, e.g. a ThreadPoolExecutor's, together)
+            name = thread.name.rstrip('0123456789_- ') or thread.name
+            thread_names[name] = thread_names.get(name, 0) + 1
+        self._history.append([int(time.time()), round(traced / megabyte, 3), len(threads)])
+
+        diagnostics = {
+                'written':time.strftime('%Y-%m-%d %H:%M:%S'),
+                'checks':self.checks,
+                'traced_for_s':round(time.monotonic() - self._started, 1) if self._started else None,
+                'traced_mb':round(traced / megabyte, 3),
+                'peak_mb':round(peak / megabyte, 3),
+                'baseline_mb':round(baseline_size / megabyte, 3),
+                'growth_mb':round((sum(statistic.size for statistic in snapshot.statistics('filename')) - baseline_size) / megabyte, 3),
+                'budget_mb':self.budget_mb,
+                'threads':len(threads),
+                'baseline_threads':self._baseline_threads,
+                'thread_names':thread_names,
+                'top_growth':[{
+                        'site':f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}",
+                        'size_diff_kb':round(statistic.size_diff / 1024, 1),
+                        'size_kb':round(statistic.size / 1024, 1),
+                        'count_diff':statistic.count_diff,
+                } for statistic in growers[:MemoryWatchdog.top]],
+                'history':list(self._history),
+        }
+
+        # Warn when first over budget (and say when back under it), rather than at every check
+        over_budget = bool(self.budget_mb) and traced / megabyte > self.budget_mb
+        if over_budget and not self.over_budget:
+            top_site = diagnostics['top_growth'][0]['site'] if diagnostics['top_growth'] else 'unknown'
+            Logger.warning(f"Switchback service memory is over budget: {diagnostics['traced_mb']}MB traced (budget {self.budget_mb}MB), "
+                           f"{len(threads)} threads - biggest grower: {top_site} - see {self.file}")
+        elif self.over_budget and not over_budget:
+            Logger.info(f"Switchback service memory is back within budget: {diagnostics['traced_mb']}MB traced")
+        self.over_budget = over_budget
+        Logger.debug(f"Memory check: {diagnostics['traced_mb']}MB traced ({diagnostics['growth_mb']:+}MB since the baseline), {len(threads)} threads")
+
+        try:
+            os.makedirs(os.path.dirname(self.file), exist_ok=True)
+            temporary_file = self.file + '.tmp'
+            with open(temporary_file, 'w', encoding='utf-8') as diagnostics_file:
+                json.dump(diagnostics, diagnostics_file, indent=1)
+            os.replace(temporary_file, self.file)
+        except OSError:
+            pass
+        return diagnostics
+
+
+_debug_logging = {'enabled':False, 'checked':None}
+
+
+def debug_logging_enabled() -> bool:
+    """
+    Is Kodi's debug logging on?  Use this to skip formatting large structures (e.g. the whole Switchback list) for debug log lines
+    that would not be logged anyway.  (Checked at most once a minute)
+
+    :return: True if Kodi debug logging is enabled
+    """
+    now = time.monotonic()
+    if _debug_logging['checked'] is None or now - _debug_logging['checked'] > 60:
+        _debug_logging['enabled'] = xbmc.getCondVisibility('System.GetBool(debug.showloginfo)')
+        _debug_logging['checked'] = now
+    return _debug_logging['enabled']
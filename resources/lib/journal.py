@@ -0,0 +1,102 @@
+import os
+import json
+import time
+from typing import List
+
+from bossanova808.logger import Logger
+
+
+class CheckpointJournal:
+    """
+    An append-only journal of in-progress playback details, kept next to the Switchback list file.
+    This means the in-progress playback is not lost if Kodi crashes (or the power goes out) before onPlaybackFinished saves the list.
+
+    Each line is a compact JSON record - either a full 'playback' record (written when a playback starts), or a
+    checkpoint of just the path and resume point (written as playback progresses, at most every checkpoint_interval seconds).
+    Lines are only ever appended (never a full file rewrite), to keep writes cheap, e.g. on SD card based systems.
+
+    The journal is replayed into the list (and then cleared) when the service starts, and cleared whenever the list is saved after a playback finishes.
+    """
+
+    def __init__(self, file: str, checkpoint_interval: float = 10):
+        self.file = file
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint_time = 0.0
+        self._last_checkpoint_resumetime = None
+
+    def _append(self, record: dict) -> None:
+        """
+        Append a record to the journal, and make sure it actually reaches the disk
+
+        :param record: the record to append
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        try:
+            with open(self.file, 'a', encoding='utf-8') as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        except OSError as error:
+            Logger.error(f"Unable to write to checkpoint journal [{self.file}]:", error)
+
+    def start(self, playback) -> None:
+        """
+        Record the full details of a playback that has just started
+
+        :param playback: the Playback that has started
+        """
+        self._append({'playback':playback.to_dict()})
+        self._last_checkpoint_time = time.monotonic()
+        self._last_checkpoint_resumetime = playback.resumetime
+
+    def checkpoint(self, playback, force: bool = False) -> None:
+        """
+        Record the current resume point of the in-progress playback - if it has changed, and at most once every checkpoint_interval seconds
+
+        :param playback: the in-progress Playback
+        :param force: record it now, however recently the last checkpoint was written (e.g. as the service stops)
+        """
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint_time < self.checkpoint_interval:
+            return
+        resumetime = int(playback.resumetime) if playback.resumetime is not None else None
+        if resumetime == self._last_checkpoint_resumetime:
+            return
+        self._append({'path':playback.path, 'resumetime':resumetime, 'totaltime':playback.totaltime})
+        self._last_checkpoint_time = now
+        self._last_checkpoint_resumetime = resumetime
+
+    def replay(self) -> List[dict]:
+        """
+        Read back the journal records (a partially written final line, e.g. from a crash mid-write, is ignored)
+
+        :return: the list of journal records, oldest first
+        """
+        records = []
+        try:
+            with open(self.file, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        Logger.warning("Ignoring corrupt checkpoint journal line:", line)
+                        continue
+                    if isinstance(record, dict):
+                        records.append(record)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            Logger.error(f"Unable to read checkpoint journal [{self.file}]:", error)
+        return records
+
+    def clear(self) -> None:
+        """
+        Remove the journal (once its contents have been saved into the Switchback list file)
+        """
+        self._last_checkpoint_resumetime = None
+        try:
+            os.remove(self.file)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            Logger.error(f"Unable to remove checkpoint journal [{self.file}]:", error)
@@ -1,7 +1,16 @@
+import json
+
 from bossanova808.logger import Logger
+from resources.lib.playback import clear_totalseasons_cache
+from resources.lib.service_state import library_changed, SWITCHBACK_SENDER, SWITCHBACK_METHOD, REFRESH_METHOD, EDIT_METHOD
 from resources.lib.store import Store
 import xbmc
 
+# The Kodi library notifications the service acts on (see KodiEventMonitor.notification)...
+LIBRARY_METHODS = ['VideoLibrary.OnUpdate', 'VideoLibrary.OnRemove', 'VideoLibrary.OnScanFinished', 'VideoLibrary.OnCleanFinished']
+# ...and the requests from the Switchback plugin/context menu
+SWITCHBACK_METHODS = [SWITCHBACK_METHOD, REFRESH_METHOD, EDIT_METHOD]
+
 
 class KodiEventMonitor(xbmc.Monitor):
 
@@ -10,6 +19,76 @@ class KodiEventMonitor(xbmc.Monitor):
         xbmc.Monitor.__init__(self)
         Logger.debug('Monitor __init__')
 
+    # The monitor callbacks just post an event - the service's event worker does the actual work (see ServiceEventQueue)
     def onSettingsChanged(self):
+        Store.post_event('settings changed', self.settings_changed)
+
+    def onNotification(self, sender, method, data):
+        # Kodi sends a great many notifications the service has no interest in - only those it handles are posted, so that a burst
+        # of the others can't pile up in the event queue (and so hold up the events that matter)
+        if method not in LIBRARY_METHODS and not (sender == SWITCHBACK_SENDER and method in SWITCHBACK_METHODS):
+            return
+        Store.post_event(f'notification {method}', self.notification, sender, method, data)
+
+    # (Event worker) The addon settings have changed
+    def settings_changed(self):
         Logger.info('onSettingsChanged - reload them.')
         Store.load_config_from_settings()
+        Store.update_memory_watchdog()
+        Store.switch_storage()
+        Store.publish_snapshot()
+        if Store.standby:
+            Store.standby.prepare()
+
+    # (Event worker) A Kodi notification - from Kodi itself, or from the Switchback plugin/context menu
+    def notification(self, sender, method, data):
+        # Instant Switchback request, e.g. from the context menu or a keymap: NotifyAll(plugin.switchback,switchback)
+        if sender == SWITCHBACK_SENDER and method == SWITCHBACK_METHOD:
+            Logger.info("Instant Switchback requested")
+            if Store.standby:
+                Store.standby.play()
+            return
+        # Refresh request, e.g. from the plugin after deleting an item from the list
+        if sender == SWITCHBACK_SENDER and method == REFRESH_METHOD:
+            if Store.refresh_scheduler:
+                Store.refresh_scheduler.request()
+            return
+        # Edit of the Switchback list, from the plugin - the service is the only writer of the list while it is running
+        if sender == SWITCHBACK_SENDER and method == EDIT_METHOD:
+            try:
+                edit = json.loads(data)
+            except (ValueError, TypeError):
+                Logger.error("Invalid Switchback list edit:", data)
+                return
+            Logger.info("Switchback list edit requested:", edit)
+            Store.apply_edit(edit)
+            return
+
+        # The number of seasons of TV shows is cached - so clear that if the library changes
+        if method in ['VideoLibrary.OnScanFinished', 'VideoLibrary.OnCleanFinished', 'VideoLibrary.OnRemove']:
+            Logger.debug(f'{method} - clearing cached TV show season counts')
+            clear_totalseasons_cache()
+
+        # A single library item has changed (e.g. been marked as watched, or had its resume point updated), or been removed -
+        # so bring just that entry (if it is in the list) up to date, rather than re-checking the whole list against the library.
+        # (Player events are handled by KodiPlayer - and the entry for a playback is always re-checked once it is recorded)
+        if method in ['VideoLibrary.OnUpdate', 'VideoLibrary.OnRemove']:
+            try:
+                details = json.loads(data)
+                item = details.get('item', details)
+                media_type, dbid = item['type'], int(item['id'])
+            except (ValueError, TypeError, KeyError, AttributeError):
+                Logger.debug(f'{method} - no library item in notification data:', data)
+                return
+            if Store.switchback.reconcile_library_item(media_type, dbid, removed=method == 'VideoLibrary.OnRemove'):
+                Logger.debug(f'{method} - updated the Switchback list entry for {media_type} {dbid}')
+                Store.list_changed()
+            else:
+                # (Just the entry's library check stamp is new - saved all the same, see Store.check_library)
+                Store.switchback.save_to_file()
+
+        # The library may have changed wholesale, so every library entry needs checking against it again - done now, once, rather than
+        # by every listing of the plugin until the list is next saved
+        elif method in ['VideoLibrary.OnScanFinished', 'VideoLibrary.OnCleanFinished']:
+            library_changed()
+            Store.check_library()
@@ -1,48 +1,106 @@
 import os
 import json
-from dataclasses import dataclass, asdict
-from typing import List, Optional
+import time
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import xbmc
 import xbmcgui
 import xbmcvfs
 
 # noinspection PyPackages
-from bossanova808.utilities import clean_art_url, send_kodi_json, get_resume_point, get_playcount, get_advancedsetting
+from bossanova808.utilities import clean_art_url, send_kodi_json, get_advancedsetting
 # noinspection PyPackages
 from bossanova808.logger import Logger
 # noinspection PyUnresolvedReferences
-from infotagger.listitem import ListItemInfoTag
+from resources.lib.instrumentation import timed, debug_logging_enabled
+from resources.lib.storage import open_storage
 
-@dataclass
 class Playback:
     """
     Stores whatever data we can grab about a Kodi Playback so that we can display it nicely in the Switchback list
+
+    Slotted (rather than a dataclass) to keep these compact, as the service holds them for the whole Kodi session.
+    The field order here is also the compact 'row' encoding used in the Switchback list file (see to_row/from_row).
     """
-    file: Optional[str] = None
-    path: Optional[str] = None
-    type: Optional[str] = None  # episode, movie, video (per Kodi types) - song is the other type, but Switchback supports video only
-    source: Optional[str] = None  # kodi_library, pvr_live, pvr_recording, addon, file
-    dbid: Optional[int] = None
-    tvshowdbid: Optional[int] = None
-    totalseasons: Optional[int] = None
-    title: Optional[str] = None
-    label: Optional[str] = None
-    label2: Optional[str] = None
-    thumbnail: Optional[str] = None
-    fanart: Optional[str] = None
-    poster: Optional[str] = None
-    icon: Optional[str] = None
-    year: Optional[int] = None
-    showtitle: Optional[str] = None
-    season: Optional[int] = None
-    episode: Optional[int] = None
-    resumetime: Optional[int] = None
-    totaltime: Optional[int] = None
-    duration: Optional[int] = None
-    channelname: Optional[str] = None
-    channelnumberlabel: Optional[str] = None
-    channelgroup: Optional[str] = None
+    __slots__ = (
+            'file',
+            'path',
+            'type',  # episode, movie, video (per Kodi types) - song is the other type, but Switchback supports video only
+            'source',  # kodi_library, pvr_live, pvr_recording, addon, file
+            'dbid',
+            'tvshowdbid',
+            'totalseasons',
+            'title',
+            'label',
+            'label2',
+            'thumbnail',
+            'fanart',
+            'poster',
+            'icon',
+            'year',
+            'showtitle',
+            'season',
+            'episode',
+            'resumetime',
+            'totaltime',
+            'duration',
+            'channelname',
+            'channelnumberlabel',
+            'channelgroup',
+            'checked',  # when (seconds since the epoch) a library Playback was last checked against the Kodi library (see PlaybackList.load_or_init)
+            'channelid',  # the Kodi PVR channel id of a live PVR Playback - for switching straight back to the channel, see play_pvr_channel
+    )
+
+    def __init__(self, **details):
+        """
+        Create a Playback, e.g. Playback(path=..., file=...) - all fields not given are None
+
+        :raises TypeError: if given an unknown field
+        """
+        for field in Playback.__slots__:
+            setattr(self, field, None)
+        for field, value in details.items():
+            if field not in FIELD_INDEX:
+                raise TypeError(f"Playback got an unexpected field '{field}'")
+            setattr(self, field, value)
+
+    def __repr__(self) -> str:
+        return f"Playback({', '.join(f'{field}={getattr(self, field)!r}' for field in Playback.__slots__)})"
+
+    def __eq__(self, other) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_row() == other.to_row()
+
+    # (Mutable, so not hashable - as per the dataclass this used to be)
+    __hash__ = None
+
+    def to_row(self) -> list:
+        """
+        Return the Playback as a compact row - its field values in field order, with any trailing None values dropped
+
+        :return: list of field values
+        """
+        row = [getattr(self, field) for field in Playback.__slots__]
+        while row and row[-1] is None:
+            row.pop()
+        return row
+
+    @staticmethod
+    def from_row(row: list) -> 'Playback':
+        """
+        Create a Playback from a compact row (see to_row)
+
+        :param row: list of field values, in field order
+        :return: the Playback
+        """
+        playback = Playback.__new__(Playback)
+        for field, value in itertools.zip_longest(Playback.__slots__, row[:len(Playback.__slots__)]):
+            setattr(playback, field, value)
+        return playback
 
     @property
     def pluginlabel(self) -> str:
@@ -85,10 +143,45 @@ class Playback:
 
         return label
 
-    def _is_addon_playback(self) -> bool:
+    @property
+    def identities(self) -> List[str]:
+        """
+        The normalised identity keys for this Playback, used to match the same media however it was played back
+        (e.g. a library episode played from the library, via a widget, or directly from the file)
+
+        :return: list of identity keys, most specific first
+        """
+        return Playback.identities_of_row(self.to_row())
+
+    @staticmethod
+    def identities_of_row(row: list) -> List[str]:
+        """
+        The normalised identity keys (see identities above) of a Playback in compact row form, without needing to create the Playback
+
+        :param row: the Playback, as a compact row (see to_row)
+        :return: list of identity keys, most specific first
+        """
+        dbid, media_type, source, path, file = (row[FIELD_INDEX[field]] if FIELD_INDEX[field] < len(row) else None
+                                                for field in ('dbid', 'type', 'source', 'path', 'file'))
+        identities = []
+        if dbid and media_type:
+            identities.append(f"db:{media_type}:{dbid}")
+        # PVR channel paths include the channel group the channel was played from - so use just the channel part
+        # e.g. pvr://channels/tv/All channels/pvr.hts_1234.pvr -> pvr.hts_1234.pvr
+        if source == "pvr_live" and path:
+            identities.append(f"pvr:{path.rstrip('/').rsplit('/', 1)[-1]}")
+        # Addon & live PVR 'files' are resolved URLs that may include tokens etc., so don't match on those
+        if file and source not in ["addon", "pvr_live"]:
+            identities.append(f"file:{file}")
+        if path:
+            identities.append(f"path:{path}")
+        return identities
+
+    def _is_addon_playback(self, gui: dict) -> bool:
         """
         Determine if playback originates from an addon
 
+        :param gui: the GUI state when the playback started - see capture_gui_state
         :return: True if playback is from an addon, False otherwise
         """
         path_lower = (self.path or '').lower()
@@ -98,17 +191,17 @@ class Playback:
             return True
 
         # Method 2: Check ListItem.Path infolabel for plugin URLs
-        listitem_path_lower = xbmc.getInfoLabel('ListItem.Path').lower()
+        listitem_path_lower = gui['listitem_path'].lower()
         if listitem_path_lower.startswith('plugin://'):
             return True
 
         # Method 3: Check if an addon ID is associated with the current item
-        addon_id = xbmc.getInfoLabel('ListItem.Property(Addon.ID)')
+        addon_id = gui['addon_id']
         if addon_id:
             return True
 
         # Method 4: Check container path (for addon-generated content)
-        container_path_lower = xbmc.getInfoLabel('Container.FolderPath').lower()
+        container_path_lower = gui['container_path'].lower()
         if container_path_lower.startswith('plugin://'):
             return True
 
@@ -124,11 +217,6 @@ class Playback:
                 if any(indicator in path_lower for indicator in ('plugin', 'addon')):
                     Logger.debug("Classified as addon via HTTP fallback heuristic", path_lower)
                     return True
-            # If we still have an Addon.ID or container is a plugin, treat as addon
-            addon_id_http = xbmc.getInfoLabel('ListItem.Property(Addon.ID)')
-            container_path_lower_http = xbmc.getInfoLabel('Container.FolderPath').lower()
-            if addon_id_http or container_path_lower_http.startswith('plugin://'):
-                return True
             # Accept loopback hosts commonly used by addon proxy/resolvers
             if any(host in path_lower for host in ('127.0.0.1', 'localhost', '[::1]')):
                 Logger.debug("Classified as addon via localhost HTTP fallback", path_lower)
@@ -143,57 +231,201 @@ class Playback:
         :param new_details: a dictionary (need not be complete) of the Playback object's new details
         """
         for key, value in new_details.items():
-            if hasattr(self, key):
+            if key in FIELD_INDEX:
                 setattr(self, key, value)
             else:
                 Logger.error(f"Playback.update: Unknown key [{key}]")
 
+    def to_dict(self) -> dict:
+        """
+        Return the Playback object as a compact dict, i.e. without any fields that are None
+
+        :return: dict of the Playback's (non-None) fields
+        """
+        return {field:getattr(self, field) for field in Playback.__slots__ if getattr(self, field) is not None}
+
     def toJson(self) -> str:
         """
         Return the Playback object as JSON
 
         :return: the Playback object as JSON
         """
-        return json.dumps(asdict(self), ensure_ascii=False, indent=2)
+        return json.dumps({field:getattr(self, field) for field in Playback.__slots__}, ensure_ascii=False, indent=2)
 
-    def update_playback_details(self, file: str, item: xbmcgui.ListItem) -> None:
+    @timed('Playback.capture_playback_details')
+    def capture_playback_details(self, file: str, item: xbmcgui.ListItem, player: xbmc.Player) -> None:
         """
-        Update the Playback object with details from a playing Kodi ListItem object and InfoLabels
+        Capture the minimal details of a playback that has just started - what is playing, and where we are up to.
+        This is cheap, so it can be done directly in the player's onAVStarted callback.
 
         :param file: the current file Kodi is playing (from xbmc.Player().getPlayingFile())
         :param item: the current Kodi playing item (from xbmc.Player().getPlayingItem())
+        :param player: the Kodi player
         """
-
         self.path = item.getPath()
         self.file = file
         self.label = item.getLabel()
         self.label2 = item.getLabel2()
+        # Updated as playback progresses (see switchback_service.py), but initialise here in case of early exits etc.
+        # Getting from the player directly is more reliable than using item.getVideoInfoTag() etc
+        self.totaltime = self.duration = int(player.getTotalTime())
+        self.resumetime = int(player.getTime())
 
-        # Updated as playback progresses (see switchback_service.py), but initialise here in cast of early exits etc.
-        if self.source != "pvr_live":
-            # Getting from the player directly is more reliable than using item.getVideoInfoTag() etc
-            self.totaltime = self.duration = int(xbmc.Player().getTotalTime())
-            self.resumetime = int(xbmc.Player().getTime())
+    @timed('Playback.enrich_playback_details')
+    def enrich_playback_details(self, item: xbmcgui.ListItem, gui: dict) -> None:
+        """
+        Fill in the rest of the Playback details (source, titles, artwork, library ids, etc.), after capture_playback_details.
+        This uses a single Player.GetItem JSON-RPC call (falling back to InfoLabels if that fails), so is best done in the background.
+        But by then, Kodi may be playing something else (e.g. when channel surfing) - so if what is playing is no longer this playback's
+        file, only the details captured when it started are used.
 
-        # Determine the Playback source - Kodi Library (...get DBID), PVR, Addon, or Non-Library file?
-        dbid_label = xbmc.getInfoLabel('VideoPlayer.DBID')
-        try:
-            self.dbid = int(dbid_label) if dbid_label else None
-        except ValueError:
-            self.dbid = None
+        :param item: the Kodi playing item, when the playback started (from xbmc.Player().getPlayingItem())
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        """
+        details = get_playing_item_details()
+        if details is not None:
+            # (Player.GetItem's id is a library id only for library items - for e.g. PVR channels it is the channel id)
+            playing_dbid = details.get('id') if details.get('type') in LIBRARY_DETAILS_METHODS else None
+            if not self._is_still_playing(details.get('file'), playing_dbid, gui):
+                Logger.warning(f"Playing item has changed (now [{details.get('file') or details.get('label')}]) - using only the captured details for [{self.file}]")
+                self._update_details_from_capture(item, gui)
+            else:
+                self._update_details_from_playing_item(details, item, gui)
+        else:
+            if not self._is_still_playing(xbmc.getInfoLabel('Player.Filenameandpath'), xbmc.getInfoLabel('VideoPlayer.DBID'), gui):
+                Logger.warning(f"Player.GetItem failed, and the playing item has changed - using only the captured details for [{self.file}]")
+                self._update_details_from_capture(item, gui)
+            else:
+                Logger.warning("Player.GetItem failed - falling back to InfoLabels for playback details")
+                self._update_details_from_infolabels(item, gui)
+
+        # Episodes -> we also want the number of seasons so we can force-browse to the appropriate spot after a Switchback initiated playback
+        if self.tvshowdbid:
+            self.totalseasons = get_totalseasons(self.tvshowdbid, self.showtitle)
+
+    def _is_still_playing(self, file: Optional[str], dbid, gui: dict) -> bool:
+        """
+        Is what Kodi is playing now still this playback?  Compared on the identity captured when it started (see capture_gui_state) -
+        not just on the playing file, as library items played via e.g. .strm files or stack:// paths play a different file to the
+        library item's own.
 
+        :param file: the file of what is playing now (from Player.GetItem, or Player.Filenameandpath), if known
+        :param dbid: the library id of what is playing now (from Player.GetItem, or VideoPlayer.DBID), if known
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        :return: True if it is still this playback (or it can't be told otherwise)
+        """
+        dbid, playing_dbid = library_id(dbid), library_id(gui.get('playing_dbid'))
+        if dbid and playing_dbid:
+            return dbid == playing_dbid
+        return not file or file in [self.file, self.path, gui.get('playing_file')]
+
+    def _determine_source(self, is_pvr_channel: bool, gui: dict) -> None:
+        """
+        Determine the Playback source - Kodi Library (i.e. has a DBID), PVR, Addon, or Non-Library file?
+
+        :param is_pvr_channel: True if the playing item is a live PVR channel
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        """
         if self.dbid:
             self.source = "kodi_library"
-        elif xbmc.getCondVisibility('PVR.IsPlayingTV') or xbmc.getCondVisibility('PVR.IsPlayingRadio'):
+        elif is_pvr_channel:
             self.source = "pvr_live"
         elif (self.path or '').lower().startswith('pvr://recordings/'):
             self.source = "pvr_recording"
-        elif self._is_addon_playback():
+        elif self._is_addon_playback(gui):
             self.source = "addon"
         else:
             Logger.debug("Not from Kodi library, PVR, or addon - treating as a non-library media file")
             self.source = "file"
 
+    def _update_details_from_capture(self, item: xbmcgui.ListItem, gui: dict) -> None:
+        """
+        Update the Playback details from just what was captured when the playback started (this is the fallback if Kodi has already
+        moved on to playing something else - so Player.GetItem and the InfoLabels would describe that instead)
+
+        :param item: the Kodi playing item, when the playback started
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        """
+        self.dbid = None
+        self._determine_source((self.path or '').lower().startswith('pvr://channels/'), gui)
+        self.title = self.label
+        self.type = "video"
+        self.thumbnail = clean_art_url(item.getArt('thumb') or '')
+        self.icon = clean_art_url(item.getArt('icon') or '')
+        self.poster = clean_art_url(item.getArt('poster') or item.getArt('thumb') or '')
+        self.fanart = clean_art_url(item.getArt('fanart') or '')
+
+    def _update_details_from_playing_item(self, details: dict, item: xbmcgui.ListItem, gui: dict) -> None:
+        """
+        Update the Playback details from the result of a Player.GetItem JSON-RPC call
+
+        :param details: the 'item' from the Player.GetItem result
+        :param item: the Kodi playing item, when the playback started (from xbmc.Player().getPlayingItem())
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        """
+        item_type = details.get('type')
+        item_id = details.get('id')
+        self.dbid = item_id if item_type in LIBRARY_DETAILS_METHODS and isinstance(item_id, int) and item_id > 0 else None
+        is_pvr_channel = item_type == 'channel'
+        self._determine_source(is_pvr_channel, gui)
+
+        # TITLE
+        if self.source != "pvr_live":
+            self.title = details.get('title') or details.get('label')
+        else:
+            self.title = details.get('channel') or details.get('label')
+
+        # MEDIA TYPE (see also source above, e.g. to distinguish PVR from non library video)
+        # Infotagger/Kodi expect mediatype in {"video","movie","tvshow","season","episode","musicvideo"}.
+        self.showtitle = details.get('showtitle') or None
+        if self.showtitle:
+            self.type = "episode"
+            tvshowdbid = details.get('tvshowid')
+            self.tvshowdbid = tvshowdbid if isinstance(tvshowdbid, int) and tvshowdbid > 0 else None
+        elif self.dbid:
+            self.type = "movie"
+        else:
+            self.type = "video"  # use standard mediatype; PVR tracked via self.source
+
+        # ARTWORK - POSTER, FANART THUMBNAIL and ICON
+        art = details.get('art') or {}
+        self.poster = clean_art_url(art.get('tvshow.poster') or art.get('poster') or art.get('thumb') or '')
+        self.fanart = clean_art_url(art.get('fanart') or details.get('fanart') or '')
+        self.thumbnail = clean_art_url(art.get('thumb') or details.get('thumbnail') or item.getArt('thumb') or '')
+        self.icon = clean_art_url(art.get('icon') or item.getArt('icon') or '')
+
+        # OTHER DETAILS
+        # PVR Live/Recordings
+        self.channelname = details.get('channel') or None
+        channelnumber = details.get('channelnumber')
+        self.channelnumberlabel = str(channelnumber) if channelnumber else None
+        self.channelgroup = (gui['channel_group'] or None) if self.channelname else None
+        # (For live PVR, Player.GetItem's id is the channel id)
+        self.channelid = item_id if is_pvr_channel and isinstance(item_id, int) and item_id > 0 else None
+        # Episodes & Movies (Kodi uses 0/-1 for 'not set')
+        year = details.get('year')
+        self.year = year if isinstance(year, int) and year > 0 else None
+        season = details.get('season')
+        self.season = season if self.showtitle and isinstance(season, int) and season >= 0 else None
+        episode = details.get('episode')
+        self.episode = episode if self.showtitle and isinstance(episode, int) and episode >= 0 else None
+
+    def _update_details_from_infolabels(self, item: xbmcgui.ListItem, gui: dict) -> None:
+        """
+        Update the Playback details from InfoLabels (this is the fallback if Player.GetItem fails)
+
+        :param item: the Kodi playing item, when the playback started (from xbmc.Player().getPlayingItem())
+        :param gui: the GUI state when the playback started - see capture_gui_state
+        """
+        # Determine the Playback source - Kodi Library (...get DBID), PVR, Addon, or Non-Library file?
+        dbid_label = xbmc.getInfoLabel('VideoPlayer.DBID')
+        try:
+            self.dbid = int(dbid_label) if dbid_label else None
+        except ValueError:
+            self.dbid = None
+
+        self._determine_source(xbmc.getCondVisibility('PVR.IsPlayingTV') or xbmc.getCondVisibility('PVR.IsPlayingRadio'), gui)
+
         # TITLE
         if self.source != "pvr_live":
             self.title = xbmc.getInfoLabel('VideoPlayer.Title')
@@ -229,7 +461,7 @@ class Playback:
         # PVR Live/Recordings
         self.channelname = xbmc.getInfoLabel('VideoPlayer.ChannelName')
         self.channelnumberlabel = xbmc.getInfoLabel('VideoPlayer.ChannelNumberLabel')
-        self.channelgroup = xbmc.getInfoLabel('VideoPlayer.ChannelGroup')
+        self.channelgroup = gui['channel_group']
         # Episodes & Movies
         year_label = xbmc.getInfoLabel('VideoPlayer.Year')
         try:
@@ -248,47 +480,22 @@ class Playback:
             self.episode = int(episode_label) if episode_label else None
         except ValueError:
             self.episode = None
-        # Episodes -> we also want the number of seasons so we can force-browse to the appropriate spot after a Swtichback initiated playback
-        if self.tvshowdbid:
-            json_dict = {
-                    "jsonrpc":"2.0",
-                    "id":"VideoLibrary.GetSeasons",
-                    "method":"VideoLibrary.GetSeasons",
-                    "params":{
-                            "tvshowid":self.tvshowdbid,
-                    },
-            }
-
-            properties_json = send_kodi_json(f'Get seasons details for tv show {self.showtitle}', json_dict)
-            if not properties_json or 'result' not in properties_json:
-                Logger.error("VideoLibrary.GetSeasons returned no result")
-                self.totalseasons = None
-                # Continue without seasons info
-                return
-
-            if 'error' in properties_json:
-                Logger.error("VideoLibrary.GetSeasons returned error:", properties_json['error'])
-                self.totalseasons = None
-                return
-            properties = properties_json['result']
-
-            # {'limits': {'end': 2, 'start': 0, 'total': 2}, 'seasons': [...]}
-            total_limit = properties.get('limits', {}).get('total')
-            self.totalseasons = total_limit if isinstance(total_limit, int) else None
-            if self.totalseasons is None and 'seasons' in properties:
-                self.totalseasons = len(properties['seasons'])
 
     # noinspection PyMethodMayBeStatic
-    def create_list_item_from_playback(self) -> xbmcgui.ListItem:
+    def create_list_item_from_playback(self, offscreen: bool = False) -> xbmcgui.ListItem:
         """
         Create a Kodi ListItem object from a Playback object
 
+        :param offscreen: True if the ListItem is not for display in a list, e.g. it is to be resolved/played straight away.
+                          Kodi can then create it without taking the GUI lock, and the info tag is set directly, rather than via
+                          infotagger (which is then not even imported - this keeps Switchback mode's cold start down)
         :return: ListItem: a Kodi ListItem object constructed from the Playback object
         """
 
-        Logger.debug("Creating list item from playback:", self)
+        if debug_logging_enabled():
+            Logger.debug("Creating list item from playback:", self)
 
-        list_item = xbmcgui.ListItem(label=self.pluginlabel, path=self.file if self.source not in ["addon", "pvr_live"] else self.path)
+        list_item = xbmcgui.ListItem(label=self.pluginlabel, path=self.file if self.source not in ["addon", "pvr_live"] else self.path, offscreen=offscreen)
         art = {key:value for key, value in {"thumb":self.thumbnail, "poster":self.poster, "fanart":self.fanart, "icon":self.icon}.items() if value}
         if art:
             list_item.setArt(art)
@@ -300,49 +507,667 @@ class Playback:
             return list_item
 
         # Otherwise, it's an episode/movie/file etc...set the InfoVideoTag stuff
-        tag = ListItemInfoTag(list_item, "video")
         duration_seconds = None
         if self.duration is not None:
             duration_seconds = self.duration
         elif self.totaltime is not None:
             duration_seconds = self.totaltime
 
-        # Infotagger seems the best way to do this currently as is well tested
-        # I found directly setting things on InfoVideoTag to be buggy/inconsistent
-        infolabels = {
-                'mediatype':self.type,
-                'dbid':self.dbid,
-                'title':self.title,
-                'path':self.path,
-                'year':self.year,
-                'tvshowtitle':self.showtitle,
-                'episode':self.episode,
-                'season':self.season,
-                'duration':duration_seconds,
-        }
-        tag.set_info(infolabels)
+        if not offscreen or not self._set_video_info_tag(list_item, duration_seconds):
+            # Infotagger seems the best way to do this currently as is well tested
+            # I found directly setting things on InfoVideoTag to be buggy/inconsistent
+            # (Imported here, as it is comparatively expensive to import, and not needed by e.g. Switchback or delete mode)
+            from infotagger.listitem import ListItemInfoTag
+            tag = ListItemInfoTag(list_item, "video")
+            infolabels = {
+                    'mediatype':self.type,
+                    'dbid':self.dbid,
+                    'title':self.title,
+                    'path':self.path,
+                    'year':self.year,
+                    'tvshowtitle':self.showtitle,
+                    'episode':self.episode,
+                    'season':self.season,
+                    'duration':duration_seconds,
+            }
+            tag.set_info(infolabels)
+
+            # Required, otherwise immediate Switchback mode won't resume properly
+            # These keys are correct, even if CodeRabbit says they are not - see https://github.com/jurialmunkey/script.module.infotagger/blob/f138c1dd7201a8aff7541292fbfc61ed7b3a9aa1/resources/modules/infotagger/listitem.py#L204
+            tag.set_resume_point({'ResumeTime':float(self.resumetime or 0.0), 'TotalTime':float(self.totaltime or 0.0)})
 
-        # Required, otherwise immediate Switchback mode won't resume properly
-        # These keys are correct, even if CodeRabbit says they are not - see https://github.com/jurialmunkey/script.module.infotagger/blob/f138c1dd7201a8aff7541292fbfc61ed7b3a9aa1/resources/modules/infotagger/listitem.py#L204
-        tag.set_resume_point({'ResumeTime':float(self.resumetime or 0.0), 'TotalTime':float(self.totaltime or 0.0)})
         if self.tvshowdbid:
             list_item.setProperty('tvshowdbid', str(self.tvshowdbid))
 
         return list_item
 
+    def _set_video_info_tag(self, list_item: xbmcgui.ListItem, duration_seconds: Optional[int]) -> bool:
+        """
+        Set just the video info tag details needed to play (and resume) this Playback, directly on the ListItem's InfoTagVideo.
+        Like infotagger, only values that are actually known are set - setting empty values is what makes the InfoTagVideo
+        setters unreliable.
+
+        :param list_item: the ListItem to set the details on
+        :param duration_seconds: the duration of the Playback, if known
+        :return: True if the details were set, False if this Kodi does not have the InfoTagVideo setters (i.e. Kodi 19)
+        """
+        try:
+            tag = list_item.getVideoInfoTag()
+            if self.type:
+                tag.setMediaType(self.type)
+            if self.dbid:
+                tag.setDbId(int(self.dbid))
+            if self.title:
+                tag.setTitle(self.title)
+            if self.path:
+                tag.setPath(self.path)
+            if self.year:
+                tag.setYear(int(self.year))
+            if self.showtitle:
+                tag.setTvShowTitle(self.showtitle)
+            if self.season is not None:
+                tag.setSeason(int(self.season))
+            if self.episode is not None:
+                tag.setEpisode(int(self.episode))
+            if duration_seconds:
+                tag.setDuration(int(duration_seconds))
+            # Required, otherwise immediate Switchback mode won't resume properly
+            tag.setResumePoint(float(self.resumetime or 0.0), float(self.totaltime or 0.0))
+        except AttributeError:
+            return False
+        return True
+
+# Playback field name -> position in the compact row encoding
+FIELD_INDEX = {field:index for index, field in enumerate(Playback.__slots__)}
+
+# Library Playbacks are re-checked against the Kodi library at least this often (in seconds), even if the service has not seen the
+# library change (e.g. a shared library updated by another Kodi instance)
+LIBRARY_CHECK_TTL = 3600
+
+# The Kodi library details method, id parameter, and result key, for each library media type Switchback reconciles against
+LIBRARY_DETAILS_METHODS = {
+        "movie":("VideoLibrary.GetMovieDetails", "movieid", "moviedetails"),
+        "episode":("VideoLibrary.GetEpisodeDetails", "episodeid", "episodedetails"),
+        "musicvideo":("VideoLibrary.GetMusicVideoDetails", "musicvideoid", "musicvideodetails"),
+}
+
+
+def get_library_details(items: Iterable[Tuple[Optional[str], Optional[int]]]) -> Dict[Tuple[str, int], dict]:
+    """
+    Retrieve the library playcount and resume point for Kodi library items, in a single JSON-RPC batch request.
+    (Each executeJSONRPC call is a round trip to the library - which can be slow, e.g. with a shared MySQL library)
+
+    :param items: the (type, dbid) of each Playback to retrieve library details for (non-library playbacks are ignored)
+    :return: dict of (type, dbid) -> {'playcount': int, 'resumetime': int} - items that could not be retrieved are not included
+    """
+    return fetch_library_details(items) or {}
+
+
+def fetch_library_details(items: Iterable[Tuple[Optional[str], Optional[int]]]) -> Optional[Dict[Tuple[str, int], dict]]:
+    """
+    As get_library_details, but telling apart a batch that got no answer at all (so nothing could be checked) from one that did
+
+    :param items: the (type, dbid) of each Playback to retrieve library details for (non-library playbacks are ignored)
+    :return: dict of (type, dbid) -> {'playcount': int, 'resumetime': int} for the items the library answered for, or None if the
+             batch request failed as a whole
+    """
+    batch = []
+    request_ids = set()
+    for media_type, dbid in items:
+        if not dbid or media_type not in LIBRARY_DETAILS_METHODS:
+            continue
+        request_id = f"{media_type}:{dbid}"
+        if request_id in request_ids:
+            continue
+        request_ids.add(request_id)
+        method, id_parameter, _ = LIBRARY_DETAILS_METHODS[media_type]
+        batch.append({
+                "jsonrpc":"2.0",
+                "id":request_id,
+                "method":method,
+                "params":{
+                        id_parameter:dbid,
+                        "properties":["playcount", "resume"],
+                },
+        })
+
+    if not batch:
+        return {}
+
+    Logger.debug(f"Retrieving library details for {len(batch)} item(s) in one JSON-RPC batch")
+    try:
+        responses = json.loads(xbmc.executeJSONRPC(json.dumps(batch)))
+    except (TypeError, ValueError):
+        Logger.error("Unable to parse JSON-RPC batch response when retrieving library details")
+        return None
+    # A single (error) object rather than a list means the whole batch failed
+    if not isinstance(responses, list):
+        Logger.error("JSON-RPC batch request for library details failed:", responses)
+        return None
+
+    details = {}
+    for response in responses:
+        if not isinstance(response, dict) or 'result' not in response:
+            Logger.debug("No library details for item:", response)
+            continue
+        media_type, _, dbid = str(response.get('id', '')).partition(':')
+        if media_type not in LIBRARY_DETAILS_METHODS:
+            continue
+        item = response['result'].get(LIBRARY_DETAILS_METHODS[media_type][2], {})
+        resume = item.get('resume') or {}
+        details[(media_type, int(dbid))] = {
+                'playcount':item.get('playcount', 0),
+                'resumetime':int(resume.get('position', 0)),
+        }
+    return details
+
+
+def library_id(value) -> Optional[int]:
+    """
+    :param value: a Kodi library id, as given by JSON-RPC or an InfoLabel (e.g. VideoPlayer.DBID - which is '' or -1 for non-library items)
+    :return: the library id, or None if there isn't one
+    """
+    try:
+        dbid = int(value)
+    except (TypeError, ValueError):
+        return None
+    return dbid if dbid > 0 else None
+
+
+def capture_gui_state() -> dict:
+    """
+    Capture the GUI state that goes with a playback that has just started - what was focused, in which container, the channel group,
+    and the identity of what is playing (its library id, and the file Kodi reports for it).
+    These describe whatever is focused/playing at the time they are read, so must be read straight away (e.g. in onAVStarted),
+    not later when the playback is enriched in the background.
+
+    :return: dict of the GUI state, for Playback.enrich_playback_details
+    """
+    return {
+            'listitem_path':xbmc.getInfoLabel('ListItem.Path'),
+            'addon_id':xbmc.getInfoLabel('ListItem.Property(Addon.ID)'),
+            'container_path':xbmc.getInfoLabel('Container.FolderPath'),
+            'channel_group':xbmc.getInfoLabel('VideoPlayer.ChannelGroup'),
+            'playing_dbid':xbmc.getInfoLabel('VideoPlayer.DBID'),
+            'playing_file':xbmc.getInfoLabel('Player.Filenameandpath'),
+    }
+
+
+def get_playing_item_details() -> Optional[dict]:
+    """
+    Get the details of the currently playing video item, with a single Player.GetItem JSON-RPC call
+    (rather than dozens of individual InfoLabel lookups)
+
+    :return: the Player.GetItem 'item' dict, or None on failure
+    """
+    json_dict = {
+            "jsonrpc":"2.0",
+            "id":"Player.GetItem",
+            "method":"Player.GetItem",
+            "params":{
+                    # The video player is always player 1
+                    "playerid":1,
+                    "properties":["title", "showtitle", "season", "episode", "year", "tvshowid", "art", "fanart", "thumbnail", "file",
+                                  "channel", "channelnumber", "channeltype"],
+            },
+    }
+    properties_json = send_kodi_json('Get details of the playing item', json_dict)
+    if not properties_json or 'result' not in properties_json or 'item' not in properties_json['result']:
+        Logger.error("Player.GetItem returned no result:", properties_json)
+        return None
+    return properties_json['result']['item']
+
+
+def clear_video_playlist() -> None:
+    """
+    Clear Kodi's video playlist - before switching to a live PVR channel, so Kodi doesn't carry on with the rest of a playlist afterwards
+    """
+    xbmc.PlayList(xbmc.PLAYLIST_VIDEO).clear()
+
+
+def play_pvr_channel(path: str, channelid: Optional[int] = None, clear_playlist: bool = True) -> None:
+    """
+    Switch to a live PVR channel.  If the channel id is known, this is a single Player.Open JSON-RPC call, made from whichever
+    process is already running (the service, or the plugin) - otherwise (or if that fails), fall back to PlayMedia with the channel's
+    pvr:// path, as live PVR can't be played via a ListItem/setResolvedUrl and still get the proper PVR controls.
+    See https://forum.kodi.tv/showthread.php?tid=381623
+
+    :param path: the pvr://channels/... path of the channel
+    :param channelid: (optional) the Kodi PVR channel id, see Playback.channelid
+    :param clear_playlist: clear the video playlist first (pass False if it has already been cleared)
+    """
+    if clear_playlist:
+        clear_video_playlist()
+    if channelid:
+        json_dict = {
+                "jsonrpc":"2.0",
+                "id":"Player.Open",
+                "method":"Player.Open",
+                "params":{"item":{"channelid":channelid}},
+        }
+        result = send_kodi_json(f'Switch to PVR channel {channelid}', json_dict)
+        if result and result.get('result') == 'OK':
+            return
+        Logger.warning(f"Player.Open failed for PVR channel {channelid} - falling back to PlayMedia:", result)
+    builtin = f'PlayMedia("{path}")'
+    Logger.debug("Work around PVR links not being handled by ListItem/setResolvedUrl - use PlayMedia instead:", builtin)
+    xbmc.executebuiltin(builtin)
+
+
+# tvshowdbid -> number of seasons.  Cleared whenever the library is updated - see clear_totalseasons_cache()
+_totalseasons_cache: Dict[int, Optional[int]] = {}
+
+
+def get_totalseasons(tvshowdbid: int, showtitle: Optional[str] = None) -> Optional[int]:
+    """
+    Get the number of seasons of a library TV show (cached per show, as this is a blocking library call)
+
+    :param tvshowdbid: the library dbid of the TV show
+    :param showtitle: the show title (for logging)
+    :return: the number of seasons, or None if this could not be determined
+    """
+    if tvshowdbid in _totalseasons_cache:
+        return _totalseasons_cache[tvshowdbid]
+
+    json_dict = {
+            "jsonrpc":"2.0",
+            "id":"VideoLibrary.GetSeasons",
+            "method":"VideoLibrary.GetSeasons",
+            "params":{
+                    "tvshowid":tvshowdbid,
+            },
+    }
+
+    properties_json = send_kodi_json(f'Get seasons details for tv show {showtitle}', json_dict)
+    if not properties_json or 'result' not in properties_json:
+        Logger.error("VideoLibrary.GetSeasons returned no result")
+        # Continue without seasons info (and don't cache, so it's tried again next time)
+        return None
+
+    if 'error' in properties_json:
+        Logger.error("VideoLibrary.GetSeasons returned error:", properties_json['error'])
+        return None
+    properties = properties_json['result']
+
+    # {'limits': {'end': 2, 'start': 0, 'total': 2}, 'seasons': [...]}
+    total_limit = properties.get('limits', {}).get('total')
+    totalseasons = total_limit if isinstance(total_limit, int) else None
+    if totalseasons is None and 'seasons' in properties:
+        totalseasons = len(properties['seasons'])
+    _totalseasons_cache[tvshowdbid] = totalseasons
+    return totalseasons
+
+
+def clear_totalseasons_cache() -> None:
+    """
+    Clear the cached number of seasons per TV show - call when the library has been updated
+    """
+    _totalseasons_cache.clear()
+
 
-@dataclass
 class PlaybackList:
     """
-    A list of Playback objects, with some helper methods.  Stored both in memory (accessible via .list) and on disk (filename at .file)
-    Is a standard Python list, so can be iterated over, indexed, etc., and of course, all standard list methods are available.
+    An ordered list of Playback objects (most recent first), with some helper methods.  Stored both in memory and on disk (filename at .file)
+
+    Internally, this is an ordered index keyed on the normalised identities of the Playbacks (see Playback.identities), so lookups,
+    move to front, de-duplication and trimming are all constant time (per item).  Can be iterated over, indexed, and len()-ed.
+    The .list property returns a plain Python list of the Playbacks (a copy, so use the methods here to change the PlaybackList,
+    or assign a new list to .list to replace its contents).
+
+    Entries loaded from the file are kept in their compact row form, and only decoded into Playback objects when accessed
+    (e.g. Switchback mode only ever needs list[0] and list[1]).  The plugin listing loads just the page it displays (see load_page).
 
     To create a PlaybackList::
         switchback = PlaybackList([], xbmcvfs.translatePath(os.path.join(PROFILE, "switchback_list.json")))
     """
-    list: List[Playback]
-    file: str
-    remove_watched_playbacks: bool = False
+
+    def __init__(self, playbacks: List[Playback], file: str, remove_watched_playbacks: bool = False):
+        self.file = file
+        self.remove_watched_playbacks = remove_watched_playbacks
+        # JSON, or SQLite for a .db file - see storage.py
+        self.storage = open_storage(file, Playback.__slots__)
+        # token -> Playback, or (not yet decoded) compact row - in list order
+        self._entries = OrderedDict()
+        # id(Playback) -> token, for decoded Playbacks
+        self._tokens = {}
+        # identity key -> token
+        self._identities = {}
+        # token -> the identity keys the entry was indexed under
+        self._keys = {}
+        # The tokens of the (undecoded) entries that have been added, moved or changed since the list was last loaded or saved
+        # (decoded Playbacks may have been changed at any time, so are always saved as changed - see save_to_file)
+        self._changed = set()
+        # (In a transaction) the fields changed so far - (entry, field, previous value) - so they can be rolled back (see transaction)
+        self._undo = None
+        self._next_token = itertools.count()
+        # How many rows have been decoded into Playback objects
+        self.decoded = 0
+        # A read only list is never saved - e.g. the plugin's copy, when the service is running (the service is then the only writer)
+        self.read_only = False
+        # If only a page of the list has been loaded (see load_page) - the index of its first entry, and the length of the whole list
+        self.page_start = 0
+        self._total = None
+        self.list = playbacks
+
+    def __repr__(self) -> str:
+        return f"PlaybackList(file={self.file!r}, list={self.list!r})"
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Playback]:
+        return iter(self.list)
+
+    def __getitem__(self, index: int) -> Playback:
+        if index < 0:
+            index += len(self._entries)
+        if not 0 <= index < len(self._entries):
+            raise IndexError("PlaybackList index out of range")
+        return self._decode(next(itertools.islice(self._entries, index, None)))
+
+    @property
+    def list(self) -> List[Playback]:
+        """
+        :return: the Playbacks as a plain Python list, most recent first
+        """
+        return [self._decode(token) for token in list(self._entries)]
+
+    @list.setter
+    def list(self, playbacks: List[Playback]) -> None:
+        """
+        Replace the contents of the PlaybackList (duplicates of earlier Playbacks are dropped)
+        """
+        self._entries.clear()
+        self._tokens.clear()
+        self._identities.clear()
+        self._keys.clear()
+        self._changed.clear()
+        for playback in playbacks:
+            self.append(playback)
+
+    @property
+    def total(self) -> int:
+        """
+        :return: the length of the whole list - more than len() if only a page of it has been loaded (see load_page)
+        """
+        return len(self._entries) if self._total is None else self._total
+
+    def head(self, count: int) -> List[Playback]:
+        """
+        :return: the first count Playbacks (only these are decoded)
+        """
+        return self.page(0, count)
+
+    def page(self, start: int, count: int) -> List[Playback]:
+        """
+        :return: the count Playbacks from index start on (only these are decoded) - if only a page of the list has been loaded,
+                 start is still an index into the whole list
+        """
+        start = max(start - self.page_start, 0)
+        return [self._decode(token) for token in itertools.islice(self._entries, start, start + max(count, 0))]
+
+    def _decode(self, token: int) -> Playback:
+        """
+        Return the Playback for a token, decoding it from its compact row first, if needed
+        """
+        entry = self._entries[token]
+        if isinstance(entry, list):
+            entry = Playback.from_row(entry)
+            self._entries[token] = entry
+            self._tokens[id(entry)] = token
+            self.decoded += 1
+        return entry
+
+    def _field(self, token: int, field: str):
+        """
+        Read a field of an entry, without decoding it
+        """
+        entry = self._entries[token]
+        if isinstance(entry, list):
+            index = FIELD_INDEX[field]
+            return entry[index] if index < len(entry) else None
+        return getattr(entry, field)
+
+    def _set_field(self, token: int, field: str, value) -> None:
+        """
+        Set a field of an entry, without decoding it
+        """
+        entry = self._entries[token]
+        if self._undo is not None:
+            self._undo.append((entry, field, self._field(token, field)))
+        if isinstance(entry, list):
+            index = FIELD_INDEX[field]
+            if index >= len(entry):
+                entry.extend([None] * (index + 1 - len(entry)))
+            entry[index] = value
+            self._changed.add(token)
+        else:
+            setattr(entry, field, value)
+
+    def _add(self, entry, identities: List[str]) -> Optional[int]:
+        """
+        Add an entry (Playback or compact row) at the end of the list, unless it duplicates one already in the list
+
+        :return: the new entry's token, or None if it was a duplicate
+        """
+        if any(key in self._identities for key in identities):
+            return None
+        token = next(self._next_token)
+        self._entries[token] = entry
+        self._changed.add(token)
+        if isinstance(entry, Playback):
+            self._tokens[id(entry)] = token
+        self._keys[token] = identities
+        for key in identities:
+            self._identities[key] = token
+        return token
+
+    def _discard(self, token: int):
+        """
+        Remove an entry from the list (and the index)
+
+        :return: the removed entry
+        """
+        entry = self._entries.pop(token)
+        if isinstance(entry, Playback):
+            self._tokens.pop(id(entry), None)
+        for key in self._keys.pop(token, []):
+            if self._identities.get(key) == token:
+                del self._identities[key]
+        self._changed.discard(token)
+        return entry
+
+    def find_playback(self, playback: Playback) -> Optional[Playback]:
+        """
+        Return the Playback in the list that matches any of the given Playback's identities (see Playback.identities)
+
+        :param playback: the Playback to match
+        :return: Playback or None: The matching Playback object in the list if found, otherwise None
+        """
+        if id(playback) in self._tokens:
+            return playback
+        for key in playback.identities:
+            token = self._identities.get(key)
+            if token is not None:
+                return self._decode(token)
+        return None
+
+    def append(self, playback: Playback) -> bool:
+        """
+        Add a Playback at the end of the list, unless the list already holds a matching Playback
+
+        :param playback: the Playback to add
+        :return: True if added, False if it was a duplicate
+        """
+        if id(playback) in self._tokens:
+            return False
+        return self._add(playback, playback.identities) is not None
+
+    def move_to_front(self, playback: Playback) -> None:
+        """
+        Move a Playback to the top of the list, adding it if the list does not already hold it (or a matching Playback - which is replaced)
+
+        :param playback: the Playback to move/add to the front of the list
+        """
+        existing = self.find_playback(playback)
+        if existing is not None and existing is not playback:
+            self.remove(existing)
+        if id(playback) not in self._tokens:
+            self._add(playback, playback.identities)
+        token = self._tokens[id(playback)]
+        self._entries.move_to_end(token, last=False)
+        self._changed.add(token)
+
+    def record_playback(self, playback: Playback) -> Playback:
+        """
+        Record a (finished, or recovered) playback at the top of the list.
+        If the list already holds a matching Playback, that is kept (with ALL the details recorded from the original playback, in case
+        they don't make it through when the playback is Switchback initiated - as sometimes seems to be the case), with updated playback times.
+
+        :param playback: the Playback to record
+        :return: the Playback now at the top of the list
+        """
+        existing_playback = self.find_playback(playback)
+        if existing_playback:
+            Logger.debug("Updating Playback and list order")
+            # Update with the current playback times
+            if playback.source != "pvr_live" and existing_playback is not playback:
+                existing_playback.update({'resumetime':playback.resumetime, 'totaltime':playback.totaltime})
+            playback = existing_playback
+        # Kodi updates the library resume point/playcount when playback stops, so make sure this is checked against the library again
+        playback.checked = None
+        self.move_to_front(playback)
+        return playback
+
+    def remove(self, playback: Playback) -> None:
+        """
+        Remove a Playback from the list (if present)
+        """
+        token = self._tokens.get(id(playback))
+        if token is not None:
+            self._discard(token)
+
+    def trim(self, maximum_length: int) -> List[Playback]:
+        """
+        Trim the list to the given maximum length, dropping the least recent Playbacks
+
+        :return: the Playbacks that were dropped
+        """
+        removed = []
+        while len(self._entries) > max(maximum_length, 0):
+            token = next(reversed(self._entries))
+            entry = self._discard(token)
+            removed.append(Playback.from_row(entry) if isinstance(entry, list) else entry)
+        return removed
+
+    @contextmanager
+    def transaction(self):
+        """
+        Make a batch of changes to the list (removals, re-ordering, field changes) as a single transaction - the list is saved once,
+        at the end, rather than after each change.  If anything goes wrong part way through, the list's contents, order, and the fields
+        changed by its methods are rolled back, and nothing is saved.
+
+        Use with:  with playback_list.transaction(): ...
+        """
+        saved = OrderedDict(self._entries), dict(self._tokens), dict(self._identities), dict(self._keys)
+        changed = set(self._changed)
+        outer_undo = self._undo
+        undo = self._undo = []
+        try:
+            yield self
+        except BaseException:
+            self._entries, self._tokens, self._identities, self._keys = saved
+            # (Entries keep their place in the index, so are changed back where they are - latest change first)
+            for entry, field, value in reversed(undo):
+                if isinstance(entry, list):
+                    entry[FIELD_INDEX[field]] = value
+                else:
+                    setattr(entry, field, value)
+            # (Entries changed before the transaction, and removed in it, are back - and still changed)
+            self._changed |= changed
+            raise
+        else:
+            # (A transaction within a transaction - its changes are rolled back along with the outer one's)
+            if outer_undo is not None:
+                outer_undo.extend(undo)
+        finally:
+            self._undo = outer_undo
+        # (...and saved by the outermost transaction only, once all of it has succeeded)
+        if outer_undo is None:
+            self.save_to_file()
+
+    def remove_watched(self) -> int:
+        """
+        Remove all watched Playbacks from the list, whatever the remove_watched_playbacks setting.
+        The library entries are all checked against the Kodi library in one round trip.
+
+        :return: the number of Playbacks removed
+        """
+        tokens = list(self._entries)
+        library_details = get_library_details((self._field(token, 'type'), self._field(token, 'dbid')) for token in tokens if self._field(token, 'dbid'))
+        watched = self._watched_tokens(tokens, library_details)
+        for token in watched:
+            self._discard(token)
+        return len(watched)
+
+    def sources(self) -> Dict[str, int]:
+        """
+        :return: dict of source (kodi_library, addon, pvr_live...) -> the number of Playbacks in the list from that source
+        """
+        counts = {}
+        for token in self._entries:
+            source = self._field(token, 'source')
+            counts[source] = counts.get(source, 0) + 1
+        return counts
+
+    def fields(self, *names: str) -> List[tuple]:
+        """
+        Read some fields of every Playback in the list, in list order, without decoding them (e.g. for a background scan of the list)
+
+        :param names: the field names, e.g. 'path', 'file'
+        :return: list of tuples of the field values, one per Playback
+        """
+        return [tuple(self._field(token, name) for name in names) for token in self._entries]
+
+    def remove_source(self, source: str) -> int:
+        """
+        Remove all Playbacks from the given source (e.g. all the addon playbacks)
+
+        :return: the number of Playbacks removed
+        """
+        tokens = [token for token in self._entries if self._field(token, 'source') == source]
+        for token in tokens:
+            self._discard(token)
+        return len(tokens)
+
+    def apply_edit(self, edit: dict) -> int:
+        """
+        Apply an edit of the list, as sent by the plugin to the service (see service_state.request_edit).
+        Playbacks are identified by path, rather than index, as the list may have changed since the plugin displayed it.
+
+        :param edit: one of {'command':'remove', 'paths':[...]}, {'command':'move', 'path':...}, {'command':'remove_watched'},
+                     or {'command':'remove_source', 'source':...}
+        :return: the number of Playbacks changed
+        :raises ValueError: if the edit is not valid
+        """
+        command = edit.get('command')
+        if command == 'remove':
+            tokens = {self._identities.get(f"path:{path}") for path in edit.get('paths', [])} - {None}
+            for token in tokens:
+                self._discard(token)
+            return len(tokens)
+        if command == 'move':
+            token = self._identities.get(f"path:{edit.get('path')}")
+            if token is None:
+                return 0
+            self._entries.move_to_end(token, last=False)
+            self._changed.add(token)
+            return 1
+        if command == 'remove_watched':
+            return self.remove_watched()
+        if command == 'remove_source':
+            return self.remove_source(edit.get('source'))
+        raise ValueError(f"Unknown Switchback list edit: {edit}")
 
     def toJson(self) -> str:
         """
@@ -350,98 +1175,247 @@ class PlaybackList:
 
         :return: the list of Playback objects as JSON
         """
-        return json.dumps([p.__dict__ for p in self.list], ensure_ascii=False, indent=2)
+        return json.dumps([playback.to_dict() for playback in self], ensure_ascii=False, indent=2)
 
     def init(self) -> None:
         """
         Initialise/reset in memory PlaybackList, and delete/re-create the empty PlaybackList file
         """
         self.list = []
+        if self.read_only:
+            return
         xbmcvfs.mkdirs(os.path.dirname(self.file))
-        with open(self.file, 'w', encoding='utf-8') as switchback_list_file:
-            switchback_list_file.write('[]')
+        self.storage.save([], force=True)
+        self._changed.clear()
 
-    def load_or_init(self) -> None:
+    @timed('PlaybackList.load_or_init')
+    def load_or_init(self, window: Optional[Tuple[int, int]] = None, library_changed: Optional[float] = None) -> None:
         """
-        Load a JSON-formatted PlaybackList from the PlaybackList file
+        Load a PlaybackList from the PlaybackList file (entries are only decoded into Playback objects as they are accessed)
+
+        :param window: (optional) (start, stop) - only check the entries in this range against the Kodi library (e.g. just the page
+                       of the list being displayed), so the time taken doesn't grow with the length of the list.  Default: check them all.
+        :param library_changed: (optional) when the Kodi library last changed, if known (see service_state.py) - library entries checked
+                                since then (and within LIBRARY_CHECK_TTL) are not checked again.  Default: check them all.
         """
         Logger.info("Try to load PlaybackList from file:", self.file)
         # Ensure we start from a clean slate before loading from disk
         self.list = []
+        self.page_start = 0
+        self._total = None
+        list_needs_save = False
         try:
-            with open(self.file, 'r', encoding='utf-8') as switchback_list_file:
-                switchback_list_json = json.load(switchback_list_file)
-                if not isinstance(switchback_list_json, list):
-                    Logger.error(f"PlaybackList file [{self.file}] did not contain a JSON array — reinitialising")
-                    self.init()
-                    return
-                for playback in switchback_list_json:
-                    self.list.append(Playback(**playback))
+            rows, list_needs_save = self.storage.load()
+            if list_needs_save:
+                Logger.info(f"PlaybackList file [{self.file}] is in an older format - it will be migrated")
+            for row in rows:
+                if self._add(row, Playback.identities_of_row(row)) is None:
+                    Logger.debug("Dropping duplicate playback from the list:", row)
+                    list_needs_save = True
+            # (The rows are just as stored)
+            self._changed.clear()
 
         except FileNotFoundError:
             Logger.warning(f"Could not find: [{self.file}] - creating empty PlaybackList & file")
             self.init()
-        except json.JSONDecodeError:
-            Logger.error(f"JSONDecodeError - Unable to parse PlaybackList file [{self.file}] -  creating empty PlaybackList & file")
+        except (ValueError, TypeError, AttributeError) as error:
+            Logger.error(f"Unable to parse PlaybackList file [{self.file}] - creating empty PlaybackList & file", error)
             self.init()
 
-        list_needs_save = False
+        if self.check_library(window, library_changed):
+            list_needs_save = True
+
+        if list_needs_save:
+            self.save_to_file()
+
+    @timed('PlaybackList.load_page')
+    def load_page(self, start: int, count: int, library_changed: Optional[float] = None) -> Optional[bool]:
+        """
+        Load just a page of the PlaybackList from the PlaybackList file - for the plugin listing, so the time taken to display it doesn't
+        grow with the length of the list - and check the page against the Kodi library (see check_library).
+        Only part of the list is then loaded, so it is never saved (see save_to_file) - if the library check changed anything that
+        needs saving, the whole list has to be loaded instead (see load_or_init).
+
+        :param start: the index of the first entry of the page
+        :param count: the number of entries in the page
+        :param library_changed: (optional) when the Kodi library last changed, if known (see load_or_init)
+        :return: True if the library check changed the page, False if not, or None if the page could not be loaded
+        """
+        Logger.info(f"Try to load PlaybackList entries {start} to {start + count - 1} from file:", self.file)
+        self.list = []
+        try:
+            rows, total = self.storage.load_page(start, count)
+        except FileNotFoundError:
+            Logger.info(f"Could not find: [{self.file}]")
+            return None
+        except (ValueError, TypeError, AttributeError) as error:
+            Logger.error(f"Unable to parse PlaybackList file [{self.file}]", error)
+            return None
+        for row in rows:
+            self._add(row, Playback.identities_of_row(row))
+        self._changed.clear()
+        self.page_start = start
+        self._total = total
+        loaded = len(self._entries)
+        changed = self.check_library(library_changed=library_changed)
+        # (Watched entries may have been removed from the page)
+        self._total -= loaded - len(self._entries)
+        return changed
+
+    @timed('PlaybackList.check_library')
+    def check_library(self, window: Optional[Tuple[int, int]] = None, library_changed: Optional[float] = None) -> bool:
+        """
+        Bring the list up to date with the Kodi library - update resume points, and (if the user wants) filter out watched playbacks.
+        Called by load_or_init, and by the service (which owns the list, so never needs to re-load it) before recording a playback.
+
+        :param window: (optional) (start, stop) - only check the entries in this range (see load_or_init).  Default: check them all.
+        :param library_changed: (optional) when the Kodi library last changed, if known (see load_or_init).  Default: check them all.
+        :return: True if the list was changed (and so needs saving)
+        """
+        changed = False
+        # (The checks below read and write the entries' fields directly, so that entries are not decoded just to check them)
+        tokens = list(self._entries)
+        if window:
+            tokens = tokens[window[0]:window[1]]
+
+        # Only check the DB items that may be out of date with the library - those not checked since the library last changed,
+        # or not checked for a while.  (Nothing has changed?  Then no library round trip at all)
+        now = time.time()
+        tokens_to_check = [token for token in tokens if self._field(token, 'dbid') and not (
+                library_changed is not None and (self._field(token, 'checked') or 0) >= library_changed
+                and now - self._field(token, 'checked') < LIBRARY_CHECK_TTL)]
+        # Fetch the library playcounts & resume points for all of these in one round trip, rather than 2N separate calls
+        library_details = get_library_details((self._field(token, 'type'), self._field(token, 'dbid')) for token in tokens_to_check)
 
         # If the user wants to filter out watched items from the list
         if self.remove_watched_playbacks:
-            paths_to_remove = []
-            for item in list(self.list):
-                # DB item?  Is it marked as watched in the DB?
-                if item.dbid:
-                    playcount = get_playcount(item.type, item.dbid)
-                    if playcount and playcount > 0:
-                        list_needs_save = True
-                        Logger.debug(f"Filtering watched playback from the list (as playcount > 0 in Kodi DB): [{item.pluginlabel}]")
-                        paths_to_remove.append(item.path)
-
-                # Not a DB item, use a calculation instead and compare to the playcount_minium_percent
-                elif item.resumetime and item.totaltime:
-                    percent_played = (item.resumetime / item.totaltime) * 100
-                    # Use the user set playcount_minium_percent if there is one, or fallback to Kodi default 90 percent
+            tokens_to_remove = self._watched_tokens(tokens, library_details)
+            if tokens_to_remove:
+                changed = True
+                for token in tokens_to_remove:
+                    self._discard(token)
+                tokens = [token for token in tokens if token in self._entries]
+
+        # Update resume points with current data from the Kodi library (consider e.g. shared library scenarios)
+        for token in tokens:
+            dbid = self._field(token, 'dbid')
+            if dbid:
+                details = library_details.get((self._field(token, 'type'), dbid))
+                if not details:
+                    continue
+                library_resume_point = details['resumetime']
+                if library_resume_point != self._field(token, 'resumetime'):
+                    Logger.debug(f"Retrieved library resume point: {library_resume_point} != existing list resume point {self._field(token, 'resumetime')} - updating playback list")
+                    changed = True
+                    self._set_field(token, 'resumetime', library_resume_point)
+
+        # Record which entries are now up to date with the library.  (A new stamp alone is not a change the caller need save - but the
+        # service, as the list's only writer, saves them anyway, so the plugin's listings can make use of them too - see Store.check_library)
+        for token in tokens_to_check:
+            if token in self._entries and (self._field(token, 'type'), self._field(token, 'dbid')) in library_details:
+                self._set_field(token, 'checked', now)
+
+        return changed
+
+    def _watched_tokens(self, tokens: List[int], library_details: Dict[Tuple[str, int], dict]) -> List[int]:
+        """
+        Work out which entries have been watched - library entries by their Kodi library playcount, other entries by how much of
+        them has been played (compared to Kodi's playcountminimumpercent)
+
+        :param tokens: the entries to consider
+        :param library_details: the library details of (at least) the library entries to consider - see get_library_details
+        :return: the tokens of the watched entries
+        """
+        watched = []
+        playcount_minimum_percent = None
+        for token in tokens:
+            dbid = self._field(token, 'dbid')
+            resumetime = self._field(token, 'resumetime')
+            totaltime = self._field(token, 'totaltime')
+            # DB item?  Is it marked as watched in the DB?
+            if dbid:
+                playcount = library_details.get((self._field(token, 'type'), dbid), {}).get('playcount')
+                if playcount and playcount > 0:
+                    Logger.debug(f"Filtering watched playback from the list (as playcount > 0 in Kodi DB): [{self._decode(token).pluginlabel}]")
+                    watched.append(token)
+
+            # Not a DB item, use a calculation instead and compare to the playcount_minium_percent
+            elif resumetime and totaltime:
+                percent_played = (resumetime / totaltime) * 100
+                # Use the user set playcount_minium_percent if there is one, or fallback to Kodi default 90 percent
+                # (Only read the advanced setting once per load, and only if it's actually needed)
+                if playcount_minimum_percent is None:
                     setting = get_advancedsetting('video/playcountminimumpercent')
-                    playcount_minium_percent = float(setting) if setting and setting != 0 else 90.0
-                    if percent_played >= playcount_minium_percent:
-                        list_needs_save = True
-                        Logger.debug(f"Filtering watched playback from the list (as {percent_played:.1f}% played over playcount_minium_percent {playcount_minium_percent}%): [{item.pluginlabel}]")
-                        paths_to_remove.append(item.path)
+                    playcount_minimum_percent = float(setting) if setting and setting != 0 else 90.0
+                if percent_played >= playcount_minimum_percent:
+                    Logger.debug(f"Filtering watched playback from the list (as {percent_played:.1f}% played over playcount_minium_percent {playcount_minimum_percent}%): [{self._decode(token).pluginlabel}]")
+                    watched.append(token)
+        return watched
 
-            if paths_to_remove:
-                list_needs_save = True
-                for path in paths_to_remove:
-                    self.remove_playbacks_of_path(path)
+    def reconcile_library_item(self, media_type: str, dbid: int, removed: bool = False) -> bool:
+        """
+        Bring the entry for a single Kodi library item up to date (e.g. when the service is notified that the item has changed)
 
-        # Update resume points with current data from the Kodi library (consider e.g. shared library scenarios)
-        for item in self.list:
-            if item.dbid:
-                library_resume_point = get_resume_point(item.type, item.dbid)
-                if library_resume_point != item.resumetime:
-                    Logger.debug(f"Retrieved library resume point: {library_resume_point} != existing list resume point {item.resumetime} - updating playback list")
-                    list_needs_save = True
-                    item.resumetime = library_resume_point
+        :param media_type: the library item type (movie, episode, musicvideo)
+        :param dbid: the library item id
+        :param removed: True if the item has been removed from the library (the entry is then removed from the list too)
+        :return: True if the list was changed (an entry removed, or its resume point updated)
+        """
+        token = self._identities.get(f"db:{media_type}:{dbid}")
+        if token is None:
+            return False
+        if removed:
+            Logger.info(f"Removing playback from the list, as it has been removed from the Kodi library: {media_type} {dbid}")
+            self._discard(token)
+            return True
 
-        if list_needs_save:
-            self.save_to_file()
+        details = get_library_details([(media_type, dbid)]).get((media_type, dbid))
+        if not details:
+            return False
+        if self.remove_watched_playbacks and details['playcount'] and details['playcount'] > 0:
+            Logger.debug(f"Filtering watched playback from the list (as playcount > 0 in Kodi DB): [{self._decode(token).pluginlabel}]")
+            self._discard(token)
+            return True
+        changed = False
+        if details['resumetime'] != self._field(token, 'resumetime'):
+            Logger.debug(f"Library resume point changed to {details['resumetime']} - updating playback list")
+            self._set_field(token, 'resumetime', details['resumetime'])
+            changed = True
+        # (As in check_library, a new stamp alone is not a change - though the service saves it anyway)
+        self._set_field(token, 'checked', time.time())
+        return changed
 
-    def save_to_file(self) -> None:
+    @timed('PlaybackList.save_to_file')
+    def save_to_file(self, force: bool = False) -> None:
         """
-        Save the PlaybackList to the PlaybackList file (as JSON)
+        Save the PlaybackList to the PlaybackList file (as compact, versioned JSON, or to a SQLite database - see storage.py).
+        Nothing is written if the list is unchanged since it was last loaded or saved.
+
+        :param force: write the whole list, even if it is unchanged (e.g. to a new file)
         """
-        Logger.info(f"Saving PlaybackList to file: {self.file}")
-        import tempfile
-        directory_name = os.path.dirname(self.file)
-        temp_dir = None
-        if directory_name:
-            xbmcvfs.mkdirs(directory_name)
-            temp_dir = directory_name
-        with tempfile.NamedTemporaryFile('w', delete=False, encoding='utf-8', dir=temp_dir) as temp_file:
-            temp_file.write(self.toJson())
-            temporary_name = temp_file.name
-        os.replace(temporary_name, self.file)
+        if self.read_only:
+            Logger.debug(f"PlaybackList is read only, not saving file: {self.file}")
+            return
+        if self._total is not None:
+            Logger.error(f"Only a page of the PlaybackList has been loaded, not saving file: {self.file}")
+            return
+        xbmcvfs.mkdirs(os.path.dirname(self.file))
+        rows = []
+        # (The storage need only compare these rows with those it last loaded/saved - see SqliteStorage.save)
+        changed = []
+        for index, (token, entry) in enumerate(self._entries.items()):
+            if isinstance(entry, list):
+                rows.append(entry)
+                if token in self._changed:
+                    changed.append(index)
+            else:
+                rows.append(entry.to_row())
+                changed.append(index)
+        if self.storage.save(rows, force=force, changed=changed):
+            Logger.info(f"Saved PlaybackList to file: {self.file}")
+        else:
+            Logger.debug(f"PlaybackList unchanged, not re-saving file: {self.file}")
+        self._changed.clear()
 
     def delete_file(self) -> None:
         """
@@ -449,13 +1423,15 @@ class PlaybackList:
         """
         if os.path.exists(self.file):
             Logger.info(f"Deleting PlaybackList file [{self.file}]")
-            os.remove(self.file)
+            self.storage.delete()
 
     def remove_playbacks_of_path(self, path: str) -> None:
         """
         Remove any playbacks of a given path from the PlaybackList
         """
-        self.list = [x for x in self.list if x.path != path]
+        token = self._identities.get(f"path:{path}")
+        if token is not None:
+            self._discard(token)
 
     def find_playback_by_path(self, path: str) -> Optional[Playback]:
         """
@@ -464,10 +1440,5 @@ class PlaybackList:
         :param path: str The path to search for
         :return: Playback or None: The Playback object if found, otherwise None
         """
-        Logger.debug(f"find_playback_by_path: {path}")
-        for playback in self.list:
-            if playback.path == path:
-                Logger.debug(f"Matched playback to [{playback.path}]")
-                return playback
-        Logger.debug(f"No matching playback for [{path}]")
-        return None
+        token = self._identities.get(f"path:{path}")
+        return self._decode(token) if token is not None else None
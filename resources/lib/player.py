@@ -1,8 +1,14 @@
+import time
+
 import xbmc
 
 from bossanova808.constants import HOME_WINDOW
 from bossanova808.logger import Logger
-from resources.lib.playback import Playback
+from resources.lib.artwork import ART_FIELDS, art_of
+from resources.lib.enrichment import PlaybackEnricher
+from resources.lib.instrumentation import timed, debug_logging_enabled
+from resources.lib.playback import Playback, capture_gui_state
+from resources.lib.service_state import library_changed_time, record_trigger, take_trigger, ROUTE_LISTING
 
 from resources.lib.store import Store
 
@@ -16,52 +22,159 @@ class KodiPlayer(xbmc.Player):
     def __init__(self, *args):
         xbmc.Player.__init__(self)
         Logger.debug('Player __init__')
+        # Full playback details are gathered in the background, so as not to hold up the player callbacks
+        self.enricher = PlaybackEnricher()
+        # (Event worker) the file Kodi was playing when the current playback started
+        self.playing_file = None
 
     # Use on AVStarted (vs Playback started) we want to record a playback only if the user actually _saw_ a video...
+    # All the player callbacks just capture what they need from Kodi (which may have moved on by the time the event is handled),
+    # and post an event - the service's event worker then does the actual work (see ServiceEventQueue)
+    def onPlayBackStarted(self):
+        # A click on an item in the Switchback listing plays it directly (no Switchback code runs), so this is the earliest the
+        # Switchback can be timed from (unless it was already triggered by the context menu, or the plugin - see record_trigger)
+        try:
+            if self.getPlayingItem().getProperty('Switchback'):
+                record_trigger(ROUTE_LISTING)
+        except RuntimeError:
+            pass
+
+    @timed('KodiPlayer.onAVStarted')
     def onAVStarted(self):
         Logger.info('onAVStarted')
+        # (For timing Switchbacks - see LatencyHistograms.  Any trigger is taken now, even if this turns out not to be a Switchback,
+        # so it can't be mistaken for the trigger of a later one)
+        started = time.monotonic()
+        trigger = take_trigger()
 
         # KISS - only support video...
-        if xbmc.getCondVisibility('Player.HasVideo'):
+        if not xbmc.getCondVisibility('Player.HasVideo'):
+            return
 
-            # (If only we could just serialise a Kodi ListItem...)
+        # (If only we could just serialise a Kodi ListItem...)
+        try:
             item = self.getPlayingItem()
             file = self.getPlayingFile()
+        except RuntimeError:
+            Logger.warning("onAVStarted, but nothing is playing any more - ignoring")
+            return
+        # (The GUI state goes with what has just started playing - so it has to be read now, not when the playback is enriched later)
+        gui = capture_gui_state()
+
+        # If the current playback was Switchback-triggered from a Kodi ListItem, the previously recorded Playback details will be
+        # re-used from the list.  Otherwise, capture the minimal details of the new playback now, while it is still playing.
+        path_to_find = None
+        playback = None
+        if item.getProperty('Switchback') or HOME_WINDOW.getProperty('Switchback'):
+            Logger.debug("Home Window property is:", HOME_WINDOW.getProperty('Switchback'))
+            Logger.debug("ListItem property is:", item.getProperty('Switchback'))
+            path_to_find = HOME_WINDOW.getProperty('Switchback') or item.getProperty('Switchback') or item.getPath()
+        else:
+            playback = Playback()
+            playback.capture_playback_details(file, item, self)
+        Store.post_event('playback started', self.playback_started, file, item, gui, path_to_find, playback, trigger, started)
 
-            # If the current playback was Switchback-triggered from a Kodi ListItem,
-            # retrieve the previously recorded Playback details from the list. Set the Home Window properties that have not yet been set.
-            if item.getProperty('Switchback') or HOME_WINDOW.getProperty('Switchback'):
-                Logger.info("Switchback triggered playback, so attempting to find and re-use existing Playback object")
-                Logger.debug("Home Window property is:", HOME_WINDOW.getProperty('Switchback'))
-                Logger.debug("ListItem property is:", item.getProperty('Switchback'))
-                path_to_find = HOME_WINDOW.getProperty('Switchback') or item.getProperty('Switchback') or item.getPath()
-                Store.current_playback = Store.switchback.find_playback_by_path(path_to_find)
-                if Store.current_playback:
-                    Logger.info("Found.  Re-using previously stored Playback object:", Store.current_playback)
-                    # We won't have access to the listitem once playback is finishes, so set a property now so it can be used/cleared in onPlaybackFinished below
-                    Store.update_home_window_switchback_property(Store.current_playback.path)
-                    return
-                else:
-                    Logger.error("Switchback triggered playback, but no playback found in the list for this path - this shouldn't happen?!", path_to_find)
-
-            # If we got to here, this was not a Switchback-triggered playback, or for some reason we've been unable to find the Playback.
-            # Create a new Playback object and record the details.
-            Logger.info("Not a Switchback playback, or error retrieving previous Playback, so creating a new Playback object to record details")
-            Store.current_playback = Playback()
-            Store.current_playback.update_playback_details(file, item)
+    def playback_started(self, file: str, item, gui: dict, path_to_find: str = None, playback: Playback = None, trigger: tuple = None,
+                         started: float = None):
+        """
+        (Event worker) A video playback has started - make it the current playback
+
+        :param file: the file Kodi is playing
+        :param item: the Kodi ListItem that is playing
+        :param gui: the GUI state when it started playing (see capture_gui_state)
+        :param path_to_find: if this is a Switchback-triggered playback, the path of the Playback to re-use from the list
+        :param playback: otherwise, the new Playback, with its minimal details captured
+        :param trigger: (when, route) the Switchback was triggered, if it was (see service_state.take_trigger)
+        :param started: when (time.monotonic()) the playback started
+        """
+        # Resume point samples are only recorded for the file that was playing when this playback started (see record_position)
+        self.playing_file = file
+
+        # If the current playback was Switchback-triggered from a Kodi ListItem,
+        # retrieve the previously recorded Playback details from the list. Set the Home Window properties that have not yet been set.
+        if path_to_find:
+            Logger.info("Switchback triggered playback, so attempting to find and re-use existing Playback object")
+            Store.current_playback = Store.switchback.find_playback_by_path(path_to_find)
+            if Store.current_playback:
+                Logger.info("Found.  Re-using previously stored Playback object:", Store.current_playback)
+                # How long did that Switchback take?
+                if trigger and started and Store.latency:
+                    latency = (started - trigger[0]) * 1000
+                    Store.latency.record(Store.current_playback.source, latency, trigger[1])
+                    Logger.debug(f"Switchback ({trigger[1]}) to {Store.current_playback.source} playback took {latency:.0f}ms")
+                # We won't have access to the listitem once playback is finishes, so set a property now so it can be used/cleared in onPlaybackFinished below
+                Store.update_home_window_switchback_property(Store.current_playback.path)
+                Store.journal.start(Store.current_playback)
+                return
+            else:
+                Logger.error("Switchback triggered playback, but no playback found in the list for this path - this shouldn't happen?!", path_to_find)
+
+        # If we got to here, this was not a Switchback-triggered playback, or for some reason we've been unable to find the Playback.
+        # Create a new Playback object and record the details.
+        Logger.info("Not a Switchback playback, or error retrieving previous Playback, so creating a new Playback object to record details")
+        if playback is None:
+            playback = Playback()
+            try:
+                playback.capture_playback_details(file, item, self)
+            except RuntimeError:
+                Logger.warning("Playback has already stopped - not recording it")
+                return
+        # Only the minimal details are captured so far, the rest are filled in in the background.
+        Store.current_playback = playback
+        # Journal the new playback as soon as it has its full details, so it is not lost if Kodi crashes before playback finishes
+        # (Via the event worker, which owns the journal, as the enricher calls back on its own thread)
+        self.enricher.submit(playback, item, gui, on_enriched=lambda enriched:Store.post_event('playback enriched', self.playback_enriched, enriched))
+
+    def playback_enriched(self, playback: Playback):
+        """
+        (Event worker) A new playback's full details are available - journal it, if it is still playing
+        """
+        # (Playback may already have finished, and the journal been cleared, by the time this event is handled)
+        if playback is Store.current_playback and self.playing_file:
+            Store.journal.start(playback)
+
+    def sample_position(self):
+        """
+        (Service poll loop) Sample where the current playback is up to, and post it to the event worker to record
+        """
+        try:
+            file = self.getPlayingFile()
+            position = self.getTime()
+            # (Separate calls, so make sure playback didn't move on to another file in between)
+            if self.getPlayingFile() != file:
+                return
+        except RuntimeError:
+            # Playback stopped in the meantime
+            return
+        # (Droppable - if the worker is behind, the next sample will do just as well)
+        Store.post_event('position', self.record_position, file, position, droppable=True)
+
+    def record_position(self, file: str, position: float):
+        """
+        (Event worker) Record where the current playback is up to, for later resumes
+
+        :param file: the file that was playing when the position was sampled
+        :param position: the position, in seconds
+        """
+        # Make sure the sample is for the current playback - playback may have moved on between the sample and this event
+        if not Store.current_playback or file != self.playing_file or Store.current_playback.source == "pvr_live":
+            return
+        Store.current_playback.resumetime = position
+        # Periodically checkpoint the resume point to disk, so it survives a crash (this is rate limited by the journal)
+        Store.journal.checkpoint(Store.current_playback)
 
     # Playback finished 'naturally'
     def onPlayBackEnded(self):
-        self.onPlaybackFinished()
+        Store.post_event('playback ended', self.onPlaybackFinished)
 
     # User stopped playback
     def onPlayBackStopped(self):
-        self.onPlaybackFinished()
+        Store.post_event('playback stopped', self.onPlaybackFinished)
 
-    @staticmethod
-    def onPlaybackFinished():
+    @timed('KodiPlayer.onPlaybackFinished')
+    def onPlaybackFinished(self):
         """
-        Playback has finished - we need to update the PlaybackList and save it to file, and, if the user desires, force Kodi to browse to the appropriate show/season
+        (Event worker) Playback has finished - we need to update the PlaybackList and save it to file, and, if the user desires, force Kodi to browse to the appropriate show/season
 
         :return:
         """
@@ -69,12 +182,19 @@ class KodiPlayer(xbmc.Player):
             Logger.error("onPlaybackFinished with no current playback details available?! ...not recording this playback")
             return
 
-        Store.switchback.load_or_init()
+        # Make sure the background gathering of the playback details has finished, before recording the playback
+        self.enricher.wait(Store.current_playback)
 
-        Logger.debug("onPlaybackFinished with Store.current_playback:")
-        Logger.debug(Store.current_playback)
-        Logger.debug("onPlaybackFinished with Store.switchback.list:")
-        Logger.debug(Store.switchback.list)
+        # The service owns the list (the plugin sends its edits here, see service_state.request_edit), so it never needs re-loading from
+        # the file - just bring it up to date with the library (only library items that may have changed since they were last checked
+        # are checked again, so usually there is no library round trip at all).  It is saved below.
+        Store.switchback.check_library(library_changed=library_changed_time())
+
+        if debug_logging_enabled():
+            Logger.debug("onPlaybackFinished with Store.current_playback:")
+            Logger.debug(Store.current_playback)
+            Logger.debug("onPlaybackFinished with Store.switchback.list:")
+            Logger.debug(Store.switchback.list)
 
         # Was this a Switchback-initiated playback?
         # (This property was set above in onAVStarted if the ListItem property was set, or explicitly in the PVR HACK! section in switchback_plugin.py this we only need to test for this)
@@ -99,38 +219,35 @@ class KodiPlayer(xbmc.Player):
                     window += f'/{Store.current_playback.season}'
                 xbmc.executebuiltin(f'ActivateWindow(Videos,{window},return)')
 
-        # This rather long-winded approach is used to keep ALL the details recorded from the original playback
-        # (in case they don't make it through when the playback is Switchback initiated - as sometimes seems to be the case)
-        playback_to_remove = Store.switchback.find_playback_by_path(Store.current_playback.path)
-        if playback_to_remove:
-            Logger.debug("Updating Playback and list order")
-            # Remove it from its current position
-            Store.switchback.list.remove(playback_to_remove)
-            # Update with the current playback times
-            if Store.current_playback.source != "pvr_live":
-                playback_to_remove.update({'resumetime': Store.current_playback.resumetime, 'totaltime': Store.current_playback.totaltime})
-            # Re-insert at the top of the list
-            Store.switchback.list.insert(0, playback_to_remove)
-        else:
-            Store.switchback.list.insert(0, Store.current_playback)
+        # Record at the top of the list, keeping the details of any previous matching playback
+        # Matching is on the Playback's identities (library dbid, PVR channel, file, path) - so the same media played via a different route is not duplicated
+        Store.switchback.record_playback(Store.current_playback)
 
         # Trim the list to the max length
-        Store.switchback.list = Store.switchback.list[0:Store.maximum_list_length]
-        # Finally, save the updated PlaybackList
+        removed_playbacks = Store.switchback.trim(Store.maximum_list_length)
+
+        # Have the artwork ready in Kodi's texture cache for when the list is next displayed, and drop that of playbacks no longer in the list
+        # (Only the fields needed are read from the rest of the list, so the entries are not all decoded)
+        if Store.artwork_cache:
+            Store.artwork_cache.warm([art_of(Store.switchback[0])])
+            if removed_playbacks:
+                Store.artwork_cache.evict([art_of(playback) for playback in removed_playbacks], Store.switchback.fields(*ART_FIELDS))
+        # Finally, save the updated PlaybackList - the in-progress checkpoints are then no longer needed
         Store.switchback.save_to_file()
-        Logger.debug("Saved updated Store.switchback.list:", Store.switchback.list)
+        Store.journal.clear()
+        # (Nothing is playing now, so there are no more positions to record)
+        self.playing_file = None
+        if debug_logging_enabled():
+            Logger.debug("Saved updated Store.switchback.list:", Store.switchback.list)
 
-        # & make sure the context menu items are updated
+        # & make sure the context menu items, and the snapshot used by the plugin's Switchback mode, are updated
         Store.update_switchback_context_menu()
-
-        # And update the current view so if we're in the Switchback plugin listing, it gets refreshed
-        # Use a delayed refresh to ensure Kodi has fully returned to the listing - but don't block, use threading
-        def delayed_refresh():
-            xbmc.sleep(200)  # Wait 200ms for UI to settle
-            xbmc.executebuiltin("Container.Refresh")
-
-        import threading
-        threading.Thread(target=delayed_refresh).start()
-
-        # ALTERNATIVE, but behaviour is slower/more visually janky
-        # xbmc.executebuiltin('AlarmClock(SwitchbackRefresh,Container.Refresh,00:00:01,silent)')
+        Store.publish_snapshot()
+        # ...and that the next instant Switchback target is ready to go
+        if Store.standby:
+            Store.standby.prepare()
+
+        # And if we're (back) in the Switchback plugin listing, refresh it
+        # (Delayed, to ensure Kodi has fully returned to the listing, and only if it is on screen - see RefreshScheduler)
+        if Store.refresh_scheduler:
+            Store.refresh_scheduler.request()
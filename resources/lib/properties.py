@@ -0,0 +1,65 @@
+from typing import Dict, List
+
+from bossanova808.constants import HOME_WINDOW
+from bossanova808.utilities import set_property, clear_property
+
+# Skin widget properties, for each of the top Playbacks in the Switchback list, e.g. Window(Home).Property(Switchback.1.Label)
+WIDGET_PROPERTY = 'Switchback.{index}.{name}'
+WIDGET_PROPERTY_NAMES = ['Label', 'Path', 'Thumb', 'Poster', 'Fanart', 'Icon', 'Progress']
+# ...and how many there are
+WIDGET_COUNT_PROPERTY = 'Switchback.Count'
+# The most Playbacks that can be published
+WIDGET_MAXIMUM_LENGTH = 20
+
+
+def widget_properties(playbacks: List, length: int) -> Dict[str, str]:
+    """
+    The skin widget properties for the top of the Switchback list
+
+    :param playbacks: the Playbacks at the top of the Switchback list (only the first length of them are published)
+    :param length: the number of Playbacks to publish - slots beyond the end of the list are blank
+    :return: dict of property name -> value ('' for properties to clear)
+    """
+    playbacks = playbacks[:max(length, 0)]
+    properties = {WIDGET_COUNT_PROPERTY:str(len(playbacks))}
+    for index in range(1, WIDGET_MAXIMUM_LENGTH + 1):
+        playback = playbacks[index - 1] if index <= len(playbacks) else None
+        values = dict.fromkeys(WIDGET_PROPERTY_NAMES, '')
+        if playback:
+            progress = ''
+            if playback.source != "pvr_live" and playback.resumetime and playback.totaltime:
+                progress = str(min(int(playback.resumetime / playback.totaltime * 100), 100))
+            values.update({
+                    'Label':playback.pluginlabel,
+                    'Path':playback.path or '',
+                    'Thumb':playback.thumbnail or '',
+                    'Poster':playback.poster or '',
+                    'Fanart':playback.fanart or '',
+                    'Icon':playback.icon or '',
+                    'Progress':progress,
+            })
+        for name, value in values.items():
+            properties[WIDGET_PROPERTY.format(index=index, name=name)] = value
+    return properties
+
+
+def publish_properties(properties: Dict[str, str], window=HOME_WINDOW) -> int:
+    """
+    Publish window properties, writing only those whose values have changed.
+    Every property write can trigger skin updates, so unchanged properties are left well alone.
+    (The values are compared to those actually on the window, rather than remembered, as both the plugin and service publish)
+
+    :param properties: dict of property name -> value ('' to clear the property)
+    :param window: the window to publish them on (default: the Home Window)
+    :return: the number of properties written
+    """
+    writes = 0
+    for name, value in properties.items():
+        if window.getProperty(name) == value:
+            continue
+        if value:
+            set_property(window, name, value)
+        else:
+            clear_property(window, name)
+        writes += 1
+    return writes
@@ -0,0 +1,276 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import xbmc
+import xbmcvfs
+
+from bossanova808.logger import Logger
+from bossanova808.utilities import send_kodi_json
+from resources.lib.playback import fetch_library_details
+
+# The result of checking a Switchback list entry
+REACHABLE = 'reachable'
+# ...it is definitely gone (e.g. the file was deleted, the library item or PVR recording removed, the addon uninstalled)
+MISSING = 'missing'
+# ...or it could not be checked (in time) - e.g. its network share is down, asleep, or refusing connections - so it may well be back later
+TIMED_OUT = 'timed out'
+
+
+def share_of(file: str) -> str:
+    """
+    :return: the share a file is on, e.g. smb://nas - so slow shares can be timed out as a whole ('' for local files)
+    """
+    if '://' not in file:
+        return ''
+    scheme, rest = file.split('://', 1)
+    if scheme in ['special', 'file']:
+        return ''
+    return f"{scheme}://{rest.split('/', 1)[0]}"
+
+
+def share_root(file: str) -> str:
+    """
+    :return: the top folder of the share a file is on, e.g. smb://nas/tv/ - to tell whether the share itself is answering ('' for local files)
+    """
+    share = share_of(file)
+    if not share:
+        return ''
+    rest = file[len(share) + 1:]
+    return f"{share}/{rest.split('/', 1)[0]}/" if '/' in rest else f"{share}/"
+
+
+class ReachabilityScanner:
+    """
+    (Service only) Checks, in the background, that the entries in the Switchback list can (still) be played - so dead entries can be
+    shown as such in the listing, or pruned, rather than only being found out when a Switchback hangs on a network timeout and then fails.
+
+    - Files are checked with xbmcvfs.exists, a few at a time.  Each share is probed with one file first, and if that times out,
+      the rest of the share's entries are marked as timed out without being checked - so a dead share never ties up all the checks.
+      If the probe file is not there, the share's top folder is checked too: a share that is offline (or refusing connections)
+      answers 'not there' for every file, quickly - so its entries are only missing if the share itself answers.
+      A check that times out can't be cancelled (xbmcvfs.exists just carries on waiting), so a share with a check still stuck
+      from an earlier scan is not checked again until that check has returned.  Each scan has its own threads, so checks
+      stuck on a dead share never hold up the checks of later scans.
+    - Library entries are checked with one batched library lookup (and then their files), PVR recordings and channels with one
+      PVR lookup each, and plugin addon entries by whether the addon is enabled.  Other addon streams can't be checked up front.
+    - Results are cached for a while (ttl), so only new entries, or those checked a while ago, are checked by each scan.
+    """
+
+    def __init__(self, max_workers: int = 4, timeout: float = 10, ttl: float = 900):
+        """
+        :param max_workers: the maximum number of file checks in flight at once
+        :param timeout: how long to wait for each share (and then each file) to answer, in seconds
+        :param ttl: how long a result is good for, in seconds
+        """
+        self._max_workers = max_workers
+        # (The current scan's executor - see _check_files)
+        self._executor = None
+        self._timeout = timeout
+        self._ttl = ttl
+        # path -> (result, when it was checked - time.monotonic())
+        self._results = {}
+        # share -> the checks of it that timed out, and may still be running
+        self._stuck = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # Simple counters, e.g. for benchmarks & diagnostics
+        self.scans = 0
+        self.checks = 0
+        self.timeouts = 0
+
+    def result(self, path: str) -> Optional[str]:
+        """
+        :return: the (unexpired) result of the last check of a list entry - REACHABLE, MISSING or TIMED_OUT - or None if not known
+        """
+        with self._lock:
+            result = self._results.get(path)
+        if result is None or time.monotonic() - result[1] > self._ttl:
+            return None
+        return result[0]
+
+    def scan(self, entries: List[tuple], on_scanned=None) -> bool:
+        """
+        Start a background scan of Switchback list entries (unless one is already running)
+
+        :param entries: (path, file, source, type, dbid, channelid) of each entry - see PlaybackList.fields
+        :param on_scanned: (optional) called, on the scan's thread, with a dict of path -> result for the entries checked by this scan
+        :return: True if the scan was started
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(target=self._scan, args=(entries, on_scanned), name="Switchback reachability scan", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Stop scanning (any file checks still stuck on a dead share are abandoned)
+
+        :param timeout: (optional) maximum time to wait for the scan to finish, in seconds - by default, the per-share timeout
+        """
+        executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(self._timeout if timeout is None else timeout)
+
+    def _scan(self, entries: List[tuple], on_scanned) -> None:
+        due = [entry for entry in entries if entry[0] and self.result(entry[0]) is None]
+        if not due:
+            return
+        start = time.perf_counter()
+        results = {}
+        try:
+            results.update(self._check_pvr([entry for entry in due if entry[2] in ["pvr_live", "pvr_recording"]]))
+            results.update(self._check_addons([entry for entry in due if entry[2] == "addon"]))
+            # Library entries that are still in the library still need their files checked, just like non-library files
+            library_entries = [entry for entry in due if entry[2] == "kodi_library"]
+            results.update(self._check_library(library_entries))
+            files = [entry for entry in due if entry[2] == "file" or (entry[2] == "kodi_library" and entry[0] not in results)]
+            results.update(self._check_files(files))
+        except Exception as error:
+            Logger.error("Error scanning the Switchback list for unavailable entries:", error)
+
+        now = time.monotonic()
+        with self._lock:
+            for path, result in results.items():
+                self._results[path] = (result, now)
+            self.scans += 1
+            self.checks += len(results)
+        unreachable = sum(1 for result in results.values() if result != REACHABLE)
+        Logger.debug(f"Checked {len(results)} Switchback list entries in {(time.perf_counter() - start) * 1000:.0f}ms - {unreachable} unavailable")
+        if on_scanned:
+            on_scanned(results)
+
+    @staticmethod
+    def _check_library(entries: List[tuple]) -> Dict[str, str]:
+        """
+        :return: path -> MISSING for the library entries that are no longer in the library (the rest still need their files checked)
+        """
+        if not entries:
+            return {}
+        in_library = fetch_library_details((media_type, dbid) for _, _, _, media_type, dbid, _ in entries)
+        # (No answer at all means these can't be checked against the library, rather than that they are gone - so just check their files)
+        if in_library is None:
+            return {}
+        return {path:MISSING for path, _, _, media_type, dbid, _ in entries if (media_type, dbid) not in in_library}
+
+    @staticmethod
+    def _check_pvr(entries: List[tuple]) -> Dict[str, str]:
+        """
+        :return: path -> result for PVR recordings (by the recordings' files), and PVR channels - TV and radio - (by channel id, if known)
+        """
+        results = {}
+        recordings = [entry for entry in entries if entry[2] == "pvr_recording"]
+        if recordings:
+            response = send_kodi_json('Get PVR recordings', {"jsonrpc":"2.0", "id":"PVR.GetRecordings", "method":"PVR.GetRecordings",
+                                                             "params":{"properties":["file"]}})
+            # (No answer - e.g. PVR not enabled - means these can't be checked, rather than that they are gone)
+            if response and 'result' in response:
+                files = {recording.get('file') for recording in response['result'].get('recordings') or []}
+                for path, file, *_ in recordings:
+                    results[path] = REACHABLE if path in files or file in files else MISSING
+        channels = [entry for entry in entries if entry[2] == "pvr_live" and entry[5]]
+        if channels:
+            channel_ids = set()
+            answered = True
+            # (Live PVR playbacks may be radio channels too)
+            for group in ["alltv", "allradio"]:
+                response = send_kodi_json(f'Get PVR channels ({group})', {"jsonrpc":"2.0", "id":"PVR.GetChannels", "method":"PVR.GetChannels",
+                                                                          "params":{"channelgroupid":group}})
+                if response and 'result' in response:
+                    channel_ids.update(channel.get('channelid') for channel in response['result'].get('channels') or [])
+                else:
+                    answered = False
+            for path, *_, channelid in channels:
+                if channelid in channel_ids:
+                    results[path] = REACHABLE
+                # Only gone if it is in neither group - if either couldn't be asked, it may well be in that one
+                elif answered:
+                    results[path] = MISSING
+        return results
+
+    @staticmethod
+    def _check_addons(entries: List[tuple]) -> Dict[str, str]:
+        """
+        :return: path -> result for plugin addon entries, by whether the addon is (still) installed and enabled
+        """
+        results = {}
+        for path, *_ in entries:
+            if path.startswith('plugin://'):
+                addon_id = urlparse(path).netloc
+                results[path] = REACHABLE if xbmc.getCondVisibility(f'System.AddonIsEnabled({addon_id})') else MISSING
+        return results
+
+    def _check_files(self, entries: List[tuple]) -> Dict[str, str]:
+        """
+        :return: path -> result for entries checked by their file - with each share given its own timeout
+        """
+        shares = OrderedDict()
+        for entry in entries:
+            if entry[1]:
+                shares.setdefault(share_of(entry[1]), []).append(entry)
+
+        results = {}
+        # Don't check shares that still have a check stuck from an earlier scan - they would just tie up another thread
+        with self._lock:
+            for share in list(self._stuck):
+                self._stuck[share] = [check for check in self._stuck[share] if not check.done()]
+                if not self._stuck[share]:
+                    del self._stuck[share]
+            stuck_shares = set(self._stuck)
+        for share in [share for share in shares if share in stuck_shares]:
+            Logger.debug(f"Share {share or '(local)'} still has a check stuck from an earlier scan - not checking its {len(shares[share])} entries")
+            results.update({path:TIMED_OUT for path, *_ in shares.pop(share)})
+        if not shares:
+            return results
+
+        # Threads of this scan's own, and enough of them that every share's probe starts straight away (so no probe is timed out
+        # just for waiting behind another share's)
+        executor = self._executor = ThreadPoolExecutor(max_workers=max(self._max_workers, len(shares)), thread_name_prefix="Switchback reachability")
+        try:
+            # Probe each share with one of its files first...
+            probes = {share:(time.monotonic(), executor.submit(xbmcvfs.exists, share_entries[0][1])) for share, share_entries in shares.items()}
+            pending = []
+            for share, (submitted, probe) in probes.items():
+                result = self._wait(share, probe, submitted)
+                share_entries = shares[share]
+                if result == TIMED_OUT:
+                    # ...and if it doesn't answer in time, don't wait on the rest of it too
+                    Logger.warning(f"Share {share or '(local)'} did not answer within {self._timeout}s - not checking its {len(share_entries)} entries")
+                    results.update({path:TIMED_OUT for path, *_ in share_entries})
+                    continue
+                if result == MISSING and share:
+                    root = share_root(share_entries[0][1])
+                    if self._wait(share, executor.submit(xbmcvfs.exists, root), time.monotonic()) != REACHABLE:
+                        # ...and if the share itself isn't there, its files can't be checked - rather than being gone
+                        Logger.warning(f"Share {share} is not available ({root}) - not checking its {len(share_entries)} entries")
+                        results.update({path:TIMED_OUT for path, *_ in share_entries})
+                        continue
+                results[share_entries[0][0]] = result
+                pending.extend((share, path, time.monotonic(), executor.submit(xbmcvfs.exists, file)) for path, file, *_ in share_entries[1:])
+            for share, path, submitted, check in pending:
+                results[path] = self._wait(share, check, submitted)
+        finally:
+            # (Checks stuck on a dead share are left to finish on their own - see _stuck)
+            executor.shutdown(wait=False)
+        return results
+
+    def _wait(self, share: str, check, submitted: float) -> str:
+        """
+        :return: the result of a file check, waiting no longer than the timeout (from when it was submitted)
+        """
+        try:
+            return REACHABLE if check.result(timeout=max(0.0, submitted + self._timeout - time.monotonic())) else MISSING
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+                # (It can't be cancelled if it is already running - so remember it, until it returns)
+                if not check.cancel():
+                    self._stuck.setdefault(share, []).append(check)
+            return TIMED_OUT
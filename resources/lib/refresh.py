@@ -0,0 +1,84 @@
+import threading
+
+import xbmc
+
+from bossanova808.logger import Logger
+
+
+def switchback_listing_visible() -> bool:
+    """
+    :return: True if the Switchback plugin listing is the container currently on screen
+    """
+    return (xbmc.getInfoLabel('Container.PluginName') == 'plugin.switchback'
+            or xbmc.getInfoLabel('Container.FolderPath').startswith('plugin://plugin.switchback'))
+
+
+class RefreshScheduler:
+    """
+    (Service only) A single, long-lived, background worker that refreshes the Switchback plugin listing when the list changes.
+
+    - Bursts of refresh requests are coalesced into a single Container.Refresh.
+    - The refresh waits a moment for the UI to settle (e.g. for Kodi to return to the listing after playback stops)...
+    - ...and only happens if the Switchback listing is actually on screen - refreshing any other container (e.g. a big library view)
+      is expensive, and pointless.
+    """
+
+    def __init__(self, delay: float = 0.2, settle_time: float = 1.0):
+        """
+        :param delay: how long to wait after a request, for any more requests/for the UI to settle, in seconds
+        :param settle_time: how long to keep checking for the Switchback listing to appear, after a request, in seconds
+        """
+        self.delay = delay
+        self.settle_time = settle_time
+        self._requested = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        # Simple counters, e.g. for benchmarks & diagnostics
+        self.requests = 0
+        self.refreshes = 0
+
+    def request(self) -> None:
+        """
+        Request a refresh of the Switchback listing (if it is on screen)
+        """
+        with self._lock:
+            self.requests += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="Switchback refresh scheduler", daemon=True)
+                self._thread.start()
+        self._requested.set()
+
+    def stop(self, timeout: float = 5) -> None:
+        """
+        Stop the worker (any pending refresh is dropped)
+
+        :param timeout: maximum time to wait for the worker to finish, in seconds
+        """
+        self._stopping.set()
+        self._requested.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            self._requested.wait()
+            waited = 0.0
+            while not self._stopping.is_set():
+                self._requested.clear()
+                if self._stopping.wait(self.delay):
+                    break
+                waited += self.delay
+                # More requests arrived while waiting - wait a little longer, so they are all handled by the one refresh
+                if self._requested.is_set() and waited < self.settle_time:
+                    continue
+                if switchback_listing_visible():
+                    Logger.debug("Refreshing the Switchback listing")
+                    xbmc.executebuiltin("Container.Refresh")
+                    self.refreshes += 1
+                    break
+                if waited >= self.settle_time:
+                    Logger.debug("Switchback listing not on screen, so not refreshing")
+                    break
+            if self._stopping.is_set():
+                return
@@ -0,0 +1,161 @@
+import time
+from typing import Optional, Tuple
+
+import xbmc
+
+from bossanova808.constants import HOME_WINDOW
+from bossanova808.logger import Logger
+from bossanova808.utilities import set_property, clear_property, send_kodi_json
+
+# (This module is imported by the context menu, so must stay light - nothing from the Store, Playbacks, or infotagger in here)
+
+# The service 'beats' this Home Window property (the time, in seconds since the epoch) while it is running, so that the
+# context menu and plugin can tell whether the service is there to answer requests.
+HEARTBEAT_PROPERTY = 'Switchback_Service_Heartbeat'
+HEARTBEAT_INTERVAL = 5
+# ...and the service is considered gone if it has not beaten for this long
+HEARTBEAT_TIMEOUT = 15
+
+# The service records when (in seconds since the epoch) it last saw the Kodi library change, so that Playbacks checked against
+# the library since then don't need to be checked again (see PlaybackList.load_or_init)
+LIBRARY_CHANGED_PROPERTY = 'Switchback_Library_Changed'
+
+# Requests are sent to the service with: NotifyAll(plugin.switchback,<request>) - which the service receives as Other.<request>
+SWITCHBACK_SENDER = 'plugin.switchback'
+# Instant Switchback
+SWITCHBACK_METHOD = 'Other.switchback'
+# Refresh the Switchback listing
+REFRESH_METHOD = 'Other.refresh'
+# Edit the Switchback list (the edit is in the notification data - see request_edit)
+EDIT_METHOD = 'Other.edit'
+
+# The original (plugin) route to Switchback, used whenever the service can't answer the request itself
+PLUGIN_SWITCHBACK = 'PlayMedia(plugin://plugin.switchback/?mode=switchback,resume)'
+
+# When (time.monotonic() - which is system wide, so comparable between the context menu, plugin and service processes) a Switchback
+# was triggered, and by what route - so the service can measure how long it took for the playback to start (see LatencyHistograms)
+TRIGGERED_PROPERTY = 'Switchback_Triggered'
+# Switchback routes
+ROUTE_CONTEXT_MENU = 'context_menu'
+ROUTE_PLUGIN = 'plugin'
+ROUTE_LISTING = 'listing'
+# A trigger older than this (in seconds) never resulted in a playback (e.g. it failed), so is ignored
+TRIGGER_TIMEOUT = 60
+
+
+def beat() -> None:
+    """
+    (Service only) Record that the service is alive, and ready to answer requests
+    """
+    set_property(HOME_WINDOW, HEARTBEAT_PROPERTY, str(int(time.time())))
+
+
+def service_is_ready() -> bool:
+    """
+    :return: True if the service has beaten recently, i.e. it is running and can answer requests
+    """
+    try:
+        return time.time() - float(HOME_WINDOW.getProperty(HEARTBEAT_PROPERTY)) < HEARTBEAT_TIMEOUT
+    except ValueError:
+        return False
+
+
+def library_changed(when: Optional[float] = None) -> None:
+    """
+    (Service only) Record that the Kodi library has (or may have) just changed
+
+    :param when: (optional) when it changed, in seconds since the epoch.  Default: now
+    """
+    set_property(HOME_WINDOW, LIBRARY_CHANGED_PROPERTY, str(time.time() if when is None else when))
+
+
+def library_changed_time() -> Optional[float]:
+    """
+    :return: when the Kodi library last changed, or None if that is not known (the service is not running to keep track of it)
+    """
+    if not service_is_ready():
+        return None
+    try:
+        return float(HOME_WINDOW.getProperty(LIBRARY_CHANGED_PROPERTY))
+    except ValueError:
+        return None
+
+
+def record_trigger(route: str) -> None:
+    """
+    Record that a Switchback has just been triggered (unless one already was, moments ago - e.g. the context menu falling back to the
+    plugin - so the time is always from what the user actually did)
+
+    :param route: how it was triggered - ROUTE_CONTEXT_MENU, ROUTE_PLUGIN or ROUTE_LISTING
+    """
+    if _pending_trigger() is None:
+        set_property(HOME_WINDOW, TRIGGERED_PROPERTY, f"{time.monotonic()}|{route}")
+
+
+def _pending_trigger() -> Optional[Tuple[float, str]]:
+    """
+    :return: (when, route) of the Switchback trigger still waiting for its playback to start, if any
+    """
+    try:
+        when, route = HOME_WINDOW.getProperty(TRIGGERED_PROPERTY).split('|', 1)
+        when = float(when)
+    except ValueError:
+        return None
+    if time.monotonic() - when > TRIGGER_TIMEOUT:
+        return None
+    return when, route
+
+
+def take_trigger() -> Optional[Tuple[float, str]]:
+    """
+    (Service only) Take (and clear) the Switchback trigger, now that a Switchback playback has started
+
+    :return: (when - time.monotonic(), route) of the trigger, or None if there isn't one (or it is too old to be this playback's)
+    """
+    trigger = _pending_trigger()
+    clear_property(HOME_WINDOW, TRIGGERED_PROPERTY)
+    return trigger
+
+
+def request_switchback() -> None:
+    """
+    Ask the service to Switchback instantly, or fall back to the plugin if the service is not running
+    """
+    record_trigger(ROUTE_CONTEXT_MENU)
+    if service_is_ready():
+        Logger.debug("Requesting instant Switchback from the service")
+        xbmc.executebuiltin(f'NotifyAll({SWITCHBACK_SENDER},switchback)')
+    else:
+        Logger.info("Switchback service not running - using the plugin to Switchback")
+        xbmc.executebuiltin(PLUGIN_SWITCHBACK)
+
+
+def request_refresh() -> None:
+    """
+    Ask the service to refresh the Switchback listing, or refresh it directly if the service is not running
+    """
+    if service_is_ready():
+        xbmc.executebuiltin(f'NotifyAll({SWITCHBACK_SENDER},refresh)')
+    else:
+        xbmc.executebuiltin("Container.Refresh")
+
+
+def request_edit(edit: dict) -> bool:
+    """
+    Ask the service to edit the Switchback list.  When the service is running, it is the only writer of the list - it owns the list
+    in memory, and saves it - so edits from the plugin are sent to it, rather than the plugin saving the list file itself.
+
+    :param edit: the edit, see PlaybackList.apply_edit
+    :return: True if the edit was sent to the service, False if the service is not running (so the caller must make the edit itself)
+    """
+    if not service_is_ready():
+        return False
+    Logger.debug("Sending Switchback list edit to the service:", edit)
+    # (JSON-RPC, rather than the NotifyAll builtin, so the edit can be sent as the notification data)
+    send_kodi_json("Switchback list edit", {
+            "jsonrpc":"2.0",
+            "id":"JSONRPC.NotifyAll",
+            "method":"JSONRPC.NotifyAll",
+            "params":{"sender":SWITCHBACK_SENDER, "message":"edit", "data":edit},
+    })
+    return True
@@ -0,0 +1,141 @@
+import threading
+from urllib.parse import urlparse
+
+import xbmc
+import xbmcvfs
+
+from bossanova808.constants import TRANSLATE
+from bossanova808.logger import Logger
+from bossanova808.notify import Notify
+from resources.lib.playback import play_pvr_channel
+from resources.lib.service_state import PLUGIN_SWITCHBACK
+from resources.lib.store import Store
+
+
+class StandbyTarget:
+    """
+    (Service only) Keeps the next Switchback target - list[1], or list[0] if that is all there is - ready to play at all times.
+    Its ListItem is pre-built, and its file/addon is checked (in the background) as soon as the list changes, so that an
+    instant Switchback request can be answered straight away by the service with xbmc.Player().play(), rather than by starting
+    up the plugin (a new Python interpreter, a full Store() load, and building the ListItem) and waiting for setResolvedUrl.
+    """
+
+    def __init__(self):
+        self.playback = None
+        self.list_item = None
+        # None = not checked (yet), otherwise the result of the check
+        self.available = None
+        # The Switchback list file signature the target was prepared from (see Store.get_file_signature)
+        self.signature = None
+        self._lock = threading.Lock()
+        # Targets are checked by a single, long-lived, worker - and only the latest target is checked, as any before it are already stale
+        self._to_check = None
+        self._check_wanted = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def prepare(self) -> None:
+        """
+        Prepare the current Switchback target from the (service's) Switchback list.  Call whenever the list changes.
+        """
+        with self._lock:
+            self.signature = Store.get_file_signature(Store.switchback.file)
+            if not len(Store.switchback):
+                self.playback = self.list_item = None
+                self.available = False
+                Logger.debug("Standby Switchback target: none (the Switchback list is empty)")
+                return
+            self.playback = Store.switchback[1] if len(Store.switchback) > 1 else Store.switchback[0]
+            self.available = None
+            # Live PVR is played by channel, not with a ListItem - see play_pvr_channel
+            if self.playback.source == "pvr_live":
+                self.list_item = None
+            else:
+                self.list_item = self.playback.create_list_item_from_playback(offscreen=True)
+                self.list_item.setProperty('Switchback', self.playback.path)
+                # Player.play() does not pick up the resume point from the video info tag, so tell Kodi where to start explicitly
+                if self.playback.resumetime:
+                    self.list_item.setProperty('StartOffset', str(self.playback.resumetime))
+            playback = self.playback
+        Logger.debug("Standby Switchback target is:", playback.pluginlabel)
+        # Check the target can be played in the background, as this can be slow (e.g. waking up a NAS - which is no bad thing to have done early, either)
+        with self._lock:
+            self._to_check = playback
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="Switchback standby check", daemon=True)
+                self._thread.start()
+        self._check_wanted.set()
+
+    def stop(self) -> None:
+        """
+        Stop the checking worker (a check already underway is abandoned)
+        """
+        self._stopping = True
+        self._check_wanted.set()
+
+    def _run(self) -> None:
+        while True:
+            self._check_wanted.wait()
+            self._check_wanted.clear()
+            if self._stopping:
+                return
+            with self._lock:
+                playback, self._to_check = self._to_check, None
+            if playback is not None:
+                try:
+                    self._check(playback)
+                except Exception as error:
+                    Logger.error("Error checking the standby Switchback target:", error)
+
+    def _check(self, playback) -> None:
+        """
+        Check a target can (still) be played - its file exists, or its addon is installed and enabled
+        """
+        if playback.source == "addon" and playback.path.startswith('plugin://'):
+            addon_id = urlparse(playback.path).netloc
+            available = xbmc.getCondVisibility(f'System.AddonIsEnabled({addon_id})')
+        elif playback.source in ["pvr_live", "pvr_recording", "addon"]:
+            # PVR (and non-plugin addon streams) can't be meaningfully checked up front - assume they are fine
+            available = True
+        else:
+            available = xbmcvfs.exists(playback.file)
+        with self._lock:
+            if playback is self.playback:
+                self.available = bool(available)
+        if not available:
+            Logger.warning(f"Standby Switchback target is not currently available: [{playback.file}]")
+
+    def play(self) -> None:
+        """
+        Answer an instant Switchback request - play the standby target, or fall back to the plugin if it can't be played directly
+        """
+        # If the list file has changed underneath the service, re-prepare the target first.  (This shouldn't happen, as the service is the
+        # only writer of the list while it is running - but the plugin saves the list itself if the service looked not to be running)
+        # (Reloaded without checking it against the Kodi library - this is the Switchback hot path, and the playback is checked anyway)
+        if self.signature != Store.get_file_signature(Store.switchback.file):
+            Logger.debug("Switchback list file has changed - reloading it and re-preparing the standby Switchback target")
+            Store.switchback.load_or_init(window=(0, 0))
+            self.prepare()
+
+        with self._lock:
+            playback, list_item, available = self.playback, self.list_item, self.available
+
+        if not playback:
+            Notify.error(TRANSLATE(32007))
+            Logger.error("No Switchback found to play")
+            return
+        if available is False:
+            Logger.warning("Standby Switchback target was not available when checked - handing over to the plugin")
+            xbmc.executebuiltin(PLUGIN_SWITCHBACK)
+            return
+
+        Logger.info(f"Instant Switchback! Switching back to: {playback.pluginlabel}")
+        Notify.kodi_notification(f"{playback.pluginlabel_short}", 3000, playback.poster or playback.icon)
+        # So onAVStarted knows this playback is Switchback-triggered
+        Store.update_home_window_switchback_property(playback.path)
+
+        if list_item is None:
+            play_pvr_channel(playback.path, playback.channelid)
+        else:
+            xbmc.Player().play(list_item.getPath(), list_item)
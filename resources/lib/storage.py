@@ -0,0 +1,475 @@
+import os
+import json
+import hashlib
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import sqlite3
+
+# Version history of the Switchback list file format:
+# 1 - (Switchback <= 2.0.0) a bare, pretty-printed, JSON array of Playback dicts, including all None fields
+# 2 - {"version": 2, "playbacks": [...]} - compact JSON (no pretty printing), with None fields omitted
+# 3 - {"version": 3, "fields": [...], "playbacks": [[...], ...]} - each Playback is a row of values in field order (trailing None fields trimmed)
+#     (Since written with a "count" of the playbacks ahead of them, so that a page of the list can be read without decoding the rest)
+STORAGE_VERSION = 3
+# What precedes the playback rows, in a version 3 file
+PLAYBACKS_KEY = '"playbacks":['
+
+
+class JsonStorage:
+    """
+    Versioned, compact JSON storage for the Switchback list.
+    Deliberately has no Kodi dependencies, so it can be benchmarked outside of Kodi (see benchmarks/bench_storage.py)
+
+    - Saves are atomic (temp file, fsync, os.replace, fsync of the directory), so the list file is never left half written.
+    - Saves of unchanged content are skipped (dirty tracking via a digest of the last loaded/saved content).
+    - Older formats are read transparently, and are reported so that the caller can migrate (re-save) them.
+    - Playbacks are stored as rows of values, in the order given by fields - the field names are stored once, in the file header,
+      so rows can be mapped back to fields even if the field order changes between versions.
+    """
+
+    def __init__(self, file: str, fields: Sequence[str]):
+        self.file = file
+        self.fields = list(fields)
+        self._digest = None
+        # Simple counters, e.g. for benchmarks & diagnostics
+        self.writes = 0
+        self.bytes_written = 0
+
+    def encode(self, rows: List[list]) -> bytes:
+        """
+        Encode a list of Playback rows in the current (compact) format
+
+        :param rows: list of Playback rows (values in field order)
+        :return: the encoded list, as UTF-8 bytes
+        """
+        compact = []
+        for row in rows:
+            length = len(row)
+            while length and row[length - 1] is None:
+                length -= 1
+            compact.append(row[:length])
+        return json.dumps({'version':STORAGE_VERSION, 'fields':self.fields, 'count':len(compact), 'playbacks':compact}, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data: bytes) -> Tuple[List[list], int]:
+        """
+        Decode the content of a Switchback list file, in any supported format version, to rows in the current field order
+
+        :param data: the raw file content
+        :return: tuple of (list of Playback rows, format version)
+        :raises ValueError: if the content is not a valid Switchback list
+        """
+        content = json.loads(data.decode('utf-8'))
+        if isinstance(content, list):
+            return [self._dict_to_row(playback) for playback in content], 1
+        if isinstance(content, dict) and isinstance(content.get('playbacks'), list):
+            version = content.get('version')
+            if not isinstance(version, int) or version > STORAGE_VERSION:
+                raise ValueError(f"Unsupported Switchback list version: {version}")
+            if version < 3:
+                return [self._dict_to_row(playback) for playback in content['playbacks']], version
+            fields = content.get('fields')
+            if fields == self.fields:
+                return content['playbacks'], version
+            # Stored in a different field order - remap each row
+            return [self._dict_to_row(dict(zip(fields, row))) for row in content['playbacks']], version
+        raise ValueError("Switchback list file does not contain a Switchback list")
+
+    def _dict_to_row(self, playback: dict) -> list:
+        """
+        Convert a Playback dict (from an older format) to a row in the current field order (unknown keys are dropped)
+        """
+        if not isinstance(playback, dict):
+            raise ValueError("Switchback list entry is not a Playback")
+        return [playback.get(field) for field in self.fields]
+
+    def load(self) -> Tuple[List[list], bool]:
+        """
+        Load the list of Playback rows from the file
+
+        :return: tuple of (list of Playback rows, True if the file is in an older format and should be re-saved)
+        :raises FileNotFoundError: if there is no list file
+        :raises ValueError: if the file does not contain a valid Switchback list
+        """
+        with open(self.file, 'rb') as list_file:
+            data = list_file.read()
+        rows, version = self.decode(data)
+        self._digest = hashlib.sha1(data).digest()
+        return rows, version < STORAGE_VERSION
+
+    def load_page(self, start: int, count: int) -> Tuple[List[list], int]:
+        """
+        Load just a page of the list - count Playback rows from index start on.  Only the rows up to the end of the page are decoded
+        (the file header gives the length of the whole list) - unless the file is in an older format, which is decoded in full.
+        (Nothing is recorded as loaded, so the page can't be saved - see save)
+
+        :param start: the index of the first row
+        :param count: the number of rows
+        :return: tuple of (list of Playback rows, the length of the whole list)
+        :raises FileNotFoundError: if there is no list file
+        :raises ValueError: if the file does not contain a valid Switchback list
+        """
+        start = max(start, 0)
+        stop = start + max(count, 0)
+        with open(self.file, 'rb') as list_file:
+            data = list_file.read()
+        text = data.decode('utf-8')
+        playbacks = text.find(PLAYBACKS_KEY)
+        try:
+            header = json.loads(text[:playbacks] + PLAYBACKS_KEY + ']}') if playbacks > 0 else None
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get('version') != STORAGE_VERSION or not isinstance(header.get('count'), int):
+            rows, _ = self.decode(data)
+            return rows[start:stop], len(rows)
+
+        total = header['count']
+        decoder = json.JSONDecoder()
+        rows = []
+        position = playbacks + len(PLAYBACKS_KEY)
+        for index in range(min(stop, total)):
+            row, position = decoder.raw_decode(text, position)
+            if text[position] not in ',]':
+                raise ValueError("Switchback list file does not contain a Switchback list")
+            position += 1
+            if index >= start:
+                rows.append(row)
+        fields = header.get('fields')
+        if fields != self.fields:
+            rows = [self._dict_to_row(dict(zip(fields, row))) for row in rows]
+        return rows, total
+
+    def save(self, rows: List[list], force: bool = False, changed: Optional[List[int]] = None) -> bool:
+        """
+        Atomically save the list of Playback rows to the file, unless the content is unchanged since it was last loaded or saved
+
+        :param rows: list of Playback rows (values in field order)
+        :param force: save even if the content is unchanged
+        :param changed: (ignored - the whole file is written anyway, see SqliteStorage.save)
+        :return: True if the file was written, False if the content was unchanged
+        """
+        data = self.encode(rows)
+        digest = hashlib.sha1(data).digest()
+        if not force and digest == self._digest and os.path.exists(self.file):
+            return False
+
+        directory_name = os.path.dirname(self.file) or None
+        if directory_name:
+            os.makedirs(directory_name, exist_ok=True)
+        # (Imported here, as it is only needed when the list actually changes - and most plugin runs never save at all)
+        import tempfile
+        with tempfile.NamedTemporaryFile('wb', delete=False, dir=directory_name) as temp_file:
+            try:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            except BaseException:
+                temp_file.close()
+                os.remove(temp_file.name)
+                raise
+        os.replace(temp_file.name, self.file)
+        self._fsync_directory(directory_name)
+
+        self._digest = digest
+        self.writes += 1
+        self.bytes_written += len(data)
+        return True
+
+    @staticmethod
+    def _fsync_directory(directory_name) -> None:
+        """
+        Make sure the rename itself is durable (POSIX only - directories can't be opened like this on Windows)
+        """
+        try:
+            directory_fd = os.open(directory_name or '.', os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(directory_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(directory_fd)
+
+    def delete(self) -> None:
+        """
+        Delete the list file (if it exists)
+        """
+        self._digest = None
+        if os.path.exists(self.file):
+            os.remove(self.file)
+
+
+class SqliteStorage:
+    """
+    SQLite storage for the Switchback list - an alternative to JsonStorage (same interface) for very long lists.
+    Also deliberately has no Kodi dependencies (see benchmarks/bench_storage.py)
+
+    - One row per Playback, one column per field, plus last_played - an indexed ordinal (higher = more recently played) that gives
+      the list order, so a page of the list can be read on its own (see load_page).
+    - Saves are incremental: only Playbacks that have changed (or moved) since the list was last loaded/saved are upserted,
+      and only those no longer in the list are deleted.  Given the rows that may have changed (see save), only those are even
+      compared - so e.g. recording a playback is a single row upsert, and little else, however long the list is.
+    - Lookups (by path, library id...) are answered by the PlaybackList's in-memory index, so the only other index is on path.
+    - WAL mode, so the plugin and service processes can safely read and write the database at the same time.
+    - Playbacks are keyed on their path (the Switchback identity that every Playback has - a Playback without one is stored under its file).
+    - On first use, the list is migrated from the JSON list file (if given), which is then renamed, so the migration is one-shot.
+    """
+
+    def __init__(self, file: str, fields: Sequence[str], migrate_from: Optional[str] = None):
+        self.file = file
+        self.fields = list(fields)
+        self._path = self.fields.index('path')
+        self._file = self.fields.index('file')
+        self.migrate_from = migrate_from
+        self._migrating = False
+        # path -> the record (last_played, then the row) as last loaded from/saved to the database
+        self._saved: Dict[str, tuple] = {}
+        # Simple counters, e.g. for benchmarks & diagnostics
+        self.writes = 0
+        self.rows_written = 0
+
+    def _connect(self) -> 'sqlite3.Connection':
+        """
+        Open a connection to the database, creating/updating the table and indexes as needed.
+        (A connection per operation, as saves may come from different threads in the service)
+        """
+        # (sqlite3 is only imported when the database is actually used - it is not needed at all with the JSON list file,
+        # nor by plugin runs answered from the service's snapshot)
+        import sqlite3
+        connection = sqlite3.connect(self.file, timeout=5)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS playbacks (last_played INTEGER NOT NULL, path TEXT NOT NULL UNIQUE)')
+            columns = {column[1] for column in connection.execute('PRAGMA table_info(playbacks)')}
+            # Add columns for any new fields (columns for fields no longer in use are simply ignored)
+            for field in self.fields:
+                if field not in columns:
+                    connection.execute(f'ALTER TABLE playbacks ADD COLUMN "{field}"')
+            connection.execute('CREATE INDEX IF NOT EXISTS playbacks_last_played ON playbacks (last_played)')
+            # (No queries use these - they only slowed down the writes)
+            connection.execute('DROP INDEX IF EXISTS playbacks_dbid_type')
+            connection.execute('DROP INDEX IF EXISTS playbacks_tvshowdbid')
+        return connection
+
+    def _key(self, row: list) -> str:
+        """
+        The key a row is stored under (see above) - without normalising the whole row
+        """
+        return (row[self._path] if len(row) > self._path else None) or row[self._file]
+
+    def _normalise(self, row: list) -> tuple:
+        """
+        Pad a row (which may have had trailing None fields trimmed) to the full field count, and make sure it has a path (see above)
+        """
+        if len(row) == len(self.fields) and row[self._path]:
+            return tuple(row)
+        row = list(row) + [None] * (len(self.fields) - len(row))
+        if not row[self._path]:
+            row[self._path] = row[self._file]
+        return tuple(row)
+
+    def load(self) -> Tuple[List[list], bool]:
+        """
+        Load the list of Playback rows from the database, most recently played first
+
+        :return: tuple of (list of Playback rows, True if the list was migrated from the JSON file and should be saved)
+        :raises FileNotFoundError: if there is no database (and no JSON list file to migrate from)
+        :raises ValueError: if the file is not a valid Switchback list database
+        """
+        self._saved = {}
+        if not os.path.exists(self.file):
+            if self.migrate_from and os.path.exists(self.migrate_from):
+                rows, _ = JsonStorage(self.migrate_from, self.fields).load()
+                self._migrating = True
+                return rows, True
+            raise FileNotFoundError(self.file)
+
+        import sqlite3
+        columns = ', '.join(f'"{field}"' for field in self.fields)
+        try:
+            connection = self._connect()
+            try:
+                records = connection.execute(f'SELECT last_played, {columns} FROM playbacks ORDER BY last_played DESC').fetchall()
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError as error:
+            raise ValueError(f"Not a valid Switchback list database: {error}") from error
+        path = self._path + 1
+        self._saved = {record[path]:record for record in records}
+        return [list(record[1:]) for record in records], False
+
+    def load_page(self, start: int, count: int) -> Tuple[List[list], int]:
+        """
+        Load just a page of the list - count Playback rows from index start on, most recently played first - via the last_played index.
+        (Nothing is recorded as loaded, so the page can't be saved - see save)
+
+        :param start: the index of the first row
+        :param count: the number of rows
+        :return: tuple of (list of Playback rows, the length of the whole list)
+        :raises FileNotFoundError: if there is no database (yet - see load)
+        :raises ValueError: if the file is not a valid Switchback list database
+        """
+        if not os.path.exists(self.file):
+            raise FileNotFoundError(self.file)
+
+        import sqlite3
+        columns = ', '.join(f'"{field}"' for field in self.fields)
+        try:
+            connection = self._connect()
+            try:
+                records = connection.execute(f'SELECT {columns} FROM playbacks ORDER BY last_played DESC LIMIT ? OFFSET ?',
+                                             (max(count, 0), max(start, 0))).fetchall()
+                total = connection.execute('SELECT COUNT(*) FROM playbacks').fetchone()[0]
+            finally:
+                connection.close()
+        except sqlite3.DatabaseError as error:
+            raise ValueError(f"Not a valid Switchback list database: {error}") from error
+        return [list(record) for record in records], total
+
+    def save(self, rows: List[list], force: bool = False, changed: Optional[List[int]] = None) -> bool:
+        """
+        Save the list of Playback rows to the database - only the changes since the list was last loaded or saved are written
+
+        :param rows: list of Playback rows (values in field order), most recently played first
+        :param force: rewrite the whole list (e.g. to initialise the database)
+        :param changed: (optional) the indexes, in order, of the rows that may have changed (or moved, or be new) since the list was
+                        last loaded or saved - every other row must be just as it was.  Only these rows are then compared and
+                        written.  Default: compare every row.
+        :return: True if anything was written, False if the list was unchanged
+        """
+        plan = None
+        if changed is not None and not force and not self._migrating:
+            plan = self._plan_changes(rows, changed)
+        if plan is None:
+            plan = self._plan_all(rows, force)
+        upserts, deletes, saved = plan
+        if not force and not upserts and not deletes:
+            return False
+
+        columns = ', '.join(f'"{field}"' for field in self.fields)
+        placeholders = ', '.join('?' for _ in range(len(self.fields) + 1))
+        updates = ', '.join(f'"{field}"=excluded."{field}"' for field in self.fields if field != 'path')
+        connection = self._connect()
+        try:
+            with connection:
+                if force:
+                    connection.execute('DELETE FROM playbacks')
+                connection.executemany('DELETE FROM playbacks WHERE path = ?', [(key,) for key in deletes])
+                connection.executemany(f'INSERT INTO playbacks (last_played, {columns}) VALUES ({placeholders}) '
+                                       f'ON CONFLICT(path) DO UPDATE SET last_played=excluded.last_played, {updates}', upserts)
+        finally:
+            connection.close()
+
+        self._saved = saved
+        self.writes += 1
+        self.rows_written += len(upserts)
+        if self._migrating:
+            # One-shot migration - keep the old JSON file, but out of the way
+            self._migrating = False
+            os.replace(self.migrate_from, self.migrate_from + '.migrated')
+        return True
+
+    def _plan_all(self, rows: List[list], force: bool) -> Tuple[List[tuple], List[str], Dict[str, tuple]]:
+        """
+        Work out what to write to save the list, comparing every row with what was last loaded/saved
+
+        :return: tuple of (the records to upsert - last_played, then the row, the keys of the rows to delete, what is then saved)
+        """
+        saved = {} if force else self._saved
+        rows = [self._normalise(row) for row in rows]
+        keys = [row[self._path] for row in rows]
+
+        # Work out the last_played ordinals, from the least recently played up.
+        # Playbacks keep their existing ordinal wherever the order allows, so only new or moved Playbacks need writing.
+        ordinals = []
+        floor = 0
+        for key in reversed(keys):
+            existing = saved.get(key)
+            if existing and existing[0] > floor:
+                floor = existing[0]
+            else:
+                floor += 1
+            ordinals.append(floor)
+        ordinals.reverse()
+
+        records = [(ordinal,) + row for ordinal, row in zip(ordinals, rows)]
+        upserts = [record for key, record in zip(keys, records) if saved.get(key) != record]
+        current = set(keys)
+        deletes = [key for key in saved if key not in current]
+        return upserts, deletes, dict(zip(keys, records))
+
+    def _plan_changes(self, rows: List[list], changed: List[int]) -> Optional[Tuple[List[tuple], List[str], Dict[str, tuple]]]:
+        """
+        Work out what to write to save the list, given the only rows that may have changed (see save).
+        Each run of changed rows must fit, in last_played order, between the unchanged rows either side of it - so a run at the top
+        of the list (e.g. a playback just recorded) always fits, above the rest.
+
+        :return: as for _plan_all, or None if the changed rows don't fit (so every row has to be re-numbered, see _plan_all)
+        """
+        saved = self._saved
+        normalised = {index:self._normalise(rows[index]) for index in changed}
+        keys = {index:row[self._path] for index, row in normalised.items()}
+        ordinals = {}
+        try:
+            # The runs of consecutive changed rows
+            runs = []
+            for index in changed:
+                if runs and runs[-1][-1] == index - 1:
+                    runs[-1].append(index)
+                else:
+                    runs.append([index])
+            for run in runs:
+                # The (fixed) ordinals of the unchanged rows either side of the run
+                above = saved[self._key(rows[run[0] - 1])][0] if run[0] > 0 else None
+                below = saved[self._key(rows[run[-1] + 1])][0] if run[-1] + 1 < len(rows) else 0
+                existing = [saved.get(keys[index], (None,))[0] for index in run]
+                if all(ordinal is not None and below < ordinal and (above is None or ordinal < above) for ordinal in existing) \
+                        and all(higher > lower for higher, lower in zip(existing, existing[1:])):
+                    ordinals.update(zip(run, existing))
+                elif above is None or above - below > len(run):
+                    ordinals.update(zip(run, range(below + len(run), below, -1)))
+                else:
+                    return None
+        except KeyError:
+            # An 'unchanged' row that was never saved - so it has changed after all
+            return None
+
+        records = {index:(ordinals[index],) + normalised[index] for index in changed}
+        upserts = [record for index, record in records.items() if saved.get(keys[index]) != record]
+        # (Every unchanged row is already saved, so rows have been removed only if fewer of the rows are already saved than were before)
+        new = sum(1 for key in keys.values() if key not in saved)
+        deletes = []
+        if len(saved) != len(rows) - new:
+            current = {self._key(row) for row in rows}
+            deletes = [key for key in saved if key not in current]
+        saved = dict(saved)
+        for key in deletes:
+            del saved[key]
+        for index in changed:
+            saved[keys[index]] = records[index]
+        return upserts, deletes, saved
+
+    def delete(self) -> None:
+        """
+        Delete the database (if it exists)
+        """
+        self._saved = {}
+        for file in [self.file, self.file + '-wal', self.file + '-shm']:
+            if os.path.exists(file):
+                os.remove(file)
+
+
+def open_storage(file: str, fields: Sequence[str]):
+    """
+    Open the storage for a Switchback list file - SQLite for a .db file (migrating from a .json list file alongside it), otherwise JSON
+
+    :param file: the Switchback list file
+    :param fields: the Playback fields, in row order
+    :return: JsonStorage or SqliteStorage
+    """
+    if file.endswith('.db'):
+        return SqliteStorage(file, fields, migrate_from=os.path.splitext(file)[0] + '.json')
+    return JsonStorage(file, fields)
@@ -1,11 +1,28 @@
 import os
+import json
 
 import xbmcvfs
 
 from bossanova808.constants import HOME_WINDOW, PROFILE, ADDON
 from bossanova808.logger import Logger
-from bossanova808.utilities import get_kodi_setting, set_property, clear_property
-from resources.lib.playback import PlaybackList
+from bossanova808.utilities import get_kodi_setting, set_property
+from resources.lib.artwork import ArtworkCache
+from resources.lib.instrumentation import Timings, LatencyHistograms, MemoryWatchdog, timed
+from resources.lib.journal import CheckpointJournal
+from resources.lib.playback import Playback, PlaybackList
+from resources.lib.properties import WIDGET_MAXIMUM_LENGTH, widget_properties, publish_properties
+from resources.lib.service_state import library_changed_time
+
+# The service publishes a compact snapshot of the top of the Switchback list (and the settings) as a Home Window property,
+# so the plugin's Switchback mode can resolve list[1] without re-reading settings, parsing the file, or querying the library.
+# Bump the version if the snapshot layout changes, so that older snapshots are treated as stale rather than misread.
+SNAPSHOT_PROPERTY = 'Switchback_Snapshot'
+SNAPSHOT_VERSION = 2
+# Switchback mode only ever needs list[0] and list[1]
+SNAPSHOT_LENGTH = 2
+# The service publishes the paths of the list entries found to be unavailable (see ReachabilityScanner) as a Home Window property,
+# so the plugin listing can show them as such
+UNREACHABLE_PROPERTY = 'Switchback_Unreachable'
 
 
 class Store:
@@ -21,32 +38,83 @@ class Store:
     switchback = None
     # When something is being played back, store the details
     current_playback = None
+    # ...and checkpoint them to disk as playback progresses, in case of crashes
+    journal = None
+    # (Service only) warms Kodi's texture cache with the artwork of the playbacks in the list
+    artwork_cache = None
+    # (Service only) the next Switchback target, kept ready to play for instant Switchback requests
+    standby = None
+    # (Service only) refreshes the Switchback listing, when it is on screen, after the list changes
+    refresh_scheduler = None
+    # (Service only) the single worker that handles all the service's events, in order - see ServiceEventQueue, and post_event
+    events = None
+    # (Service only) checks, in the background, that the entries in the list can still be played
+    reachability = None
+    # (Service only) how long Switchbacks take, per Playback source
+    latency = None
+    # (Service only) watches the service's memory use, for leaks (if the user wants)
+    memory_watchdog = None
     # Playbacks are of these possible types
     kodi_video_types = ["movie", "tvshow", "episode", "musicvideo", "video", "file"]
     kodi_music_types = ["song", "album"]
-    # Addon settings
-    save_across_sessions = ADDON.getSettingBool('save_across_sessions')
-    maximum_list_length = ADDON.getSettingInt('maximum_list_length')
-    enable_context_menu = ADDON.getSettingBool('enable_context_menu')
-    episode_force_browse = ADDON.getSettingBool('episode_force_browse')
-    remove_watched_playbacks = ADDON.getSettingBool('remove_watched_playbacks')
+    # Addon settings - these are the defaults (as per settings.xml) until Store() or load_from_snapshot() loads the real ones.
+    # (They are deliberately not read here, at import time, as the settings are not always needed - e.g. Switchback mode
+    # gets them from the service's snapshot)
+    save_across_sessions = True
+    maximum_list_length = 5
+    page_size = 20
+    widget_length = 5
+    enable_context_menu = True
+    episode_force_browse = False
+    remove_watched_playbacks = True
+    prune_unreachable = False
+    record_timings = False
+    sqlite_storage = False
+    watch_memory = False
+    memory_budget = 50
 
     # GUI Settings - to work out how to force browse to a show after a switchback initiated playback
     flatten_tvshows = None
 
-    def __init__(self):
+    @timed('Store.__init__')
+    def __init__(self, page: int = None, check_library: bool = True, read_only: bool = False):
         """
         Load in the addon settings and do basic initialisation stuff
+        :param page: (optional) the page of the list that is to be displayed - only that page is then loaded (unless checking it
+                     against the Kodi library changed something that has to be saved - then the whole list is loaded, to save it)
+        :param check_library: (optional) False to not check the list against the Kodi library at all (e.g. when just editing the list)
+        :param read_only: (optional) True to never save the list, nor publish anything derived from it - for the plugin, when the service
+                          is running, as the service is then the only writer (see service_state.request_edit)
         :return:
         """
         Store.load_config_from_settings()
         Store.load_config_from_kodi_settings()
-        Store.switchback = PlaybackList([], xbmcvfs.translatePath(os.path.join(PROFILE, "switchback.json")), Store.remove_watched_playbacks)
-        Store.switchback.load_or_init()
-        Store.update_switchback_context_menu()
+        Store.switchback = PlaybackList([], Store.get_switchback_file(), Store.remove_watched_playbacks)
+        Store.switchback.read_only = read_only
+        Store.journal = CheckpointJournal(os.path.splitext(Store.switchback.file)[0] + ".journal")
+        # (Nothing has been saved, if the page alone will do - so there is nothing new to publish either)
+        if page is not None and check_library:
+            changed = Store.switchback.load_page(page * Store.page_size, Store.page_size, library_changed_time())
+            if changed is not None and (read_only or not changed):
+                return
+        if not check_library:
+            window = (0, 0)
+        else:
+            window = None if page is None else (page * Store.page_size, (page + 1) * Store.page_size)
+        Store.switchback.load_or_init(window, library_changed_time())
+        if not read_only:
+            Store.update_switchback_context_menu()
+            Store.publish_snapshot()
 
+    @staticmethod
+    def get_switchback_file() -> str:
+        """
+        :return: the full path to the Switchback list file in the addon profile (a SQLite database, if the user has chosen that)
+        """
+        return xbmcvfs.translatePath(os.path.join(PROFILE, "switchback.db" if Store.sqlite_storage else "switchback.json"))
 
     @staticmethod
+    @timed('Store.load_config_from_settings')
     def load_config_from_settings():
         """
         Load in the addon settings, at start or reload them if they have been changed
@@ -55,6 +123,10 @@ class Store:
         Logger.info("Loading configuration")
         Store.maximum_list_length = ADDON.getSettingInt('maximum_list_length')
         Logger.info(f"Maximum Switchback list length is: {Store.maximum_list_length}")
+        Store.page_size = max(ADDON.getSettingInt('page_size'), 1)
+        Logger.info(f"Switchback list page size is: {Store.page_size}")
+        Store.widget_length = min(max(ADDON.getSettingInt('widget_length'), 0), WIDGET_MAXIMUM_LENGTH)
+        Logger.info(f"Skin widget length is: {Store.widget_length}")
         Store.save_across_sessions = ADDON.getSettingBool('save_across_sessions')
         Logger.info(f"Save across sessions is: {Store.save_across_sessions}")
         Store.enable_context_menu = ADDON.getSettingBool('enable_context_menu')
@@ -63,25 +135,335 @@ class Store:
         Logger.info(f"Remove watched playbacks is: {Store.remove_watched_playbacks}")
         Store.episode_force_browse = ADDON.getSettingBool('episode_force_browse')
         Logger.info(f"Episode force browse is: {Store.episode_force_browse}")
+        Store.prune_unreachable = ADDON.getSettingBool('prune_unreachable')
+        Logger.info(f"Prune unreachable is: {Store.prune_unreachable}")
+        Store.record_timings = ADDON.getSettingBool('record_timings')
+        Logger.info(f"Record timings is: {Store.record_timings}")
+        Store.sqlite_storage = ADDON.getSettingBool('sqlite_storage')
+        Logger.info(f"SQLite storage is: {Store.sqlite_storage}")
+        Store.watch_memory = ADDON.getSettingBool('watch_memory')
+        Logger.info(f"Watch memory is: {Store.watch_memory}")
+        Store.memory_budget = max(ADDON.getSettingInt('memory_budget'), 0)
+        Logger.info(f"Memory budget is: {Store.memory_budget}MB")
 
     @staticmethod
+    @timed('Store.load_config_from_kodi_settings')
     def load_config_from_kodi_settings():
         # Note: this is an int, not a bool — 0 = Never, 1 = 'If only one season', 2 = Always
         Store.flatten_tvshows = int(get_kodi_setting('videolibrary.flattentvshows'))
         Logger.info(f"Flatten TV Shows is: {Store.flatten_tvshows}")
 
     @staticmethod
-    def update_switchback_context_menu():
-        if Store.enable_context_menu:
-            Logger.debug(f"Updating Home Window Properties for context menu")
-            Logger.debug("Switchback list is:", Store.switchback.list)
-            set_property(HOME_WINDOW, 'Switchback_List_Length', str(len(Store.switchback.list)))
-            if len(Store.switchback.list) == 1:
-                set_property(HOME_WINDOW, 'Switchback_Item', Store.switchback.list[0].pluginlabel)
-            elif len(Store.switchback.list) > 1:
-                set_property(HOME_WINDOW, 'Switchback_Item', Store.switchback.list[1].pluginlabel)
-            else:
-                clear_property(HOME_WINDOW, 'Switchback_Item')
+    def switch_storage():
+        """
+        (Service) If the user has changed the storage setting, move the Switchback list over to the newly chosen storage
+        """
+        file = Store.get_switchback_file()
+        if file == Store.switchback.file:
+            return
+        Logger.info(f"Storage setting changed - moving the Switchback list from [{Store.switchback.file}] to [{file}]")
+        old_switchback = Store.switchback
+        Store.switchback = PlaybackList(old_switchback.list, file, Store.remove_watched_playbacks)
+        Store.switchback.save_to_file(force=True)
+        old_switchback.delete_file()
+
+    @staticmethod
+    def post_event(name: str, handler, *args, droppable: bool = False) -> bool:
+        """
+        (Service) Post an event to the service's event worker, which is the only thread that touches the Switchback list and the
+        current playback.  (If there is no worker - e.g. KodiPlayer used outside the service - the event is handled straight away)
+
+        :param name: the event name (for logging)
+        :param handler: the function that handles the event
+        :param args: the arguments to call it with
+        :param droppable: the event can be dropped if the worker is too far behind (e.g. a resume point sample)
+        :return: True if the event was queued (or handled), False if it was dropped
+        """
+        if Store.events:
+            return Store.events.post(name, handler, *args, droppable=droppable)
+        handler(*args)
+        return True
+
+    @staticmethod
+    def list_changed(save: bool = True):
+        """
+        (Service) The Switchback list has been changed by the service - save it, and update everything that depends on it
+
+        :param save: False if the list has already been saved
+        """
+        if save:
+            Store.switchback.save_to_file()
+        Store.update_switchback_context_menu()
+        Store.publish_snapshot()
+        if Store.standby:
+            Store.standby.prepare()
+        if Store.refresh_scheduler:
+            Store.refresh_scheduler.request()
+
+    @staticmethod
+    def check_library():
+        """
+        (Event worker) Bring the whole Switchback list up to date with the Kodi library, e.g. once a library scan has finished, and save it.
+        The entries' library check stamps are saved even if nothing else changed - the plugin's listings can't save them (the service is
+        the only writer), so this is what saves them re-checking those entries every time they are displayed.
+        """
+        changed = Store.switchback.check_library(library_changed=library_changed_time())
+        Store.switchback.save_to_file()
+        if changed:
+            Store.list_changed(save=False)
+
+    @staticmethod
+    def apply_edit(edit: dict) -> int:
+        """
+        Apply an edit of the Switchback list - in one transaction, with one save - and update everything that depends on the list.
+        (Edits come from the plugin - they are made by the service if it is running, see service_state.request_edit)
+
+        :param edit: the edit, see PlaybackList.apply_edit
+        :return: the number of Playbacks changed
+        """
+        try:
+            with Store.switchback.transaction():
+                changed = Store.switchback.apply_edit(edit)
+        except (ValueError, TypeError, AttributeError) as error:
+            Logger.error("Unable to apply Switchback list edit:", error)
+            return 0
+        if changed:
+            Store.list_changed(save=False)
+        return changed
+
+    @staticmethod
+    def scan_reachability():
+        """
+        (Service) Start a background scan of the list for entries that can no longer be played (only those not checked recently are checked)
+        """
+        if not Store.reachability:
+            return
+        entries = Store.switchback.fields('path', 'file', 'source', 'type', 'dbid', 'channelid')
+        Store.reachability.scan(entries, on_scanned=lambda results:Store.post_event('reachability scanned', Store.reachability_scanned, results))
+
+    @staticmethod
+    def reachability_scanned(results: dict):
+        """
+        (Service) A reachability scan has finished - prune the entries that are definitely gone (if the user wants), and publish the
+        paths of all the unavailable entries for the plugin listing
+
+        :param results: path -> REACHABLE, MISSING or TIMED_OUT, for the entries checked by the scan
+        """
+        # (Imported here, as only the service ever scans - and the plugin's imports are paid for on every run)
+        from resources.lib.reachability import MISSING, TIMED_OUT
+        paths = [path for path, in Store.switchback.fields('path')]
+        # (Only entries that are definitely gone - not ones that just timed out, as e.g. a NAS that is asleep will be back)
+        missing = [path for path in paths if results.get(path) == MISSING]
+        if Store.prune_unreachable and missing:
+            Logger.info(f"Removing {len(missing)} unavailable entries from the Switchback list:", missing)
+            Store.apply_edit({'command':'remove', 'paths':missing})
+            paths = [path for path, in Store.switchback.fields('path')]
+        unreachable = [path for path in paths if Store.reachability.result(path) in [MISSING, TIMED_OUT]]
+        publish_properties({UNREACHABLE_PROPERTY:json.dumps(unreachable, ensure_ascii=False) if unreachable else ''})
+
+    @staticmethod
+    def unreachable_paths() -> set:
+        """
+        (Plugin) The paths of the list entries the service has found to be unavailable
+
+        :return: set of paths
+        """
+        published = HOME_WINDOW.getProperty(UNREACHABLE_PROPERTY)
+        if not published:
+            return set()
+        try:
+            return set(json.loads(published))
+        except ValueError:
+            return set()
+
+    @staticmethod
+    def update_switchback_context_menu() -> int:
+        """
+        Update the Home Window properties for the context menu, and the skin widget properties for the top of the list.
+        Only properties whose values have actually changed are written (see publish_properties).
+
+        :return: the number of properties written
+        """
+        # (The context menu needs the top two, whatever the widget length)
+        top = Store.switchback.head(max(Store.widget_length, 2))
+        properties = widget_properties(top[:Store.widget_length], Store.widget_length)
+        # (Clearing these hides the context menu items)
+        properties['Switchback_List_Length'] = str(len(Store.switchback)) if Store.enable_context_menu else ''
+        properties['Switchback_Item'] = ''
+        if Store.enable_context_menu and top:
+            properties['Switchback_Item'] = top[1].pluginlabel if len(top) > 1 else top[0].pluginlabel
+        writes = publish_properties(properties)
+        Logger.debug(f"Updated {writes} Home Window properties for the context menu & skin widgets")
+        return writes
+
+    @staticmethod
+    def write_timings(process: str):
+        """
+        Write the recorded timings to the stats file for this process (if the user wants them recorded)
+
+        :param process: 'service' or 'plugin' - the plugin's timings are merged with those of previous plugin invocations
+        """
+        if Store.record_timings:
+            Timings.write(xbmcvfs.translatePath(os.path.join(PROFILE, f"timings_{process}.json")), merge=process != 'service')
+
+    @staticmethod
+    def load_latency():
+        """
+        (Service only) Load the Switchback latency histograms kept from previous sessions (see LatencyHistograms), and keep recording them
+        """
+        Store.latency = LatencyHistograms(xbmcvfs.translatePath(os.path.join(PROFILE, "switchback_latency.json")))
+
+    @staticmethod
+    def load_artwork_cache():
+        """
+        (Service only) Set up the artwork cache (see ArtworkCache), with the urls it fetched into Kodi's texture cache in previous sessions
+        """
+        Store.artwork_cache = ArtworkCache(xbmcvfs.translatePath(os.path.join(PROFILE, "switchback_artwork.json")))
+
+    @staticmethod
+    def update_memory_watchdog():
+        """
+        (Event worker) Start or stop watching the service's memory use (see MemoryWatchdog), as per the setting - and keep its budget current
+        """
+        if Store.watch_memory and not Store.memory_watchdog:
+            Logger.info("Watching the service's memory use")
+            Store.memory_watchdog = MemoryWatchdog(xbmcvfs.translatePath(os.path.join(PROFILE, "switchback_memory.json")), Store.memory_budget)
+            Store.memory_watchdog.start()
+        elif Store.memory_watchdog and not Store.watch_memory:
+            Logger.info("No longer watching the service's memory use")
+            Store.memory_watchdog.stop()
+            Store.memory_watchdog = None
+        if Store.memory_watchdog:
+            Store.memory_watchdog.budget_mb = Store.memory_budget
+
+    @staticmethod
+    def check_memory():
+        """
+        (Event worker) Check the service's memory use, if the watchdog is on (see MemoryWatchdog)
+        """
+        if Store.memory_watchdog:
+            Store.memory_watchdog.check()
+
+    @staticmethod
+    def flush():
+        """
+        (Event worker) Write out anything not yet on disk - the unsaved changes to the Switchback list, and the resume point of the
+        current playback (to the checkpoint journal, however recently it was last checkpointed)
+        """
+        Store.switchback.save_to_file()
+        if Store.current_playback and Store.current_playback.source != "pvr_live":
+            Store.journal.checkpoint(Store.current_playback, force=True)
+
+    @staticmethod
+    def recover_from_journal():
+        """
+        Replay the checkpoint journal (if any) into the Switchback list, save it, and clear the journal.
+        Only the service should do this, at startup (i.e. when there can't be a playback in progress) - the journal is written by the service,
+        so a plugin Store() could otherwise compact away the journal of a live playback.
+        """
+        records = Store.journal.replay()
+        if not records:
+            return
+
+        Logger.info(f"Recovering in-progress playback(s) from checkpoint journal ({len(records)} records)")
+        playback = None
+        for record in records:
+            if 'playback' in record:
+                try:
+                    playback = Store.switchback.record_playback(Playback(**record['playback']))
+                except TypeError as error:
+                    Logger.error("Ignoring invalid checkpoint journal playback record:", error)
+                    playback = None
+            elif playback and record.get('path') == playback.path and playback.source != "pvr_live":
+                playback.update({'resumetime':record.get('resumetime'), 'totaltime':record.get('totaltime') or playback.totaltime})
+
+        Store.switchback.trim(Store.maximum_list_length)
+        Store.switchback.save_to_file()
+        Store.journal.clear()
+        Store.update_switchback_context_menu()
+        Store.publish_snapshot()
+
+    @staticmethod
+    def get_file_signature(file: str):
+        """
+        A cheap signature (modification time and size) of the Switchback list file, used to detect a stale snapshot
+
+        :param file: the Switchback list file
+        :return: [mtime_ns, size] or None if the file does not exist
+        """
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        signature = [stat.st_mtime_ns, stat.st_size]
+        # SQLite (in WAL mode) writes changes to the -wal file first, so that is part of the signature too
+        if file.endswith('.db'):
+            try:
+                stat = os.stat(file + '-wal')
+                signature += [stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                pass
+        return signature
+
+    @staticmethod
+    def publish_snapshot():
+        """
+        Publish a compact, versioned snapshot of the top of the Switchback list, and the current settings, as a Home Window property.
+        Should be called whenever the list file has been (re)loaded or saved.
+        """
+        snapshot = {
+                'version':SNAPSHOT_VERSION,
+                'file':Store.switchback.file,
+                'signature':Store.get_file_signature(Store.switchback.file),
+                'settings':{
+                        'maximum_list_length':Store.maximum_list_length,
+                        'page_size':Store.page_size,
+                        'widget_length':Store.widget_length,
+                        'save_across_sessions':Store.save_across_sessions,
+                        'enable_context_menu':Store.enable_context_menu,
+                        'remove_watched_playbacks':Store.remove_watched_playbacks,
+                        'episode_force_browse':Store.episode_force_browse,
+                        'prune_unreachable':Store.prune_unreachable,
+                        'flatten_tvshows':Store.flatten_tvshows,
+                        'record_timings':Store.record_timings,
+                        'sqlite_storage':Store.sqlite_storage,
+                },
+                'list':[playback.to_dict() for playback in Store.switchback.head(SNAPSHOT_LENGTH)],
+        }
+        publish_properties({SNAPSHOT_PROPERTY:json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))})
+
+    @staticmethod
+    def load_from_snapshot() -> bool:
+        """
+        Initialise the Store from the snapshot published by the service, instead of a full Store() load.
+        Only the top of the list is available (see SNAPSHOT_LENGTH), so this is only suitable for Switchback mode.
+
+        :return: True if a current snapshot was found and loaded, False if it is missing or stale (and a full Store() load is needed)
+        """
+        snapshot_json = HOME_WINDOW.getProperty(SNAPSHOT_PROPERTY)
+        if not snapshot_json:
+            Logger.info("No Switchback snapshot available")
+            return False
+        try:
+            snapshot = json.loads(snapshot_json)
+            if snapshot.get('version') != SNAPSHOT_VERSION:
+                Logger.info("Switchback snapshot version mismatch - ignoring snapshot")
+                return False
+            playbacks = [Playback(**playback) for playback in snapshot['list']]
+            # The settings come from the snapshot too (the list file depends on them), so the plugin need not read any itself
+            for setting, value in snapshot['settings'].items():
+                setattr(Store, setting, value)
+            file = Store.get_switchback_file()
+            if snapshot.get('file') != file or snapshot.get('signature') != Store.get_file_signature(file):
+                Logger.info("Switchback snapshot is stale (list file has changed since it was published) - ignoring snapshot")
+                return False
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            Logger.error("Unable to load Switchback snapshot - ignoring snapshot:", error)
+            return False
+
+        Store.switchback = PlaybackList(playbacks, file, Store.remove_watched_playbacks)
+        Logger.info("Loaded Switchback list from snapshot")
+        return True
 
     @staticmethod
     def update_home_window_switchback_property(path: str):
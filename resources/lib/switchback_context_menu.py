@@ -1,5 +1,6 @@
 import xbmc
 from bossanova808.logger import Logger
+from resources.lib.service_state import request_switchback
 
 
 # This is 'main'...
@@ -7,7 +8,8 @@ from bossanova808.logger import Logger
 def run(args):
     Logger.start(f"(Context Menu) {args}")
     if args[0] == "switchback":
-        xbmc.executebuiltin("PlayMedia(plugin://plugin.switchback/?mode=switchback,resume)")
+        # Answered instantly by the service if it is running, otherwise falls back to the plugin
+        request_switchback()
     else:
         xbmc.executebuiltin("RunAddon(plugin.switchback)")
     Logger.stop("(Context Menu)")
@@ -1,11 +1,13 @@
 import sys
-from urllib.parse import parse_qs
+from urllib.parse import parse_qs, urlencode
 
 # noinspection PyUnresolvedReferences
-import xbmc
 import xbmcplugin
 import xbmcgui
 
+from resources.lib.instrumentation import Timings
+from resources.lib.playback import clear_video_playlist, play_pvr_channel
+from resources.lib.service_state import service_is_ready, request_refresh, request_edit, record_trigger, ROUTE_PLUGIN, ROUTE_LISTING
 from resources.lib.store import Store
 from bossanova808.constants import TRANSLATE
 from bossanova808.logger import Logger
@@ -15,26 +17,74 @@ from bossanova808.notify import Notify
 # PVR HACK!
 # Needed to trigger live PVR playback with proper PVR controls.
 # See https://forum.kodi.tv/showthread.php?tid=381623
-def pvr_hack(path):
-    xbmc.PlayList(xbmc.PLAYLIST_VIDEO).clear()
+def pvr_hack(path, channelid=None):
+    clear_video_playlist()
     # Kodi is jonesing for one of these, so give it the sugar it needs, see: https://forum.kodi.tv/showthread.php?tid=381623&pid=3232778#pid3232778
     xbmcplugin.setResolvedUrl(int(sys.argv[1]), False, xbmcgui.ListItem())
-    # Get the full details from our stored playback
-    # pvr_playback = Store.switchback.find_playback_by_path(path)
-    builtin = f'PlayMedia("{path}")'
-    Logger.debug("Work around PVR links not being handled by ListItem/setResolvedUrl - use PlayMedia instead:", builtin)
     # No ListItem to set a property on here, so set on the Home Window instead
     Store.update_home_window_switchback_property(path)
-    xbmc.executebuiltin(builtin)
+    # Player.Open by channel id if we have it, otherwise PlayMedia with the path
+    play_pvr_channel(path, channelid, clear_playlist=False)
+
+
+# Playback source -> its description, for 'remove by source' in edit mode
+SOURCE_LABELS = {
+        'kodi_library':32024,
+        'pvr_live':32025,
+        'pvr_recording':32026,
+        'addon':32027,
+        'file':32028,
+}
+
+
+def edit_switchback_list(edit: dict) -> None:
+    """
+    Edit the Switchback list.  If the service is running, the edit is sent to it, as it is then the only writer of the list - it
+    makes the edit, saves the list, and refreshes the listing.  Otherwise, the plugin makes the edit itself, as a single transaction
+    (one save, and no reload, however many Playbacks are changed), and then updates everything that depends on the list.
+
+    :param edit: the edit, see PlaybackList.apply_edit
+    """
+    if request_edit(edit):
+        return
+    # (The list may not have been loaded - or only loaded read only - if the service was running when the plugin started)
+    if Store.switchback is None or Store.switchback.read_only:
+        Store(check_library=False)
+    if not Store.apply_edit(edit):
+        Logger.debug("Switchback list unchanged")
+        return
+    Logger.debug("Requesting a refresh of the container, so Kodi immediately displays the updated Switchback list")
+    request_refresh()
+
+
+def playback_paths(parsed_arguments) -> list:
+    """
+    :return: the paths of the Playbacks given by the 'path' parameter(s), and/or the 'index' parameter - a single index into the
+             Switchback list, or a comma separated list of them (out of range indexes are ignored)
+    """
+    paths = parsed_arguments.get('path', [])
+    index_values = parsed_arguments.get('index')
+    if index_values:
+        try:
+            indexes = [int(index) for index in index_values[0].split(',')]
+        except (ValueError, TypeError):
+            Logger.error("Invalid 'index' parameter:", index_values)
+            return paths
+        paths += [Store.switchback[index].path for index in indexes if 0 <= index < len(Store.switchback)]
+    if not paths:
+        Logger.error("Missing (or out of range) 'path'/'index' parameter")
+    return paths
 
 
 def run():
-    Logger.start("(Plugin)")
-    # This also forces an update of the Switchback list from disk, in case of changes via the service side of things.
-    Store()
+    with Timings.span('plugin.run'):
+        run_mode()
+    # (After the directory/resolved item has been handed to Kodi, so this does not hold anything up)
+    Store.write_timings('plugin')
 
-    plugin_instance = int(sys.argv[1])
-    xbmcplugin.setContent(plugin_instance, 'video')
+
+def run_mode():
+    Logger.start("(Plugin)")
 
     parsed_arguments = parse_qs(sys.argv[2][1:])
     Logger.debug(parsed_arguments)
@@ -45,21 +95,56 @@ def run():
     else:
         Logger.info("Switchback mode: default - generate 'folder' of items")
 
+    # Time Switchbacks from as early as possible (see LatencyHistograms) - unless they were triggered earlier still, by the context menu
+    if "switchback" in modes:
+        record_trigger(ROUTE_PLUGIN)
+    elif "pvr_hack" in modes:
+        record_trigger(ROUTE_LISTING)
+
+    # The list is displayed a page at a time (see the default mode, below)
+    try:
+        page = max(int(parsed_arguments.get('page', ['0'])[0]), 0)
+    except ValueError:
+        Logger.error("Invalid 'page' parameter:", parsed_arguments.get('page'))
+        page = 0
+
+    # Switchback mode only needs the top of the list, so use the snapshot published by the service if it is current.
+    # Otherwise, do a full load - this also forces an update of the Switchback list from disk, in case of changes via the service side of things.
+    # (When displaying the list, only the page being displayed is loaded, and checked against the Kodi library)
+    # (Editing the list doesn't need it checked against the Kodi library at all - the listing is refreshed afterwards anyway,
+    # and edits of items given only by path, when the service is running, are just sent to the service - so need nothing loaded at all.
+    # Items given by index need the list loaded, to find their paths)
+    # While the service is running, it is the only writer of the list, so the plugin only ever reads it.
+    # (The PVR hack, for clicks on live PVR items in the listing, needs nothing loaded at all - it just switches channel, see pvr_hack)
+    read_only = service_is_ready()
+    if "pvr_hack" in modes:
+        pass
+    elif not modes:
+        Store(page=page, read_only=read_only)
+    elif modes & {"delete", "move", "edit"}:
+        if not (read_only and 'path' in parsed_arguments and 'index' not in parsed_arguments):
+            Store(check_library=False, read_only=read_only)
+    elif "switchback" not in modes or not Store.load_from_snapshot():
+        Store(read_only=read_only)
+
+    plugin_instance = int(sys.argv[1])
+    xbmcplugin.setContent(plugin_instance, 'video')
+
     # Switchback mode - easily swap between switchback.list[0] and switchback.list[1]
     # If there's only one item in the list, then resume playing that item
     if "switchback" in modes:
 
         # First, determine what to play, if anything...
-        if not Store.switchback.list:
+        if not len(Store.switchback):
             Notify.error(TRANSLATE(32007))
             Logger.error("No Switchback found to play")
             return
 
-        if len(Store.switchback.list) == 1:
-            switchback_to_play = Store.switchback.list[0]
+        if len(Store.switchback) == 1:
+            switchback_to_play = Store.switchback[0]
             Logger.debug("Switchback to index 0")
         else:
-            switchback_to_play = Store.switchback.list[1]
+            switchback_to_play = Store.switchback[1]
             Logger.debug("Switchback to index 1")
 
         # We know what to play...
@@ -71,42 +156,54 @@ def run():
 
         # Short circuit here if PVR, see pvr_hack above.
         if 'pvr://channels' in switchback_to_play.path:
-            pvr_hack(switchback_to_play.path)
+            pvr_hack(switchback_to_play.path, switchback_to_play.channelid)
             return
 
-        # Normal path for everything else
-        list_item = switchback_to_play.create_list_item_from_playback()
+        # Normal path for everything else (the ListItem is resolved straight away, never displayed, so can be created offscreen)
+        list_item = switchback_to_play.create_list_item_from_playback(offscreen=True)
         list_item.setProperty('Switchback', switchback_to_play.path)
         # Store.update_home_window_switchback_property(switchback_to_play.path)
         xbmcplugin.setResolvedUrl(plugin_instance, True, list_item)
         Logger.stop("(Plugin)")
         return
 
-    # Delete an item from the Switchback list - e.g. if it is not playing back properly from Switchback
+    # Delete items from the Switchback list - e.g. if it is not playing back properly from Switchback
+    # (Items are given by path, and/or by index - which can be a comma separated list of indexes, to delete several at once)
     elif "delete" in modes:
-        index_values = parsed_arguments.get('index')
-        if index_values:
-            try:
-                idx = int(index_values[0])
-            except (ValueError, TypeError):
-                Logger.error("Invalid 'index' parameter for delete:", index_values)
-                return
-            if 0 <= idx < len(Store.switchback.list):
-                Logger.info(f"Deleting playback {idx} from Switchback list")
-                Store.switchback.list.pop(idx)
-            else:
-                Logger.error("Index out of range for delete:", idx)
-                return
-        else:
-            Logger.error("Missing 'index' parameter for delete")
+        paths = playback_paths(parsed_arguments)
+        if not paths:
+            return
+        Logger.info(f"Deleting playback(s) {paths} from Switchback list")
+        edit_switchback_list({'command':'remove', 'paths':paths})
+
+    # Move an item to the top of the Switchback list
+    elif "move" in modes:
+        paths = playback_paths(parsed_arguments)
+        if not paths:
             return
+        Logger.info(f"Moving playback {paths[0]} to the top of the Switchback list")
+        edit_switchback_list({'command':'move', 'path':paths[0]})
 
-        # Save the updated list and then reload it, just to be sure
-        Store.switchback.save_to_file()
-        Store.switchback.load_or_init()
-        Store.update_switchback_context_menu()
-        Logger.debug("Force refreshing the container, so Kodi immediately displays the updated Switchback list")
-        xbmc.executebuiltin("Container.Refresh")
+    # Bulk edit the Switchback list - remove several items, all watched items, or all items from a particular source
+    elif "edit" in modes:
+        dialog = xbmcgui.Dialog()
+        operation = dialog.select(TRANSLATE(32018), [TRANSLATE(32019), TRANSLATE(32020), TRANSLATE(32021)])
+        if operation == 0:
+            playbacks = Store.switchback.list
+            selected = dialog.multiselect(TRANSLATE(32023), [playback.pluginlabel for playback in playbacks])
+            if selected:
+                Logger.info(f"Deleting playbacks {selected} from Switchback list")
+                edit_switchback_list({'command':'remove', 'paths':[playbacks[index].path for index in selected]})
+        elif operation == 1:
+            Logger.info("Removing all watched playbacks from the Switchback list")
+            edit_switchback_list({'command':'remove_watched'})
+        elif operation == 2:
+            sources = list(Store.switchback.sources().items())
+            labels = [f"{TRANSLATE(SOURCE_LABELS[source]) if source in SOURCE_LABELS else source} ({count})" for source, count in sources]
+            selected = dialog.select(TRANSLATE(32021), labels)
+            if selected >= 0:
+                Logger.info(f"Removing all {sources[selected][0]} playbacks from the Switchback list")
+                edit_switchback_list({'command':'remove_source', 'source':sources[selected][0]})
 
     # See pvr_hack(path) above
     elif "pvr_hack" in modes:
@@ -115,34 +212,66 @@ def run():
             Logger.error("Missing 'path' parameter for pvr_hack")
             return
         path = path_values[0]
-        Logger.debug(f"Triggering PVR Playback hack for {path}")
-        pvr_hack(path)
+        channelid_values = parsed_arguments.get('channelid')
+        try:
+            channelid = int(channelid_values[0]) if channelid_values else None
+        except ValueError:
+            Logger.warning("Invalid 'channelid' parameter for pvr_hack:", channelid_values)
+            channelid = None
+        Logger.debug(f"Triggering PVR Playback hack for {path} (channel id {channelid})")
+        pvr_hack(path, channelid)
         return
 
-    # Default mode - show the whole Switchback List (each of which has a context menu option to delete itself)
+    # Default mode - show the Switchback List, a page at a time (each item has a context menu option to delete itself)
+    # Only the page being displayed is loaded, and only its ListItems are created, so long lists display just as quickly as short ones
     else:
-        for index, playback in enumerate(Store.switchback.list[0:Store.maximum_list_length]):
-            list_item = playback.create_list_item_from_playback()
-            # Add delete option to this item
-            list_item.addContextMenuItems([(TRANSLATE(32004), "RunPlugin(plugin://plugin.switchback?mode=delete&index=" + str(index) + ")")])
-            # For detecting Switchback playbacks (in player.py)
-            list_item.setProperty('Switchback', playback.path)
-            # Use the 'proxy' URL if we're dealing with pvr_live and need to trigger the PVR playback hack
-            if playback.source == "pvr_live":
-                proxy_url = f"plugin://plugin.switchback?mode=pvr_hack&path={playback.path}"
-                Logger.debug(f"Creating directory item with pvr_hack proxy url: {proxy_url}")
-                xbmcplugin.addDirectoryItem(plugin_instance, proxy_url, list_item)
-                # TODO -> not sure if URL encoding needed in some cases?  Maybe CodeRabbit knows?
-                #     args = urlencode({'mode': 'pvr_hack', 'path': self.path})
-                #     proxy_url = f"plugin://plugin.switchback/?{args}"
-
-            # Otherwise use file for all Kodi library playbacks, and path for addons (as those may include tokens etc)
-            else:
-                url = playback.file if playback.source not in ["addon", "pvr_live"] else playback.path
-                # Logger.debug(f"Creating directory item with url: {url}")
-                xbmcplugin.addDirectoryItem(plugin_instance, url, list_item)
-
-        xbmcplugin.endOfDirectory(plugin_instance, cacheToDisc=False)
+        with Timings.span('plugin directory'):
+            total = min(Store.switchback.total, Store.maximum_list_length)
+            start = page * Store.page_size
+            directory_items = []
+            # Entries the service has found can no longer be played are shown as such (see ReachabilityScanner)
+            # (Only if the service is running - otherwise what it last found may well be out of date)
+            unreachable = Store.unreachable_paths() if read_only else set()
+            for playback in Store.switchback.page(start, min(Store.page_size, total - start)):
+                list_item = playback.create_list_item_from_playback()
+                if playback.path in unreachable:
+                    list_item.setLabel(f"{list_item.getLabel()} ({TRANSLATE(32030)})")
+                    list_item.setProperty('Switchback.Unreachable', 'true')
+                # Add delete, move to top, and (bulk) edit options to this item
+                # (By path, not index, as the list may have changed by the time the option is chosen)
+                item_arguments = urlencode({'path':playback.path})
+                list_item.addContextMenuItems([
+                        (TRANSLATE(32004), f"RunPlugin(plugin://plugin.switchback?mode=delete&{item_arguments})"),
+                        (TRANSLATE(32022), f"RunPlugin(plugin://plugin.switchback?mode=move&{item_arguments})"),
+                        (TRANSLATE(32018), "RunPlugin(plugin://plugin.switchback?mode=edit)"),
+                ])
+                # For detecting Switchback playbacks (in player.py)
+                list_item.setProperty('Switchback', playback.path)
+                # Use the 'proxy' URL if we're dealing with pvr_live and need to trigger the PVR playback hack
+                # (The channel id is passed along, if known, so the proxy can switch channel with Player.Open without loading the list)
+                if playback.source == "pvr_live":
+                    proxy_arguments = {'mode':'pvr_hack', 'path':playback.path}
+                    if playback.channelid:
+                        proxy_arguments['channelid'] = playback.channelid
+                    proxy_url = f"plugin://plugin.switchback?{urlencode(proxy_arguments)}"
+                    Logger.debug(f"Creating directory item with pvr_hack proxy url: {proxy_url}")
+                    directory_items.append((proxy_url, list_item, False))
+
+                # Otherwise use file for all Kodi library playbacks, and path for addons (as those may include tokens etc)
+                else:
+                    url = playback.file if playback.source not in ["addon", "pvr_live"] else playback.path
+                    # Logger.debug(f"Creating directory item with url: {url}")
+                    directory_items.append((url, list_item, False))
+
+            # More to come?  Add a 'next page' item
+            if start + Store.page_size < total:
+                next_page = xbmcgui.ListItem(label=f"{TRANSLATE(32015)} ({page + 2}/{-(-total // Store.page_size)})")
+                next_page.setArt({'icon':'DefaultFolder.png'})
+                directory_items.append((f"plugin://plugin.switchback/?page={page + 1}", next_page, True))
+
+            # Hand the whole page to Kodi in one go
+            xbmcplugin.addDirectoryItems(plugin_instance, directory_items, len(directory_items))
+            xbmcplugin.endOfDirectory(plugin_instance, cacheToDisc=False)
 
     # And we're done...
     Logger.stop("(Plugin)")
@@ -1,31 +1,136 @@
 from bossanova808.utilities import *
-from resources.lib.store import Store
+from bossanova808.constants import HOME_WINDOW
+import time
+
+from resources.lib.artwork import ART_FIELDS
+from resources.lib.events import ServiceEventQueue
+from resources.lib.reachability import ReachabilityScanner
+from resources.lib.refresh import RefreshScheduler
+from resources.lib.service_state import HEARTBEAT_PROPERTY, HEARTBEAT_INTERVAL, LIBRARY_CHANGED_PROPERTY, beat, library_changed
+from resources.lib.standby import StandbyTarget
+from resources.lib.store import Store, UNREACHABLE_PROPERTY
 from resources.lib.monitor import KodiEventMonitor
 from resources.lib.player import KodiPlayer
 import xbmc
 
 
+# The longest the service takes to stop, in seconds, all told (Kodi won't wait for it forever)
+SHUTDOWN_TIMEOUT = 10
+
+
 # This is 'main'...
 def run():
     Logger.start("(Service)")
+    # Anything may have changed in the library since the service last ran - so with no library change time, the first load checks
+    # every library entry (see library_changed_time)...
+    clear_property(HOME_WINDOW, LIBRARY_CHANGED_PROPERTY)
+    loaded = time.time()
     Store()
+    # ...and their check stamps are saved, along with when they were checked, as when the library last changed - so the plugin's
+    # listings need not check them again, until the library next changes (see Store.check_library)
+    Store.switchback.save_to_file()
+    library_changed(loaded)
+    # If the user wants, watch the service's memory use, for leaks - tracing from as early as possible (see MemoryWatchdog)
+    Store.update_memory_watchdog()
+    # If Kodi crashed (or the power went out) during a playback last session, recover it into the list
+    Store.recover_from_journal()
+    # Make sure the artwork for the Switchback list is in Kodi's texture cache, so the list displays quickly
+    Store.load_artwork_cache()
+    Store.artwork_cache.warm(Store.switchback.fields(*ART_FIELDS))
+    # Have the next Switchback target ready to go, so Switchback requests can be answered directly by the service
+    Store.standby = StandbyTarget()
+    Store.standby.prepare()
+    Store.refresh_scheduler = RefreshScheduler()
+    # Time every Switchback, from the trigger to the playback starting
+    Store.load_latency()
+    # From here on, the Switchback list and the current playback belong to the event worker - Kodi's callbacks (and the loop below)
+    # just post events to it
+    Store.events = ServiceEventQueue()
+    Store.events.start()
     Store.kodi_event_monitor = KodiEventMonitor(xbmc.Monitor)
     Store.kodi_player = KodiPlayer(xbmc.Player)
+    # Check (in the background) that the entries in the list can still be played - and keep checking, as the list changes, and shares come & go
+    Store.reachability = ReachabilityScanner()
+    Store.post_event('reachability scan', Store.scan_reachability)
+    # How often to scan the list, in seconds (only new entries, and those not checked for a while, are actually checked)
+    reachability_interval = 60
+    reachability_scanned = time.monotonic()
+
+    # How often to write the timing stats (if enabled), and the Switchback latency histograms & the artwork urls fetched (if there is anything
+    # new), in seconds
+    timings_interval = 300
+    timings_written = time.monotonic()
+    # How often to check the service's memory use, in seconds (if the watchdog is on - the first check, once started up, is the baseline)
+    memory_interval = 600
+    memory_checked = time.monotonic()
+    memory_watched = None
+    # Let the context menu know the service is here to answer Switchback requests
+    beat()
+    last_beat = time.monotonic()
 
     while not Store.kodi_event_monitor.abortRequested():
         # Abort was requested while waiting. We should exit.
         if Store.kodi_event_monitor.waitForAbort(1):
             break
         # Otherwise, if we're playing something, record where we are up to, for later resumes
-        # (Playback record is created onAVStarted in player.py, so check here that it is available)
-        elif Store.current_playback and Store.current_playback.source != "pvr_live" and Store.kodi_player.isPlaying():
-            Store.current_playback.resumetime = Store.kodi_player.getTime()
+        # (Playback record is created onAVStarted in player.py, so check here that it is available - the event worker checks it is still current)
+        elif Store.current_playback and Store.kodi_player.isPlaying():
+            Store.kodi_player.sample_position()
             xbmc.sleep(500)
 
+        if time.monotonic() - last_beat > HEARTBEAT_INTERVAL:
+            beat()
+            last_beat = time.monotonic()
+
+        if time.monotonic() - reachability_scanned > reachability_interval:
+            Store.post_event('reachability scan', Store.scan_reachability)
+            reachability_scanned = time.monotonic()
+
+        if time.monotonic() - timings_written > timings_interval:
+            Store.write_timings('service')
+            Store.latency.save()
+            Store.artwork_cache.save()
+            timings_written = time.monotonic()
+
+        # The watchdog belongs to the event worker (it is started & stopped there, by settings changes), so its checks are done there too.
+        # (A new watchdog is checked straight away, to take its baseline)
+        if Store.memory_watchdog and (Store.memory_watchdog is not memory_watched or time.monotonic() - memory_checked > memory_interval):
+            memory_watched = Store.memory_watchdog
+            Store.post_event('memory check', Store.check_memory)
+            memory_checked = time.monotonic()
+
+    clear_property(HOME_WINDOW, HEARTBEAT_PROPERTY)
+    clear_property(HOME_WINDOW, UNREACHABLE_PROPERTY)
+    # Every wait below shares the one deadline, so the service stops in time however many of them run long
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+
+    def remaining() -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    # Make sure what is already known is on disk first - the list, and where the current playback is up to - in case the rest runs out of time
+    Store.post_event('flush', Store.flush)
+    # Handle any events still waiting, then finish enriching the playbacks they started (the results are posted as events too),
+    # then stop the worker once it has handled those - the list is all ours again
+    Store.events.wait_idle(remaining())
+    Store.kodi_player.enricher.stop(remaining())
+    Store.events.stop(remaining())
+    Store.standby.stop()
+    Store.artwork_cache.stop()
+    Store.reachability.stop(remaining())
+    Store.refresh_scheduler.stop(remaining())
+    Store.write_timings('service')
+    Store.latency.save()
+    Store.artwork_cache.save()
+    # (The worker has stopped, so the watchdog is ours again too)
+    if Store.memory_watchdog:
+        Store.check_memory()
+        Store.memory_watchdog.stop()
+
     # Tidy up if the user wants us to
     if not Store.save_across_sessions:
         Logger.info('save_across_sessions is False, so deleting switchback.json')
         Store.switchback.delete_file()
+        Store.journal.clear()
 
     # And, we're done...
     Logger.stop("(Service)")